@@ -1,9 +1,15 @@
 import os
 import datetime
+import json
 import re
+import sys
+import threading
+import time
 import tkinter as tk
-from tkinter import messagebox, Toplevel, Listbox, Scrollbar
+from tkinter import messagebox, filedialog, Toplevel, Listbox, Scrollbar
 from PIL import Image, ImageTk 
+
+_PROCESS_START = time.perf_counter() # referência da medição de abertura (--medir-abertura)
 # Importa sys, mas não define _get_resource_path, ele vem do backend
 
 # Importa todas as funções de backend e constantes
@@ -11,11 +17,33 @@ try:
     import customtkinter as ctk
     # Importa o utilitário de caminho e a constante do logo
     from backend_data import (
-        load_clientes, save_clientes, load_estado, save_estado,
+        save_clientes, load_estado, save_estado,
         process_and_save_note, SAIDA_FOLDER, _get_resource_path,
         load_templates, save_templates,
-        load_fornecedores, save_fornecedores, MODELO_FILE # NOVAS FUNÇÕES/CONSTANTES
+        load_fornecedores, save_fornecedores, MODELO_FILE, # NOVAS FUNÇÕES/CONSTANTES
+        CLIENTES_FILE, ESTADO_FILE, TEMPLATES_FILE, FORNECEDORES_FILE,
+        is_externally_modified, _load_json_file,
+        load_uso_clientes, save_uso_clientes,
+        set_output_spool, resolve_output_path
+    )
+    from file_watcher import DataFileWatcher, merge_records, merge_estado
+    from client_registry import load_clientes_registry, refresh_clientes_snapshot
+    from prewarm import Prewarmer
+    from archive_export import export_archive
+    from validation import is_valid_date, parse_brl_value, format_errors
+    from batch import read_batch_csv, validate_batch, start_journal, reopen_journal, execute_journal
+    from checkpoint import list_incomplete_journals, new_journal_path
+    from persistence import PersistenceManager, ESTADO_DURABILITY, configured_estado_durability
+    from note_preview import NotePreviewRenderer
+    from client_usage import ClientUsage, SHORTLIST_SIZE
+    from transfer_queue import TransferQueue
+    from sampling_profiler import toggle_profiling
+    from description_templates import compile_template, template_errors
+    from recurrence import (
+        load_recorrencias, due_periods, is_off_peak, prepare_period, reserved_keys, period_report,
+        format_period, parse_period, acquire_lock, release_lock, RECORRENCIAS_FILE,
     )
+    import bulk_operations
 except ImportError as e:
     print(f"Erro ao importar backend ou customtkinter: {e}")
     print("Verifique se backend_data.py existe e se 'customtkinter' e 'Pillow' estão instalados.")
@@ -40,15 +68,51 @@ CTK_COLOR_BUTTON_GENERATE = "#00A382"           # Verde Secundário para gerar/i
 COLOR_LIST_EVEN = "#F7F8F9"  # Cinza muito sutil
 COLOR_LIST_ODD = "#FFFFFF"   # Branco
 
+# Máximo de clientes exibidos numa busca (os mais relevantes primeiro)
+SEARCH_RESULT_LIMIT = 500
+
+APP_TITLE = "Sistema de Gestão de Notas de Crédito"
+PROFILER_SHORTCUT = "<Control-Shift-F12>" # liga/desliga o profiler (ver sampling_profiler.py)
+
+# Transferência das notas do spool local para a pasta de saída
+TRANSFER_STATUS_INTERVAL_MS = 1000
+TRANSFER_STOP_TIMEOUT = 5 # segundos
+
+# Operações em massa: itens exibidos na prévia e arquivo de cada conjunto de dados
+BULK_PREVIEW_LIMIT = 200
+BULK_DATASET_FILES = {
+    "clientes": CLIENTES_FILE,
+    "fornecedores": FORNECEDORES_FILE,
+    "templates": TEMPLATES_FILE,
+}
+
+# Abertura: painéis de gestão (templates e fornecedores) montados depois da primeira
+# pintura, um por ciclo do loop de eventos, e a lista de clientes preenchida em blocos
+LAZY_PANEL_DELAY_MS = 30
+CLIENT_LIST_CHUNK = 500
+
+# Pré-geração das notas recorrentes (ver recurrence.py): fora do horário de pico ou com o aplicativo ocioso
+RECURRENCE_CHECK_MS = 5 * 60 * 1000
+RECURRENCE_IDLE_SECONDS = 10 * 60
+
+# Espera máxima pelo pré-aquecimento antes de gerar (ex.: modelo numa rede lenta);
+# passado o prazo, a geração carrega o modelo por conta própria
+PREWARM_WAIT_SECONDS = 3.0
+
 
 # --- Classe Principal da Aplicação GUI ---
 
 class CreditNoteApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, lazy_panels=True, estado_durability=ESTADO_DURABILITY):
+        """
+        lazy_panels=False monta tudo antes do primeiro desenho da janela (como era
+        antes); serve de referência para a medição de abertura.
+        estado_durability: gravação do número da fatura (ver persistence.py).
+        """
         super().__init__()
 
         # --- Setup da Janela Principal ---
-        self.title("Sistema de Gestão de Notas de Crédito")
+        self.title(APP_TITLE)
         
         # APLICANDO TELA CHEIA (ZOOMED)
         try:
@@ -63,14 +127,44 @@ class CreditNoteApp(ctk.CTk):
         self.configure(fg_color=CTK_COLOR_BACKGROUND) # Aplica o fundo geral
         
         # --- Dados do Backend ---
-        self.clientes = load_clientes()
+        self.clientes = load_clientes_registry()
         self.estado = load_estado()
         self.templates = load_templates() 
         self.fornecedores = load_fornecedores() 
+        self.client_usage = ClientUsage(load_uso_clientes())
         self.selected_client = None
         self.last_saved_file = None 
         self.logo_image = None
         self.selected_template = None 
+        self.note_preview = NotePreviewRenderer()
+        self.preview_image = None
+        self._preview_pending = False
+        self._bulk_undo = None # (plano, desfazer) da última operação em massa
+        self._management_frame = None # gestão de templates e fornecedores (montada depois da primeira pintura)
+        self._modals = {} # modais de cadastro: montados na primeira abertura e reutilizados
+        self._client_list_generation = 0 # preenchimento em blocos: blocos de uma lista antiga são descartados
+        self._client_list_chunk = CLIENT_LIST_CHUNK if lazy_panels else None
+        self.startup_times = {} # medição de abertura (ms desde o início do processo)
+        self.exit_after_startup = False
+
+        # Gravação agrupada dos dados (edições em sequência viram uma só escrita)
+        self.persistence = PersistenceManager({
+            'clientes': save_clientes,
+            'estado': save_estado,
+            'templates': save_templates,
+            'fornecedores': save_fornecedores,
+            'uso_clientes': save_uso_clientes,
+        }, estado_durability=estado_durability, filenames={
+            'clientes': CLIENTES_FILE,
+            'estado': ESTADO_FILE,
+            'templates': TEMPLATES_FILE,
+            'fornecedores': FORNECEDORES_FILE,
+        })
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
+        # Notas salvas no spool local e copiadas para a pasta de saída em segundo plano
+        self.transfer_queue = TransferQueue()
+        set_output_spool(self.transfer_queue)
 
         # --- Configuração de Layout (Grid) ---
         self.grid_columnconfigure((0, 1), weight=1)
@@ -105,32 +199,486 @@ class CreditNoteApp(ctk.CTk):
                                        border_width=1,
                                        border_color=("#E5E7E9", "#34495E"))
         self.note_frame.grid(row=0, column=1, padx=15, pady=0, sticky="nsew")
+
+        # Configurações internas dos frames: geração de nota e clientes primeiro (o que
+        # se usa logo ao abrir); a gestão de templates e fornecedores vem depois
+        self._setup_client_management(self.client_frame)
+        self._setup_note_generation(self.note_frame)
+        self._deferred_setup = [
+            self._build_template_panel,
+            self._build_supplier_panel,
+            # Índice de busca de clientes montado antes da primeira digitação
+            self.clientes.prepare_search,
+            # Snapshot de clientes.json regravado em segundo plano se o arquivo mudou
+            # (a próxima abertura carrega registro e índice prontos, ver snapshot_cache.py)
+            lambda: self._run_in_background(refresh_clientes_snapshot, lambda saved: None),
+        ]
+        if not lazy_panels:
+            while self._deferred_setup:
+                self._deferred_setup.pop(0)()
+
+        # --- Recarregamento automático dos arquivos de dados ---
+        self.file_watcher = DataFileWatcher(self)
+        self._reload_handlers = {
+            CLIENTES_FILE: self._reload_clientes,
+            ESTADO_FILE: self._reload_estado,
+            TEMPLATES_FILE: self._reload_templates,
+            FORNECEDORES_FILE: self._reload_fornecedores,
+        }
+        for filename, handler in self._reload_handlers.items():
+            self.file_watcher.watch(filename, handler)
+        self.file_watcher.start()
+
+        # --- Pré-aquecimento após a primeira pintura da janela ---
+        self.prewarmer = Prewarmer(self.fornecedores)
+        self.after_idle(self.prewarmer.start)
+        # Transferências pendentes da sessão anterior e status no cabeçalho
+        self.after_idle(self.transfer_queue.start)
+        self.after(TRANSFER_STATUS_INTERVAL_MS, self._update_transfer_status)
+
+        # --- Lotes interrompidos (queda de energia, disco cheio...) ---
+        self.after(1000, self._offer_batch_resume)
+
+        # --- Profiler de diagnóstico (atalho oculto, para "está lento hoje") ---
+        self.bind_all(PROFILER_SHORTCUT, self._toggle_profiler)
+
+        # --- Notas recorrentes pré-geradas quando o aplicativo está ocioso ---
+        self._last_input = time.monotonic()
+        self._batch_running = False # lote, retomada ou recorrentes em segundo plano
+        self._recurrence_problems = [] # da última pré-geração (sem diálogos quando automática)
+        self.bind_all("<Key>", self._note_user_input, add="+")
+        self.bind_all("<Button>", self._note_user_input, add="+")
+        self.after(RECURRENCE_CHECK_MS, self._check_recurrences)
+
+        # --- Painéis de gestão montados depois da primeira pintura ---
+        self.after_idle(self._on_first_idle)
         
-        # Frame extra para Gerenciamento de Templates na coluna Esquerda (dividido em duas linhas)
-        management_container = ctk.CTkFrame(self.client_frame, fg_color="transparent")
-        management_container.grid(row=5, column=0, padx=30, pady=(5, 30), sticky="ew") # Maior padding
-        management_container.grid_columnconfigure(0, weight=1)
-        
+    # --- Abertura em etapas ---
+
+    def _on_first_idle(self):
+        """Janela desenhada e loop de eventos respondendo: o restante da montagem segue aos poucos."""
+        self.update_idletasks()
+        self.startup_times['interativa_ms'] = round((time.perf_counter() - _PROCESS_START) * 1000, 1)
+        self.after(LAZY_PANEL_DELAY_MS, self._run_deferred_setup)
+
+    def _run_deferred_setup(self):
+        """
+        Uma etapa da montagem adiada por vez (com um intervalo entre elas), para que
+        cliques e digitação do usuário não esperem a montagem inteira.
+        """
+        if self._deferred_setup:
+            self._deferred_setup.pop(0)()
+        if self._deferred_setup or self._client_list_filling():
+            self.after(LAZY_PANEL_DELAY_MS, self._run_deferred_setup)
+            return
+        self.update_idletasks()
+        self.startup_times['completa_ms'] = round((time.perf_counter() - _PROCESS_START) * 1000, 1)
+        if self.exit_after_startup:
+            # Modo de medição (benchmarks.py abertura): resultado no stdout e encerra
+            print(json.dumps(self.startup_times), flush=True)
+            self._on_close()
+
+    def _management_container(self):
+        """Área de gestão (templates e fornecedores) abaixo da lista de clientes."""
+        if self._management_frame is None:
+            self._management_frame = ctk.CTkFrame(self.client_frame, fg_color="transparent")
+            self._management_frame.grid(row=5, column=0, padx=30, pady=(5, 30), sticky="ew") # Maior padding
+            self._management_frame.grid_columnconfigure(0, weight=1)
+        return self._management_frame
+
+    def _build_template_panel(self):
         # TÍTULOS de Gestão de Templates/Fornecedores (Mais destaque)
-        self.template_management_frame = ctk.CTkFrame(management_container, 
+        self.template_management_frame = ctk.CTkFrame(self._management_container(), 
                                             fg_color=("#ECF0F1", "gray25"),
                                             corner_radius=10, 
                                             border_width=0) # Removendo borda interna para visual mais limpo
         self.template_management_frame.grid(row=0, column=0, pady=(0, 15), sticky="ew")
+        self._setup_template_management(self.template_management_frame)
 
-        self.supplier_management_frame = ctk.CTkFrame(management_container, # NOVO FRAME
+    def _build_supplier_panel(self):
+        self.supplier_management_frame = ctk.CTkFrame(self._management_container(),
                                             fg_color=("#ECF0F1", "gray25"),
                                             corner_radius=10, 
                                             border_width=0)
         self.supplier_management_frame.grid(row=1, column=0, sticky="ew")
+        self._setup_supplier_management(self.supplier_management_frame)
 
+    # --- Modais reutilizados ---
+
+    def _get_modal(self, key, geometry, build):
+        """
+        Modal montado na primeira abertura e reutilizado nas seguintes: ao fechar, a
+        janela é escondida, não destruída. build(modal, form) cria os campos e guarda
+        em form o que a abertura seguinte precisa preencher.
+        Retorna (modal, form).
+        """
+        modal, form = self._modals.get(key, (None, None))
+        if modal is not None and modal.winfo_exists():
+            return modal, form
+        modal = Toplevel(self)
+        modal.withdraw()
+        modal.transient(self)
+        modal.resizable(False, False)
+        modal.geometry(geometry)
+        modal.protocol("WM_DELETE_WINDOW", lambda: self._hide_modal(modal))
+        form = {}
+        build(modal, form)
+        self._modals[key] = (modal, form)
+        return modal, form
+
+    def _present_modal(self, modal, title):
+        """Mostra o modal centralizado sobre a janela principal."""
+        modal.title(title)
+        self.update_idletasks()
+        x = self.winfo_x() + self.winfo_width() // 2 - modal.winfo_width() // 2
+        y = self.winfo_y() + self.winfo_height() // 2 - modal.winfo_height() // 2
+        modal.geometry(f'+{x}+{y}')
+        modal.deiconify()
+        modal.grab_set()
+        modal.focus_set()
+
+    def _hide_modal(self, modal):
+        modal.grab_release()
+        modal.withdraw()
+
+    # --- Persistência e Encerramento ---
+
+    def _mark_dirty(self, name):
+        """Agenda a gravação do conjunto de dados (cópia feita aqui, na thread do Tk)."""
+        if name == 'clientes':
+            snapshot = self.clientes.to_records()
+        elif name == 'estado':
+            snapshot = dict(self.estado)
+        elif name == 'uso_clientes':
+            snapshot = self.client_usage.to_records()
+        else:
+            snapshot = [dict(item) for item in getattr(self, name)]
+        self.persistence.mark_dirty(name, snapshot)
+
+    def _remark_if_dirty(self, name):
+        """
+        Depois de mesclar dados recarregados: se havia gravação pendente, refaz o
+        snapshot a partir dos dados mesclados (o anterior sobrescreveria a alteração externa).
+        """
+        if self.persistence.is_dirty(name):
+            self._mark_dirty(name)
+
+    def _on_close(self):
+        """Grava tudo que estiver pendente antes de fechar a janela."""
+        self.file_watcher.stop()
+        # Pendências em arquivos alterados por fora: mescla antes de gravar
+        for filename in self.persistence.conflicts():
+            self._reload_handlers[filename]()
+        self.persistence.shutdown()
+        # Cópias em andamento terminam; o restante fica no spool para a próxima abertura
+        self.transfer_queue.stop(timeout=TRANSFER_STOP_TIMEOUT)
+        self.destroy()
+
+    def _update_transfer_status(self):
+        """Mostra no cabeçalho as notas aguardando cópia para a pasta de saída (vazio se nada pendente)."""
+        st = self.transfer_queue.status()
+        waiting = st['pendentes'] + st['em_andamento']
+        if st['falhas']:
+            text, color = f"Falha ao copiar {st['falhas']} nota(s) para a pasta de saída: {st['ultimo_erro']}", CTK_COLOR_DANGER
+        elif waiting:
+            text, color = f"Copiando {waiting} nota(s) para a pasta de saída...", CTK_COLOR_ACCENT
+        else:
+            text, color = "", CTK_COLOR_ACCENT
+        self.transfer_status_label.configure(text=text, text_color=color)
+        self.after(TRANSFER_STATUS_INTERVAL_MS, self._update_transfer_status)
+
+    # --- Recarregamento de Dados Alterados Externamente ---
+
+    def _reload_clientes(self):
+        incoming = _load_json_file(CLIENTES_FILE, strict=True)
+        if incoming is None:
+            return
+        self.clientes.merge(incoming)
+        self._remark_if_dirty('clientes')
+        if self.selected_client and self.clientes.get(self.selected_client['codigo']) is not self.selected_client:
+            # O cliente selecionado foi removido por fora
+            self.selected_client = None
+            self.client_code_var.set("")
+            self.client_name_label.configure(text="Nenhum cliente selecionado", text_color=("#2C3E50", "white"))
+        elif self.selected_client:
+            self.client_code_var.set(self.selected_client['codigo'])
+            self.client_name_label.configure(text=self.selected_client['nome'], text_color=CTK_COLOR_PRIMARY)
+        self._update_client_list(self.client_search_entry.get())
+        self._update_shortlist()
+
+    def _reload_estado(self):
+        incoming = _load_json_file(ESTADO_FILE, strict=True)
+        if not incoming:
+            return
+        merge_estado(self.estado, incoming)
+        self._remark_if_dirty('estado')
+        self.invoice_label.configure(text="Número da Fatura (Próx. Sugerido: {}):".format(self.estado['ultima_fatura']))
+        current = self.invoice_number_var.get()
+        if not current.isdigit() or int(current) < int(self.estado['ultima_fatura']):
+            self.invoice_number_var.set(str(self.estado['ultima_fatura']))
+
+    def _reload_templates(self):
+        incoming = _load_json_file(TEMPLATES_FILE, strict=True)
+        if incoming is None:
+            return
+        self.templates = merge_records(self.templates, incoming, 'nome')
+        self._remark_if_dirty('templates')
+        self._update_template_dropdown(self.template_var.get())
+
+    def _reload_fornecedores(self):
+        incoming = _load_json_file(FORNECEDORES_FILE, strict=True)
+        if not incoming:
+            return
+        self.fornecedores = merge_records(self.fornecedores, incoming, 'nome')
+        self._remark_if_dirty('fornecedores')
+        self._update_supplier_dropdown(self.supplier_var.get())
+
+    def _toggle_profiler(self, event=None):
+        """Liga/desliga o profiler por amostragem; ao desligar, informa onde o perfil foi gravado."""
+        try:
+            result = toggle_profiling()
+        except Exception as e:
+            messagebox.showerror("Profiler", f"Não foi possível gravar o perfil: {e}")
+            return
+        if result is None:
+            self.title(f"{APP_TITLE} [perfilando]")
+            return
+        self.title(APP_TITLE)
+        folded, speedscope, samples, seconds = result
+        messagebox.showinfo(
+            "Perfil Gravado",
+            f"{samples} amostras em {seconds:.1f} s.\n\n{speedscope}\n(abra em https://www.speedscope.app)\n\n{folded}"
+        )
+
+    def _note_user_input(self, event=None):
+        self._last_input = time.monotonic()
+
+    def _check_recurrences(self):
+        """Periodicamente: pré-gera as notas recorrentes se for fora do pico ou se o usuário estiver ausente."""
+        self.after(RECURRENCE_CHECK_MS, self._check_recurrences)
+        idle = time.monotonic() - self._last_input >= RECURRENCE_IDLE_SECONDS
+        if idle or is_off_peak():
+            self._pregenerate_recurrences(interactive=False)
+
+    def _pregenerate_recurrences(self, periods=None, interactive=True):
+        """
+        Reserva as faturas das notas recorrentes pendentes aqui, na thread do Tk (rápido,
+        sem abrir planilhas, e sem disputar a numeração com a nota em edição), e gera
+        as notas em segundo plano.
+        """
+        if self._batch_running:
+            if interactive:
+                messagebox.showinfo("Notas Recorrentes", "Já há um lote de notas em andamento.")
+            return
+        definitions = load_recorrencias()
+        periods = periods or due_periods(definitions)
+        if not definitions or not periods:
+            if interactive:
+                messagebox.showinfo("Notas Recorrentes", "Nenhuma nota recorrente a gerar.")
+            return
+        if interactive:
+            if self._has_edit_conflict(ESTADO_FILE):
+                return
+        elif is_externally_modified(ESTADO_FILE):
+            # Automática: sem diálogo; recarrega o estado e segue com a numeração atual
+            print(f"Pré-geração das recorrentes: {ESTADO_FILE} alterado por fora; recarregado.")
+            self._reload_handlers[ESTADO_FILE]()
+        if not acquire_lock():
+            return
+
+        # Fronteira de lote: grava as edições pendentes antes de reservar faturas
+        self.persistence.flush()
+        journals, errors = [], []
+        try:
+            journals = [reopen_journal(path, self.estado)
+                        for path in sorted({path for path, _ in reserved_keys().values()})]
+            for period in periods:
+                # Notas recusadas só são repetidas (com nova fatura) quando o usuário pede (geração interativa)
+                journal, period_errors = prepare_period(period, definitions, self.estado, self.clientes,
+                                                        self.fornecedores, self.templates, retry_failed=interactive)
+                errors.extend(period_errors)
+                if journal is not None:
+                    journals.append(journal)
+        except Exception as e:
+            release_lock()
+            print(f"Erro ao preparar as notas recorrentes: {e}")
+            self._set_recurrence_problems([f"Erro ao preparar as notas recorrentes: {e}"])
+            if interactive:
+                messagebox.showerror("Notas Recorrentes", str(e))
+            return
+
+        definition_problems = [f"{name}: {msg}" for name, msg in errors]
+        if not journals:
+            release_lock()
+            for problem in definition_problems:
+                print(f"Notas recorrentes: {problem}")
+            self._set_recurrence_problems(definition_problems)
+            if not interactive:
+                return
+            if errors:
+                messagebox.showerror("Notas Recorrentes com Erro", "\n".join(definition_problems[:25]))
+            else:
+                messagebox.showinfo("Notas Recorrentes", "Todas as notas recorrentes do período já foram geradas.")
+            return
+
+        self._update_invoice_suggestion()
+        self._set_batch_running(True)
+
+        def work():
+            try:
+                return [r for journal in journals for r in execute_journal(journal)]
+            finally:
+                release_lock()
+
+        def on_done(results):
+            self._set_batch_running(False)
+            failures = [r for r in results if not r[1]]
+            generated = len(results) - len(failures)
+            print(f"Notas recorrentes: {generated} gerada(s), {len(failures)} falha(s), {len(errors)} definição(ões) com erro.")
+            problems = definition_problems + [f"Fatura {invoice}: {msg}" for _, _, invoice, msg in failures]
+            for problem in problems:
+                print(f"Notas recorrentes: {problem}")
+            self._set_recurrence_problems(problems)
+            if not interactive:
+                return
+            if problems:
+                details = "\n".join(problems[:25])
+                messagebox.showerror("Notas Recorrentes com Falhas",
+                                     f"{generated} nota(s) gerada(s), {len(problems)} problema(s):\n\n{details}")
+            else:
+                messagebox.showinfo("Notas Recorrentes", f"{generated} nota(s) recorrente(s) gerada(s).")
+
+        def on_error(error):
+            self._set_batch_running(False)
+            print(f"Erro na pré-geração das notas recorrentes: {error}")
+            self._set_recurrence_problems([f"Erro na pré-geração: {error}"])
+            if interactive:
+                messagebox.showerror("Notas Recorrentes", str(error))
+
+        self._run_in_background(work, on_done, on_error)
+
+    def _set_recurrence_problems(self, problems):
+        """Guarda os problemas da última pré-geração (listados no modal) e sinaliza no botão das recorrentes."""
+        self._recurrence_problems = problems
+        if problems:
+            self.recurrence_button.configure(text=f"🔁 Notas Recorrentes do Mês ({len(problems)} problema(s))",
+                                             fg_color=CTK_COLOR_DANGER)
+        else:
+            self.recurrence_button.configure(text="🔁 Notas Recorrentes do Mês", fg_color=CTK_COLOR_ACCENT)
+
+    def _show_recurrence_modal(self):
+        """Conferência do mês: situação de cada nota recorrente, geração imediata e impressão das geradas."""
+        modal = Toplevel(self)
+        modal.title("Notas Recorrentes")
+        modal.transient(self)
+        modal.grab_set()
+        modal.geometry("720x480")
+
+        today = datetime.date.today()
+        top = ctk.CTkFrame(modal, fg_color="transparent")
+        top.pack(fill="x", padx=10, pady=(10, 0))
+        ctk.CTkLabel(top, text="Período (MM/AAAA):").pack(side="left")
+        period_entry = ctk.CTkEntry(top, width=100, corner_radius=10)
+        period_entry.insert(0, format_period(today.year, today.month))
+        period_entry.pack(side="left", padx=10)
+
+        listing = ctk.CTkTextbox(modal, corner_radius=10, font=ctk.CTkFont(family="Courier", size=12))
+        listing.pack(fill="both", expand=True, padx=10, pady=10)
+        report = []
+
+        def refresh():
+            try:
+                period = format_period(*parse_period(period_entry.get()))
+            except ValueError:
+                messagebox.showerror("Erro", "Período inválido. Use MM/AAAA.", parent=modal)
+                return None
+            report[:] = period_report(period)
+            listing.configure(state="normal")
+            listing.delete("1.0", tk.END)
+            for item in report:
+                listing.insert(tk.END, f"{item['situacao'].upper():<10} {item['fatura']:>8}  {item['nome']}  "
+                                       f"({item['codigo_cliente']} / {item['fornecedor']})\n")
+            if not report:
+                listing.insert(tk.END, f"Nenhuma nota recorrente cadastrada em {RECORRENCIAS_FILE}.\n")
+            if self._recurrence_problems:
+                listing.insert(tk.END, "\nProblemas na última pré-geração:\n")
+                for problem in self._recurrence_problems:
+                    listing.insert(tk.END, f"  {problem}\n")
+            listing.configure(state="disabled")
+            return period
+
+        def generate_now():
+            period = refresh()
+            if period:
+                modal.destroy()
+                self._pregenerate_recurrences([period])
+
+        def print_generated():
+            files = [resolve_output_path(item['arquivo']) for item in report if item['situacao'] == 'gerada']
+            files = [path for path in files if os.path.exists(path)]
+            if not files:
+                messagebox.showwarning("Atenção", "Nenhuma nota gerada encontrada para o período.", parent=modal)
+                return
+            if messagebox.askyesno("Confirmar Impressão", f"Enviar {len(files)} nota(s) para impressão?", parent=modal):
+                for path in files:
+                    self._print_file(path, notify=False)
+                messagebox.showinfo("Comando de Impressão Enviado", f"{len(files)} nota(s) enviada(s).", parent=modal)
+
+        ctk.CTkButton(top, text="Atualizar", command=refresh, width=90, corner_radius=8).pack(side="left")
+        bottom = ctk.CTkFrame(modal, fg_color="transparent")
+        bottom.pack(fill="x", padx=10, pady=(0, 10))
+        bottom.grid_columnconfigure((0, 1), weight=1)
+        ctk.CTkButton(bottom, text="Gerar Pendentes Agora", command=generate_now, fg_color=CTK_COLOR_SUCCESS,
+                      hover_color="#27AE60", corner_radius=10).grid(row=0, column=0, padx=5, sticky="ew")
+        ctk.CTkButton(bottom, text="🖨️ Imprimir Geradas", command=print_generated, fg_color=CTK_COLOR_ACCENT,
+                      hover_color="#7F8C8D", corner_radius=10).grid(row=0, column=1, padx=5, sticky="ew")
+        refresh()
+
+    def _has_edit_conflict(self, filename):
+        """
+        Verifica o carimbo de versão antes de uma alteração local. Se o arquivo
+        mudou por fora, recarrega os dados e avisa o usuário em vez de sobrescrever.
+        """
+        if not is_externally_modified(filename):
+            return False
+        self._reload_handlers[filename]()
+        messagebox.showwarning(
+            "Dados Alterados Externamente",
+            f"O arquivo '{filename}' foi alterado fora do aplicativo e foi recarregado.\n"
+            "Revise os dados e repita a operação."
+        )
+        return True
+
+    def _run_in_background(self, func, on_done, on_error=None):
+        """
+        Executa func() numa thread e entrega o resultado a on_done(resultado) na
+        thread do Tk (o Tk não pode ser chamado de outras threads).
+        Exceções não tratadas vão para on_error(exceção), se houver; senão são exibidas ao usuário.
+        """
+        result = {}
+
+        def worker():
+            try:
+                result['value'] = func()
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+
+        def check():
+            if thread.is_alive():
+                self.after(100, check)
+            elif 'error' in result:
+                if on_error is not None:
+                    on_error(result['error'])
+                else:
+                    messagebox.showerror("Erro Inesperado", str(result['error']))
+            else:
+                on_done(result['value'])
+
+        self.after(100, check)
 
-        # Configurações internas dos frames
-        self._setup_client_management(self.client_frame)
-        self._setup_template_management(self.template_management_frame) 
-        self._setup_supplier_management(self.supplier_management_frame) 
-        self._setup_note_generation(self.note_frame)
-        
     # --- Setup de Headers e UI Geral ---
     def _setup_header(self):
         """Cria o cabeçalho superior para logo e título principal, centralizando o título."""
@@ -185,6 +733,10 @@ class CreditNoteApp(ctk.CTk):
         
         title_label.grid(row=0, column=2, padx=(15, 0), pady=12, sticky="w") 
 
+        # Status das transferências para a pasta de saída (Coluna 3, à direita)
+        self.transfer_status_label = ctk.CTkLabel(center_frame, text="", font=ctk.CTkFont(size=11), anchor="e")
+        self.transfer_status_label.grid(row=0, column=3, padx=(15, 0), pady=12, sticky="e")
+
 
     # --- Setup: Gerenciamento de Clientes ---
 
@@ -207,13 +759,22 @@ class CreditNoteApp(ctk.CTk):
         # Botões de Ação
         button_frame = ctk.CTkFrame(master, fg_color="transparent")
         button_frame.grid(row=2, column=0, padx=30, pady=5, sticky="ew")
-        button_frame.grid_columnconfigure((0, 1, 2), weight=1)
+        button_frame.grid_columnconfigure((0, 1, 2, 3), weight=1)
 
         ctk.CTkButton(button_frame, text="Novo", command=self._add_client_dialog, fg_color=CTK_COLOR_PRIMARY, hover_color=CTK_COLOR_SECONDARY, corner_radius=8).grid(row=0, column=0, padx=5, pady=5, sticky="ew")
         ctk.CTkButton(button_frame, text="Editar", command=self._edit_client_dialog, fg_color=CTK_COLOR_PRIMARY, hover_color=CTK_COLOR_SECONDARY, corner_radius=8).grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         ctk.CTkButton(button_frame, text="Excluir", command=self._delete_client, fg_color=CTK_COLOR_DANGER, hover_color="#C0392B", corner_radius=8).grid(row=0, column=2, padx=5, pady=5, sticky="ew")
-
-        ctk.CTkLabel(master, text="Clientes Cadastrados:", anchor="w", font=ctk.CTkFont(weight="bold")).grid(row=3, column=0, padx=30, pady=(15, 5), sticky="ew")
+        ctk.CTkButton(button_frame, text="Em Massa", command=self._show_bulk_modal, fg_color=CTK_COLOR_ACCENT, hover_color="#7F8C8D", corner_radius=8).grid(row=0, column=3, padx=5, pady=5, sticky="ew")
+
+        # Atalho de clientes frequentes (uso recente/frequente, sem precisar buscar)
+        list_header = ctk.CTkFrame(master, fg_color="transparent")
+        list_header.grid(row=3, column=0, padx=30, pady=(15, 5), sticky="ew")
+        list_header.grid_columnconfigure(0, weight=1)
+        self.shortlist_frame = ctk.CTkFrame(list_header, fg_color="transparent")
+        self.shortlist_frame.grid(row=0, column=0, sticky="ew")
+        self.shortlist_frame.grid_columnconfigure((0, 1, 2), weight=1)
+        ctk.CTkLabel(list_header, text="Clientes Cadastrados:", anchor="w", font=ctk.CTkFont(weight="bold")).grid(row=1, column=0, pady=(10, 0), sticky="ew")
+        self._update_shortlist()
 
         # Listbox para clientes (Listbox nativa para zebrado)
         list_frame = ctk.CTkFrame(master, corner_radius=10, fg_color=COLOR_LIST_ODD) 
@@ -244,40 +805,79 @@ class CreditNoteApp(ctk.CTk):
     # Lógica de clientes (inalterada)
     def _update_client_list(self, filter_text=""):
         """
-        Atualiza a Listbox de clientes, ordenando por código e aplicando cor zebrada.
+        Atualiza a Listbox de clientes, aplicando cor zebrada. Sem filtro, lista
+        todos por código; com filtro, usa a busca ranqueada (sem acentos e tolerante
+        a erros de digitação): código exato, prefixo e depois relevância.
         """
         self.client_listbox.delete(0, tk.END)
-        self.filtered_clients = []
-        filter_text = filter_text.lower()
-        
-        # 1. Ordena a lista de clientes por 'codigo' antes de filtrar
-        sorted_clients = sorted(self.clientes, key=lambda c: c['codigo'].lower())
         
-        listbox_index = 0
-
-        for client in sorted_clients:
-            if filter_text in client['codigo'].lower() or filter_text in client['nome'].lower():
-                display_text = f"[{client['codigo']}] - {client['nome']}"
-                
-                # 2. Insere o item e aplica a cor zebrada
-                self.client_listbox.insert(tk.END, display_text)
-                
-                if listbox_index % 2 == 0:
-                    # Linha par (index 0, 2, 4...)
-                    bg_color = COLOR_LIST_ODD 
-                else:
-                    # Linha ímpar (index 1, 3, 5...)
-                    bg_color = COLOR_LIST_EVEN
-                
-                # Aplica a cor de fundo
-                self.client_listbox.itemconfig(tk.END, {'bg': bg_color})
-                
-                self.filtered_clients.append(client)
-                listbox_index += 1
+        # 1. Sem filtro: ordem por 'codigo' (em cache no registro); com filtro: ranking da busca
+        if filter_text.strip():
+            # Empates na busca: clientes usados recentemente/frequentemente primeiro
+            matching_clients = self.clientes.search(filter_text, limit=SEARCH_RESULT_LIMIT,
+                                                    tie_break=self.client_usage.ranking_keys())
+        else:
+            matching_clients = self.clientes.sorted_by_code()
+
+        # 2. A seleção usa filtered_clients, completa desde já; a Listbox é preenchida
+        # em blocos, o primeiro agora (a parte visível) e o resto nos ciclos seguintes
+        self.filtered_clients = list(matching_clients)
+        self._client_list_generation += 1
+        self._client_list_filled = 0
+        self._fill_client_list(self._client_list_generation)
+
+    def _fill_client_list(self, generation):
+        """Insere o próximo bloco de clientes na Listbox, com a cor zebrada."""
+        if generation != self._client_list_generation:
+            return # a lista foi refeita (nova busca) antes de terminar
+        start = self._client_list_filled
+        end = len(self.filtered_clients) if self._client_list_chunk is None else min(start + self._client_list_chunk, len(self.filtered_clients))
+        for index in range(start, end):
+            client = self.filtered_clients[index]
+            self.client_listbox.insert(tk.END, f"[{client['codigo']}] - {client['nome']}")
+            # Linha par (index 0, 2, 4...) branca; ímpar cinza sutil
+            self.client_listbox.itemconfig(index, {'bg': COLOR_LIST_ODD if index % 2 == 0 else COLOR_LIST_EVEN})
+        self._client_list_filled = end
+        if end < len(self.filtered_clients):
+            self.after(1, self._fill_client_list, generation)
+
+    def _client_list_filling(self):
+        return self._client_list_filled < len(self.filtered_clients)
 
     def _filter_client_list(self, event):
         self._update_client_list(self.client_search_entry.get())
 
+    def _update_shortlist(self):
+        """Recria os botões do atalho com os clientes mais usados recentemente."""
+        for widget in self.shortlist_frame.winfo_children():
+            widget.destroy()
+        codes = self.client_usage.shortlist(SHORTLIST_SIZE, exists=self.clientes.__contains__)
+        if not codes:
+            return
+        ctk.CTkLabel(self.shortlist_frame, text="⭐ Frequentes:", anchor="w", font=ctk.CTkFont(weight="bold")).grid(row=0, column=0, columnspan=3, sticky="w")
+        for i, codigo in enumerate(codes):
+            client = self.clientes.get(codigo)
+            ctk.CTkButton(self.shortlist_frame,
+                          text=f"[{client['codigo']}] {client['nome'][:18]}",
+                          command=lambda c=client: self._select_client(c),
+                          fg_color=("#ECF0F1", "gray25"),
+                          text_color=("#2C3E50", "white"),
+                          hover_color=("#D5DBDB", "gray30"),
+                          corner_radius=8,
+                          height=28
+                          ).grid(row=1 + i // 3, column=i % 3, padx=3, pady=3, sticky="ew")
+
+    def _select_client(self, client):
+        """Seleciona o cliente para a nota (lista ou atalho de frequentes)."""
+        self.selected_client = client
+        self.client_code_var.set(client['codigo'])
+        
+        # DESTAQUE APLICADO AQUI: Cor primária no nome do cliente selecionado
+        self.client_name_label.configure(
+            text=client['nome'], 
+            text_color=CTK_COLOR_PRIMARY
+        )
+
     def _select_client_from_list(self, event):
         try:
             selection = self.client_listbox.curselection()
@@ -285,14 +885,7 @@ class CreditNoteApp(ctk.CTk):
                 return
 
             index = selection[0]
-            self.selected_client = self.filtered_clients[index]
-            self.client_code_var.set(self.selected_client['codigo'])
-            
-            # DESTAQUE APLICADO AQUI: Cor primária no nome do cliente selecionado
-            self.client_name_label.configure(
-                text=self.selected_client['nome'], 
-                text_color=CTK_COLOR_PRIMARY
-            )
+            self._select_client(self.filtered_clients[index])
             
         except Exception as e:
             print(f"Erro ao selecionar cliente: {e}")
@@ -313,18 +906,17 @@ class CreditNoteApp(ctk.CTk):
 
     def _show_client_modal(self, title, client_data):
         """Lógica comum do modal de Cadastro/Edição de Cliente."""
-        modal = Toplevel(self)
-        modal.title(title)
-        modal.transient(self)
-        modal.grab_set()
-        modal.resizable(False, False)
-        modal.geometry("350x250")
-
-        self.update_idletasks()
-        x = self.winfo_x() + self.winfo_width() // 2 - modal.winfo_width() // 2
-        y = self.winfo_y() + self.winfo_height() // 2 - modal.winfo_height() // 2
-        modal.geometry(f'+{x}+{y}')
+        modal, form = self._get_modal('cliente', "350x250", self._build_client_modal)
+        form['client_data'] = client_data
+        form['original_code'] = client_data['codigo'] if client_data else None
+        form['code_entry'].delete(0, tk.END)
+        form['name_entry'].delete(0, tk.END)
+        if client_data:
+            form['code_entry'].insert(0, client_data['codigo'])
+            form['name_entry'].insert(0, client_data['nome'])
+        self._present_modal(modal, title)
 
+    def _build_client_modal(self, modal, form):
         ctk.CTkLabel(modal, text="Código Único:").pack(pady=(10, 0), padx=10)
         code_entry = ctk.CTkEntry(modal, width=300, corner_radius=10)
         code_entry.pack(padx=10)
@@ -332,14 +924,11 @@ class CreditNoteApp(ctk.CTk):
         ctk.CTkLabel(modal, text="Nome (Razão Social):").pack(pady=(10, 0), padx=10)
         name_entry = ctk.CTkEntry(modal, width=300, corner_radius=10)
         name_entry.pack(padx=10)
-
-        original_code = None
-        if client_data:
-            original_code = client_data['codigo']
-            code_entry.insert(0, original_code)
-            name_entry.insert(0, client_data['nome'])
+        form.update(code_entry=code_entry, name_entry=name_entry)
 
         def save_client():
+            client_data = form['client_data']
+            original_code = form['original_code']
             new_code = code_entry.get().strip()
             name = name_entry.get().strip()
 
@@ -347,33 +936,35 @@ class CreditNoteApp(ctk.CTk):
                 messagebox.showerror("Erro", "Código e Nome são obrigatórios.")
                 return
 
+            if self._has_edit_conflict(CLIENTES_FILE):
+                self._hide_modal(modal)
+                return
+
             if client_data:
                 # Lógica de Edição
-                is_duplicate = any(c['codigo'] == new_code and c['codigo'] != original_code for c in self.clientes)
-                
-                if is_duplicate:
+                if not self.clientes.update(original_code, new_code, name):
                     messagebox.showerror("Erro", f"O Código de Cliente '{new_code}' já existe para outro cliente.")
                     return
-                
-                client_data['codigo'] = new_code
-                client_data['nome'] = name
+                if new_code != original_code and original_code in self.client_usage:
+                    self.client_usage.rename(original_code, new_code)
+                    self._mark_dirty('uso_clientes')
                 messagebox.showinfo("Sucesso", f"Cliente {new_code} atualizado.")
                 
-                if self.selected_client and original_code == self.selected_client['codigo']:
+                if self.selected_client is client_data:
                     self.client_code_var.set(new_code)
                     self.client_name_label.configure(text=name, text_color=CTK_COLOR_PRIMARY) # Atualiza a cor de destaque
 
             else:
                 # Lógica de Cadastro
-                if any(c['codigo'] == new_code for c in self.clientes):
+                if self.clientes.add(new_code, name) is None:
                     messagebox.showerror("Erro", f"O Código de Cliente '{new_code}' já existe.")
                     return
-                self.clientes.append({"codigo": new_code, "nome": name})
                 messagebox.showinfo("Sucesso", f"Cliente {new_code} cadastrado.")
 
-            save_clientes(self.clientes)
+            self._mark_dirty('clientes')
             self._update_client_list(self.client_search_entry.get())
-            modal.destroy()
+            self._update_shortlist()
+            self._hide_modal(modal)
 
         ctk.CTkButton(modal, text="Salvar", command=save_client, fg_color=CTK_COLOR_SUCCESS, hover_color="#27AE60", corner_radius=10).pack(pady=20, padx=10)
         
@@ -387,8 +978,13 @@ class CreditNoteApp(ctk.CTk):
         name = self.selected_client['nome']
 
         if messagebox.askyesno("Confirmar Exclusão", f"Tem certeza que deseja excluir o cliente:\n[{code}] - {name}?"):
-            self.clientes = [c for c in self.clientes if c['codigo'] != code]
-            save_clientes(self.clientes)
+            if self._has_edit_conflict(CLIENTES_FILE):
+                return
+            self.clientes.remove(code)
+            self._mark_dirty('clientes')
+            if self.client_usage.remove(code):
+                self._mark_dirty('uso_clientes')
+                self._update_shortlist()
             self.selected_client = None
             self.client_code_var.set("")
             self.client_name_label.configure(text="Nenhum cliente selecionado", text_color=("#2C3E50", "white")) # Retorna à cor padrão
@@ -396,6 +992,164 @@ class CreditNoteApp(ctk.CTk):
             messagebox.showinfo("Sucesso", f"Cliente {code} excluído com sucesso.")
 
 
+    # --- Operações em Massa (clientes, fornecedores e templates) ---
+
+    def _show_bulk_modal(self):
+        """
+        Seleção múltipla, prévia e aplicação de alterações em massa (ver bulk_operations.py):
+        uma única gravação e um único redesenho ao final, com desfazer em um passo.
+        """
+        modal = Toplevel(self)
+        modal.title("Operações em Massa")
+        modal.transient(self)
+        modal.grab_set()
+        modal.geometry("900x640")
+
+        pending = {'plan': None}
+        tabs = ctk.CTkTabview(modal)
+        tabs.pack(fill="both", expand=True, padx=10, pady=(10, 0))
+
+        preview_box = ctk.CTkTextbox(modal, height=150, corner_radius=10)
+        preview_box.pack(fill="x", padx=10, pady=10)
+
+        def show_preview(result):
+            ok, plan_or_error = result
+            pending['plan'] = plan_or_error if ok else None
+            preview_box.configure(state="normal")
+            preview_box.delete("1.0", tk.END)
+            preview_box.insert("1.0", plan_or_error.preview(limit=BULK_PREVIEW_LIMIT) if ok else plan_or_error)
+            preview_box.configure(state="disabled")
+            apply_button.configure(state="normal" if ok else "disabled")
+
+        def build_tab(name, items_func, actions):
+            """Aba com filtro, lista de seleção múltipla e as ações (rótulo, campos, planejar)."""
+            tab = tabs.add(name)
+            filter_entry = ctk.CTkEntry(tab, placeholder_text="Filtrar...", corner_radius=10)
+            filter_entry.pack(fill="x", padx=5, pady=5)
+            listbox = Listbox(tab, selectmode=tk.EXTENDED, height=10, font=("Arial", 11), exportselection=False)
+            listbox.pack(fill="both", expand=True, padx=5)
+            shown = []
+
+            def refresh(event=None):
+                text = filter_entry.get().strip().lower()
+                listbox.delete(0, tk.END)
+                shown[:] = [(key, label) for key, label in items_func() if text in label.lower()]
+                if shown:
+                    listbox.insert(tk.END, *[label for _, label in shown])
+
+            def selected_keys():
+                return [shown[i][0] for i in listbox.curselection()]
+
+            filter_entry.bind("<KeyRelease>", refresh)
+            controls = ctk.CTkFrame(tab, fg_color="transparent")
+            controls.pack(fill="x", padx=5, pady=5)
+            ctk.CTkButton(controls, text="Selecionar Todos (filtrados)", width=180, corner_radius=8,
+                          command=lambda: listbox.selection_set(0, tk.END)).pack(side="left", padx=(0, 10))
+            for label, fields, plan_func in actions:
+                entries = []
+                for placeholder in fields:
+                    entry = ctk.CTkEntry(controls, placeholder_text=placeholder, width=140, corner_radius=8)
+                    entry.pack(side="left", padx=2)
+                    entries.append(entry)
+                ctk.CTkButton(controls, text=label, width=120, corner_radius=8, fg_color=CTK_COLOR_ACCENT,
+                              command=lambda f=plan_func, e=entries: show_preview(f(selected_keys(), *[x.get() for x in e]))
+                              ).pack(side="left", padx=(2, 10))
+            refresh()
+            return refresh
+
+        refreshers = {
+            bulk_operations.CLIENTES: build_tab(
+                "Clientes",
+                lambda: [(c['codigo'], f"[{c['codigo']}] - {c['nome']}") for c in self.clientes.sorted_by_code()],
+                [("Prévia: Substituir", ("Localizar no nome", "Substituir por"),
+                  lambda keys, find, repl: bulk_operations.plan_client_rename(self.clientes, keys, find, repl)),
+                 ("Prévia: Excluir", (),
+                  lambda keys: bulk_operations.plan_client_delete(self.clientes, keys, self.client_usage))],
+            ),
+            bulk_operations.FORNECEDORES: build_tab(
+                "Fornecedores",
+                lambda: [(f['nome'], f"{f['nome']}  ({f['modelo']})") for f in self.fornecedores],
+                [("Prévia: Trocar Modelo", ("Novo modelo (.xlsx)",),
+                  lambda keys, model: bulk_operations.plan_supplier_model(self.fornecedores, keys, model))],
+            ),
+            bulk_operations.TEMPLATES: build_tab(
+                "Templates",
+                lambda: [(t['nome'], f"{t['nome']}: {t['descricao']}") for t in self.templates],
+                [("Prévia: Substituir", ("Localizar na descrição", "Substituir por"),
+                  lambda keys, find, repl: bulk_operations.plan_template_replace(self.templates, keys, find, repl)),
+                 ("Prévia: Excluir", (),
+                  lambda keys: bulk_operations.plan_template_delete(self.templates, keys))],
+            ),
+        }
+
+        def apply_plan():
+            plan = pending['plan']
+            if plan is None or not messagebox.askyesno(
+                "Confirmar Operação em Massa", f"{plan.title}: {len(plan)} item(ns) serão alterados.\nContinuar?", parent=modal
+            ):
+                return
+            if self._has_edit_conflict(BULK_DATASET_FILES[plan.dataset]):
+                modal.destroy()
+                return
+            undo = plan.apply()
+            self._bulk_undo = (plan, undo)
+            self._after_bulk_change(plan)
+            refreshers[plan.dataset]()
+            show_preview((False, f"Aplicado: {plan.title} ({len(plan)} item(ns)). Use 'Desfazer' para reverter."))
+            undo_button.configure(state="normal")
+
+        def undo_last():
+            if self._undo_bulk():
+                for refresh in refreshers.values():
+                    refresh()
+                show_preview((False, "Última operação em massa desfeita."))
+            undo_button.configure(state="disabled")
+
+        buttons = ctk.CTkFrame(modal, fg_color="transparent")
+        buttons.pack(fill="x", padx=10, pady=(0, 10))
+        buttons.grid_columnconfigure((0, 1), weight=1)
+        apply_button = ctk.CTkButton(buttons, text="Aplicar", command=apply_plan, state="disabled",
+                                     fg_color=CTK_COLOR_SUCCESS, hover_color="#27AE60", corner_radius=10)
+        apply_button.grid(row=0, column=0, padx=5, sticky="ew")
+        undo_button = ctk.CTkButton(buttons, text="Desfazer Última Operação", command=undo_last,
+                                    state="normal" if self._bulk_undo else "disabled",
+                                    fg_color=CTK_COLOR_DANGER, hover_color="#C0392B", corner_radius=10)
+        undo_button.grid(row=0, column=1, padx=5, sticky="ew")
+
+    def _after_bulk_change(self, plan):
+        """Uma gravação e um redesenho para a operação inteira."""
+        self._mark_dirty(plan.dataset)
+        if plan.dataset == bulk_operations.CLIENTES:
+            if any(after is None for _, _, after in plan.rows):
+                self._mark_dirty('uso_clientes')
+            if self.selected_client and self.clientes.get(self.selected_client['codigo']) is not self.selected_client:
+                self.selected_client = None
+                self.client_code_var.set("")
+                self.client_name_label.configure(text="Nenhum cliente selecionado", text_color=("#2C3E50", "white"))
+            elif self.selected_client:
+                self.client_name_label.configure(text=self.selected_client['nome'], text_color=CTK_COLOR_PRIMARY)
+            self._update_client_list(self.client_search_entry.get())
+            self._update_shortlist()
+            # Mudança grande descarta o índice de busca: remontado de uma vez, fora da digitação
+            self.after_idle(self.clientes.prepare_search)
+        elif plan.dataset == bulk_operations.FORNECEDORES:
+            self._update_supplier_dropdown(self.supplier_var.get())
+        else:
+            self._update_template_dropdown(self.template_var.get())
+
+    def _undo_bulk(self):
+        """Desfaz a última operação em massa. Retorna True se desfez."""
+        if not self._bulk_undo:
+            return False
+        plan, undo = self._bulk_undo
+        self._bulk_undo = None
+        if self._has_edit_conflict(BULK_DATASET_FILES[plan.dataset]):
+            # O arquivo mudou por fora depois da operação: desfazer sobrescreveria a outra alteração
+            return False
+        undo()
+        self._after_bulk_change(plan)
+        return True
+
     # --- SETUP: Gerenciamento de Templates ---
     
     def _setup_template_management(self, master):
@@ -439,8 +1193,10 @@ class CreditNoteApp(ctk.CTk):
             return
             
         if messagebox.askyesno("Confirmar Exclusão", f"Tem certeza que deseja excluir o template:\n'{selected_name}'?"):
+            if self._has_edit_conflict(TEMPLATES_FILE):
+                return
             self.templates = [t for t in self.templates if t['nome'] != selected_name]
-            save_templates(self.templates)
+            self._mark_dirty('templates')
             self._update_template_dropdown()
             
             if template_exists and self.description_textbox.get("1.0", tk.END).strip() == template_exists['descricao'].strip():
@@ -450,18 +1206,17 @@ class CreditNoteApp(ctk.CTk):
             messagebox.showinfo("Sucesso", "Template excluído com sucesso.")
 
     def _show_template_modal(self, title, template_data):
-        modal = Toplevel(self)
-        modal.title(title)
-        modal.transient(self)
-        modal.grab_set()
-        modal.resizable(False, False)
-        modal.geometry("450x400")
-        
-        self.update_idletasks()
-        x = self.winfo_x() + self.winfo_width() // 2 - modal.winfo_width() // 2
-        y = self.winfo_y() + self.winfo_height() // 2 - modal.winfo_height() // 2
-        modal.geometry(f'+{x}+{y}')
+        modal, form = self._get_modal('template', "450x400", self._build_template_modal)
+        form['template_data'] = template_data
+        form['original_name'] = template_data['nome'] if template_data else None
+        form['name_entry'].delete(0, tk.END)
+        form['desc_textbox'].delete("1.0", tk.END)
+        if template_data:
+            form['name_entry'].insert(0, template_data['nome'])
+            form['desc_textbox'].insert("1.0", template_data['descricao'])
+        self._present_modal(modal, title)
 
+    def _build_template_modal(self, modal, form):
         ctk.CTkLabel(modal, text="Nome do Template:").pack(pady=(10, 0), padx=10)
         name_entry = ctk.CTkEntry(modal, width=400, corner_radius=10)
         name_entry.pack(padx=10)
@@ -469,20 +1224,27 @@ class CreditNoteApp(ctk.CTk):
         ctk.CTkLabel(modal, text="Texto Completo da Descrição:").pack(pady=(10, 0), padx=10)
         desc_textbox = ctk.CTkTextbox(modal, width=400, height=150, corner_radius=10)
         desc_textbox.pack(padx=10)
-        
-        original_name = None
-        if template_data:
-            original_name = template_data['nome']
-            name_entry.insert(0, original_name)
-            desc_textbox.insert("1.0", template_data['descricao'])
+        form.update(name_entry=name_entry, desc_textbox=desc_textbox)
         
         def save_template():
+            template_data = form['template_data']
+            original_name = form['original_name']
             new_name = name_entry.get().strip()
             description = desc_textbox.get("1.0", tk.END).strip()
             
             if not new_name or not description:
                 messagebox.showerror("Erro", "Nome e Descrição são obrigatórios.")
                 return
+
+            # Campos por nota ({cliente}, {valor_extenso}...): valida antes de salvar
+            template_problems = template_errors(description)
+            if template_problems:
+                messagebox.showerror("Erro", "\n".join(template_problems))
+                return
+
+            if self._has_edit_conflict(TEMPLATES_FILE):
+                self._hide_modal(modal)
+                return
             
             # Checa duplicidade
             is_duplicate = any(t['nome'] == new_name and t.get('nome') != original_name for t in self.templates)
@@ -500,9 +1262,9 @@ class CreditNoteApp(ctk.CTk):
                 self.templates.append({"nome": new_name, "descricao": description})
                 messagebox.showinfo("Sucesso", f"Template '{new_name}' cadastrado.")
 
-            save_templates(self.templates)
+            self._mark_dirty('templates')
             self._update_template_dropdown(new_name) # Atualiza e pré-seleciona
-            modal.destroy()
+            self._hide_modal(modal)
 
         ctk.CTkButton(modal, text="Salvar Template", command=save_template, fg_color=CTK_COLOR_SUCCESS, hover_color="#27AE60", corner_radius=10).pack(pady=20, padx=10)
 
@@ -535,6 +1297,7 @@ class CreditNoteApp(ctk.CTk):
         if selected_template:
             self.description_textbox.delete("1.0", tk.END)
             self.description_textbox.insert("1.0", selected_template['descricao'])
+            self._schedule_preview()
 
     # --- NOVO SETUP: Gerenciamento de Fornecedores ---
 
@@ -558,6 +1321,9 @@ class CreditNoteApp(ctk.CTk):
     def _update_supplier_dropdown(self, selected_name=None):
         """Atualiza as opções do Combobox de fornecedores."""
         self.supplier_options = [s['nome'] for s in self.fornecedores]
+        # O modelo do fornecedor pode ter mudado: a pré-visualização confere de novo
+        self.note_preview.invalidate()
+        self._schedule_preview()
         
         if not self.supplier_options:
             self.supplier_options = ["Nenhum fornecedor cadastrado"]
@@ -595,24 +1361,28 @@ class CreditNoteApp(ctk.CTk):
             return
             
         if messagebox.askyesno("Confirmar Exclusão", f"Tem certeza que deseja excluir o fornecedor:\n'{selected_name}'?"):
+            if self._has_edit_conflict(FORNECEDORES_FILE):
+                return
             self.fornecedores = [s for s in self.fornecedores if s['nome'] != selected_name]
-            save_fornecedores(self.fornecedores)
+            self._mark_dirty('fornecedores')
             self._update_supplier_dropdown()
             messagebox.showinfo("Sucesso", "Fornecedor excluído com sucesso.")
 
     def _show_supplier_modal(self, title, supplier_data):
-        modal = Toplevel(self)
-        modal.title(title)
-        modal.transient(self)
-        modal.grab_set()
-        modal.resizable(False, False)
-        modal.geometry("450x350")
-        
-        self.update_idletasks()
-        x = self.winfo_x() + self.winfo_width() // 2 - modal.winfo_width() // 2
-        y = self.winfo_y() + self.winfo_height() // 2 - modal.winfo_height() // 2
-        modal.geometry(f'+{x}+{y}')
+        modal, form = self._get_modal('fornecedor', "450x400", self._build_supplier_modal)
+        form['supplier_data'] = supplier_data
+        form['original_name'] = supplier_data['nome'] if supplier_data else None
+        form['name_entry'].delete(0, tk.END)
+        form['model_entry'].delete(0, tk.END)
+        form['consolidated_var'].set(bool(supplier_data) and supplier_data.get('saida') == 'consolidada')
+        if supplier_data:
+            form['name_entry'].insert(0, supplier_data['nome'])
+            form['model_entry'].insert(0, supplier_data['modelo'])
+        else:
+             form['model_entry'].insert(0, MODELO_FILE) # Default para o modelo 1
+        self._present_modal(modal, title)
 
+    def _build_supplier_modal(self, modal, form):
         ctk.CTkLabel(modal, text="Nome do Fornecedor/Título:").pack(pady=(10, 0), padx=10)
         name_entry = ctk.CTkEntry(modal, width=400, corner_radius=10)
         name_entry.pack(padx=10)
@@ -622,16 +1392,16 @@ class CreditNoteApp(ctk.CTk):
         model_entry = ctk.CTkEntry(modal, width=400, corner_radius=10)
         model_entry.pack(padx=10)
         ctk.CTkLabel(modal, text="Ex: modelo.xlsx ou modelo2.xlsx", font=ctk.CTkFont(size=10)).pack(pady=(0, 10), padx=10)
-        
-        original_name = None
-        if supplier_data:
-            original_name = supplier_data['nome']
-            name_entry.insert(0, original_name)
-            model_entry.insert(0, supplier_data['modelo'])
-        else:
-             model_entry.insert(0, MODELO_FILE) # Default para o modelo 1
+
+        # Nos lotes, fornecedores com saída consolidada recebem uma pasta de trabalho
+        # por período, com uma aba por nota (em vez de um arquivo por nota)
+        consolidated_var = tk.BooleanVar(master=modal, value=False)
+        ctk.CTkCheckBox(modal, text="Lotes: uma pasta de trabalho por período (uma aba por nota)", variable=consolidated_var).pack(pady=(0, 10), padx=10)
+        form.update(name_entry=name_entry, model_entry=model_entry, consolidated_var=consolidated_var)
 
         def save_supplier():
+            supplier_data = form['supplier_data']
+            original_name = form['original_name']
             new_name = name_entry.get().strip()
             model = model_entry.get().strip().lower()
             
@@ -644,6 +1414,10 @@ class CreditNoteApp(ctk.CTk):
                 messagebox.showerror("Erro", "O nome do modelo deve terminar com '.xlsx'.")
                 return
 
+            if self._has_edit_conflict(FORNECEDORES_FILE):
+                self._hide_modal(modal)
+                return
+
             # Checa duplicidade
             is_duplicate = any(s['nome'] == new_name and s.get('nome') != original_name for s in self.fornecedores)
             if is_duplicate:
@@ -654,15 +1428,22 @@ class CreditNoteApp(ctk.CTk):
                 # Edição
                 supplier_data['nome'] = new_name
                 supplier_data['modelo'] = model
+                if consolidated_var.get():
+                    supplier_data['saida'] = 'consolidada'
+                else:
+                    supplier_data.pop('saida', None)
                 messagebox.showinfo("Sucesso", f"Fornecedor '{new_name}' atualizado.")
             else:
                 # Cadastro
-                self.fornecedores.append({"nome": new_name, "modelo": model})
+                new_supplier = {"nome": new_name, "modelo": model}
+                if consolidated_var.get():
+                    new_supplier['saida'] = 'consolidada'
+                self.fornecedores.append(new_supplier)
                 messagebox.showinfo("Sucesso", f"Fornecedor '{new_name}' cadastrado.")
 
-            save_fornecedores(self.fornecedores)
+            self._mark_dirty('fornecedores')
             self._update_supplier_dropdown(new_name)
-            modal.destroy()
+            self._hide_modal(modal)
 
         ctk.CTkButton(modal, text="Salvar Fornecedor", command=save_supplier, fg_color=CTK_COLOR_SUCCESS, hover_color="#27AE60", corner_radius=10).pack(pady=20, padx=10)
 
@@ -690,7 +1471,7 @@ class CreditNoteApp(ctk.CTk):
         self.supplier_var = ctk.StringVar()
         self.supplier_dropdown = ctk.CTkOptionMenu(supplier_frame, 
                                                    variable=self.supplier_var,
-                                                   command=lambda x: None, # Nenhuma ação imediata no select
+                                                   command=self._on_supplier_selected,
                                                    fg_color=CTK_COLOR_PANEL,
                                                    # AJUSTE: Cor do botão mais clara e seta visível
                                                    button_color=CTK_COLOR_BACKGROUND, # Cor de fundo neutra
@@ -793,7 +1574,7 @@ class CreditNoteApp(ctk.CTk):
         action_frame.grid(row=8, column=0, padx=30, pady=10, sticky="ew") 
         action_frame.grid_columnconfigure((0, 1), weight=1)
 
-        ctk.CTkButton(action_frame, 
+        self.generate_button = ctk.CTkButton(action_frame, 
                       text="✅ Gerar Nota de Crédito (.xlsx)", 
                       command=self._process_note, 
                       fg_color=CTK_COLOR_BUTTON_GENERATE, 
@@ -801,7 +1582,8 @@ class CreditNoteApp(ctk.CTk):
                       font=ctk.CTkFont(weight="bold", size=15),
                       corner_radius=10,
                       height=45 # Altura maior para o botão principal
-                      ).grid(row=0, column=0, padx=5, pady=5, sticky="ew", ipady=5)
+                      )
+        self.generate_button.grid(row=0, column=0, padx=5, pady=5, sticky="ew", ipady=5)
                       
         ctk.CTkButton(action_frame, 
                       text="🖨️ Imprimir Última Nota", 
@@ -812,6 +1594,117 @@ class CreditNoteApp(ctk.CTk):
                       height=45
                       ).grid(row=0, column=1, padx=5, pady=5, sticky="ew", ipady=5)
 
+        ctk.CTkButton(action_frame, 
+                      text="📦 Exportar Pacote de Notas (.zip)", 
+                      command=self._show_archive_export_modal, 
+                      fg_color=CTK_COLOR_ACCENT, 
+                      hover_color="#7F8C8D",
+                      corner_radius=10,
+                      height=35
+                      ).grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+
+        self.batch_button = ctk.CTkButton(action_frame, 
+                      text="📑 Gerar Lote de Notas (.csv)", 
+                      command=self._process_batch_file, 
+                      fg_color=CTK_COLOR_ACCENT, 
+                      hover_color="#7F8C8D",
+                      corner_radius=10,
+                      height=35
+                      )
+        self.batch_button.grid(row=1, column=0, padx=5, pady=5, sticky="ew")
+
+        self.recurrence_button = ctk.CTkButton(action_frame, 
+                      text="🔁 Notas Recorrentes do Mês", 
+                      command=self._show_recurrence_modal, 
+                      fg_color=CTK_COLOR_ACCENT, 
+                      hover_color="#7F8C8D",
+                      corner_radius=10,
+                      height=35
+                      )
+        self.recurrence_button.grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+
+        # 6. Pré-visualização (coluna à direita do formulário)
+        preview_frame = ctk.CTkFrame(master, fg_color=("#ECF0F1", "gray25"), corner_radius=10)
+        preview_frame.grid(row=0, column=1, rowspan=9, padx=(0, 30), pady=30, sticky="n")
+        ctk.CTkLabel(preview_frame, text="👁️ Pré-visualização", font=ctk.CTkFont(weight="bold")).pack(padx=10, pady=(10, 5))
+        self.preview_label = ctk.CTkLabel(preview_frame, text="Selecione um fornecedor para visualizar a nota.")
+        self.preview_label.pack(padx=10, pady=(0, 10))
+
+        # Qualquer alteração no formulário redesenha a pré-visualização
+        for var in (self.supplier_var, self.date_var, self.invoice_number_var, self.value_var, self.client_code_var):
+            var.trace_add("write", lambda *args: self._schedule_preview())
+        self.description_textbox.bind("<KeyRelease>", lambda event: self._schedule_preview())
+        self.after_idle(self._schedule_preview)
+
+    # --- Pré-visualização da Nota ---
+
+    def _on_supplier_selected(self, supplier_name):
+        # Troca de fornecedor: confere se o modelo mudou no disco
+        self.note_preview.invalidate()
+        self._schedule_preview()
+
+    def _schedule_preview(self):
+        """Agrupa alterações seguidas (ex.: digitação) em um único redesenho."""
+        if not self._preview_pending:
+            self._preview_pending = True
+            self.after_idle(self._update_preview)
+
+    def _update_preview(self):
+        """Redesenha a pré-visualização com os dados atuais do formulário (sem validar)."""
+        self._preview_pending = False
+        supplier_name = self.supplier_var.get()
+        selected_supplier = next((s for s in self.fornecedores if s['nome'] == supplier_name), None)
+        if not selected_supplier:
+            self.preview_label.configure(image=None, text="Selecione um fornecedor para visualizar a nota.")
+            return
+
+        try:
+            value_float = parse_brl_value(self.value_var.get())
+        except ValueError:
+            value_float = 0.0
+        client = self.selected_client
+        description_text = self.description_textbox.get("1.0", tk.END).strip()
+        try:
+            description_text = self._render_description(description_text, client, supplier_name,
+                                                        self.date_var.get(), value_float)
+        except ValueError:
+            pass # campos inválidos: mostra o texto como digitado
+
+        try:
+            img = self.note_preview.render(
+                self.date_var.get(),
+                self.invoice_number_var.get(),
+                client['codigo'] if client else "",
+                client['nome'] if client else "",
+                description_text,
+                value_float,
+                selected_supplier['modelo'],
+                supplier_name,
+            )
+        except Exception as e:
+            print(f"Erro ao gerar a pré-visualização: {e}")
+            self.preview_label.configure(image=None, text="Pré-visualização indisponível para este modelo.")
+            return
+
+        self.preview_image = ctk.CTkImage(light_image=img, dark_image=img, size=img.size)
+        self.preview_label.configure(image=self.preview_image, text="")
+
+    def _render_description(self, text, client, supplier_name, data_input, value_float):
+        """
+        Preenche os campos do template de descrição com os dados do formulário.
+        Levanta ValueError se o texto tiver campos inválidos.
+        """
+        template = compile_template(text)
+        if template.is_static:
+            return template.render(None)
+        return template.render({
+            "nome_cliente": client['nome'] if client else "",
+            "codigo_cliente": client['codigo'] if client else "",
+            "fornecedor": supplier_name,
+            "data": data_input,
+            "valor": value_float,
+        })
+
     # --- Funções de Formatação e Validação de Input (inalterada) ---
 
     def _format_date_input_on_focusout(self, event):
@@ -879,6 +1772,8 @@ class CreditNoteApp(ctk.CTk):
 
     def _process_note(self):
         """Valida os dados e chama o backend para processar e salvar, e então pergunta sobre a impressão."""
+        if self._batch_running:
+            return # botão desabilitado: as faturas sugeridas podem estar reservadas pelo lote
         # Garante que os campos são formatados ANTES da validação final
         self._format_currency_input_on_focusout(None)
         self._format_date_input_on_focusout(None) 
@@ -906,7 +1801,7 @@ class CreditNoteApp(ctk.CTk):
         description_text = self.description_textbox.get("1.0", tk.END).strip()
         value_formatted = self.value_var.get()
 
-        if not re.fullmatch(r'\d{2}/\d{2}/\d{4}', data_input):
+        if not is_valid_date(data_input):
             messagebox.showerror("Erro de Validação", "Formato de Data inválido. Use DD/MM/AAAA.")
             return
         
@@ -916,18 +1811,33 @@ class CreditNoteApp(ctk.CTk):
 
         try:
             # Converte de formato brasileiro (vírgula decimal) para float (ponto decimal)
-            value_cleaned = value_formatted.replace('.', '').replace(',', '.')
-            value_float = float(value_cleaned)
+            value_float = parse_brl_value(value_formatted)
         except ValueError:
-            messagebox.showerror("Erro de Validação", "Valor da Fatura inválido.")
+            messagebox.showerror("Erro de Validação", "Valor da Fatura inválido. Informe um valor positivo (ex.: 1.234,56).")
             return
 
         if not description_text:
             messagebox.showerror("Erro de Validação", "A Descrição/Histórico é obrigatória.")
             return
+
+        # Template com campos por nota: o texto digitado é mantido para a próxima nota
+        template_text = description_text
+        try:
+            description_text = self._render_description(template_text, self.selected_client, supplier_name,
+                                                        data_input, value_float)
+        except ValueError as e:
+            messagebox.showerror("Erro de Validação", f"Descrição inválida: {e}")
+            return
+
+        # Outra máquina pode ter emitido notas: não reutiliza números de fatura
+        if self._has_edit_conflict(ESTADO_FILE):
+            return
         
+        # Se o pré-aquecimento ainda estiver rodando, espera por ele (com prazo) em vez de duplicá-lo
+        self._wait_prewarm()
+
         # 2. Chama a função de Backend para processar o XLSX (NOVOS PARÂMETROS)
-        success, result_or_path = process_and_save_note(
+        success, result_or_path, _ = process_and_save_note(
             data_input, 
             invoice_number, 
             self.selected_client['codigo'], 
@@ -936,12 +1846,20 @@ class CreditNoteApp(ctk.CTk):
             value_float, 
             self.estado,
             model_filename, # Novo parâmetro
-            supplier_name   # Novo parâmetro
+            supplier_name,  # Novo parâmetro
+            persist_estado=self.persistence.estado_is_immediate
         )
 
         if success:
             output_path = result_or_path
             self.last_saved_file = output_path
+            if not self.persistence.estado_is_immediate:
+                self._mark_dirty('estado')
+
+            # Estatística de uso (O(1); a gravação é agrupada em segundo plano)
+            self.client_usage.record_use(self.selected_client['codigo'])
+            self._mark_dirty('uso_clientes')
+            self.after_idle(self._update_shortlist)
             
             # 3. Atualiza a GUI com o novo estado
             self.invoice_number_var.set(str(self.estado['ultima_fatura']))
@@ -950,8 +1868,10 @@ class CreditNoteApp(ctk.CTk):
             self.invoice_label.configure(text="Número da Fatura (Próx. Sugerido: {}):".format(self.estado['ultima_fatura']))
             
             self.description_textbox.delete("1.0", tk.END)
-            self.description_textbox.insert("1.0", self.estado['ultima_descricao'])
+            self.description_textbox.insert("1.0", template_text if template_text != description_text
+                                            else self.estado['ultima_descricao'])
             self.value_var.set("0,00")
+            self._schedule_preview()
             
             # 4. Sucesso e Pergunta de Impressão (Mudança aqui)
             
@@ -960,45 +1880,262 @@ class CreditNoteApp(ctk.CTk):
                 "Nota Gerada com Sucesso!", 
                 f"Nota salva em:\n{output_path}\n\nDeseja enviar o arquivo para IMPRESSÃO agora?"
             ):
-                self._print_file(output_path)
+                self._print_file(resolve_output_path(output_path))
             else:
                  messagebox.showinfo("Geração Concluída", "A nota foi gerada e salva com sucesso.")
         else:
             messagebox.showerror("Erro de Processamento", result_or_path)
 
             
-    def _print_file(self, filepath):
-        """Tenta abrir o arquivo com o programa padrão (o que geralmente abre a caixa de diálogo de impressão)."""
+    def _process_batch_file(self):
+        """Valida um lote CSV inteiro e, se não houver erros, gera todas as notas."""
+        if self._batch_running:
+            return
+        csv_path = filedialog.askopenfilename(
+            title="Selecione o lote de notas",
+            filetypes=[("Arquivo CSV", "*.csv"), ("Todos os arquivos", "*.*")],
+        )
+        if not csv_path:
+            return
+
+        try:
+            rows = read_batch_csv(csv_path)
+        except Exception as e:
+            messagebox.showerror("Erro de Leitura", f"Não foi possível ler o lote:\n{e}")
+            return
+
+        # Outra máquina pode ter emitido notas: valida contra a numeração atual
+        if self._has_edit_conflict(ESTADO_FILE):
+            return
+        next_invoice = self.estado['ultima_fatura']
+
+        # Valida o lote inteiro antes de abrir qualquer planilha
+        notes, errors = validate_batch(rows, self.clientes, self.fornecedores, self.estado, self.templates)
+        if errors:
+            messagebox.showerror(
+                "Erro de Validação do Lote",
+                f"O lote tem {len(errors)} erro(s); nenhuma nota foi gerada.\n\n{format_errors(errors, limit=25)}"
+            )
+            return
+        if not notes:
+            messagebox.showwarning("Atenção", "O lote não contém nenhuma nota.")
+            return
+
+        if not messagebox.askyesno(
+            "Confirmar Lote",
+            f"{len(notes)} nota(s) serão geradas (faturas {notes[0]['fatura']} a {notes[-1]['fatura']}).\nContinuar?"
+        ):
+            return
+        # Com o diálogo aberto, outra nota ou as recorrentes podem ter usado a numeração validada
+        if self._batch_running or self.estado['ultima_fatura'] != next_invoice:
+            messagebox.showwarning("Atenção", "A numeração das faturas mudou durante a confirmação. Selecione o lote novamente.")
+            return
+
+        # Fronteira de lote: grava as edições pendentes e reserva as faturas aqui, na
+        # thread do Tk, antes de qualquer outra nota poder usar esses números
+        self.persistence.flush()
+        confirmed = (notes[0]['fatura'], notes[-1]['fatura'])
+        try:
+            journal = start_journal(notes, self.estado, new_journal_path(), origem=csv_path)
+        except Exception as e:
+            messagebox.showerror("Erro no Lote", f"Não foi possível reservar as faturas do lote:\n{e}")
+            return
+        if (notes[0]['fatura'], notes[-1]['fatura']) != confirmed:
+            # Outro processo (outra máquina, daemon) usou a numeração validada antes da reserva
+            messagebox.showinfo("Lote", f"A numeração mudou antes da reserva: faturas {notes[0]['fatura']} a {notes[-1]['fatura']}.")
+
+        def work():
+            self._wait_prewarm() # fora da thread do Tk
+            return execute_journal(journal)
+
+        self._run_batch_in_background(work)
+
+    def _offer_batch_resume(self):
+        """Oferece retomar os lotes que não chegaram ao fim na sessão anterior."""
+        journals = list_incomplete_journals()
+        if not journals or self._batch_running:
+            return
+        if not messagebox.askyesno(
+            "Lote Interrompido",
+            f"{len(journals)} lote(s) de notas não foram concluídos na última execução.\n"
+            "Deseja retomá-los agora? As notas já geradas não serão refeitas nem renumeradas."
+        ):
+            return
+        if self._batch_running or self._has_edit_conflict(ESTADO_FILE):
+            return
+        # Fronteira de lote: a reserva das faturas dos journals acontece aqui, na thread do Tk
+        self.persistence.flush()
+        try:
+            opened = [reopen_journal(path, self.estado) for path in journals]
+        except Exception as e:
+            messagebox.showerror("Erro no Lote", f"Não foi possível retomar os lotes:\n{e}")
+            return
+
+        def work():
+            self._wait_prewarm() # fora da thread do Tk
+            return [r for journal in opened for r in execute_journal(journal)]
+
+        self._run_batch_in_background(work)
+
+    def _wait_prewarm(self):
+        """Espera o pré-aquecimento por até PREWARM_WAIT_SECONDS; depois disso a geração segue sem ele."""
+        if not self.prewarmer.wait(PREWARM_WAIT_SECONDS):
+            print(f"Pré-aquecimento ainda em andamento após {PREWARM_WAIT_SECONDS:.0f} s; gerando sem esperar.")
+
+    def _run_batch_in_background(self, func):
+        """
+        Executa a geração de um lote (faturas já reservadas) fora da thread do Tk e
+        mostra o resumo ao final. Até lá, a geração avulsa e novos lotes ficam desabilitados.
+        """
+        self._update_invoice_suggestion()
+        self._set_batch_running(True)
+
+        def on_done(results):
+            self._set_batch_running(False)
+            failures = [r for r in results if not r[1]]
+            generated = [r for r in results if r[1]]
+            if generated:
+                self.last_saved_file = generated[-1][3]
+            if failures:
+                details = format_errors([(line, msg) for line, _, _, msg in failures], limit=25)
+                messagebox.showerror("Lote Concluído com Falhas", f"{len(generated)} nota(s) gerada(s), {len(failures)} falha(s):\n\n{details}")
+                # Falhas de geração deixam o journal aberto, com as faturas reservadas
+                self._offer_batch_resume()
+            else:
+                messagebox.showinfo("Lote Concluído", f"{len(generated)} nota(s) gerada(s) em:\n{SAIDA_FOLDER}")
+
+        def on_error(error):
+            self._set_batch_running(False)
+            messagebox.showerror("Erro Inesperado", str(error))
+
+        self._run_in_background(func, on_done, on_error)
+
+    def _set_batch_running(self, running):
+        """Marca o lote em segundo plano e (des)habilita a geração avulsa e o início de lotes."""
+        self._batch_running = running
+        state = "disabled" if running else "normal"
+        self.generate_button.configure(state=state)
+        self.batch_button.configure(state=state)
+
+    def _update_invoice_suggestion(self):
+        """Mostra a próxima fatura livre (após reservas de lote ou notas geradas)."""
+        self.invoice_number_var.set(str(self.estado['ultima_fatura']))
+        self.invoice_label.configure(text="Número da Fatura (Próx. Sugerido: {}):".format(self.estado['ultima_fatura']))
+
+    def _print_file(self, filepath, notify=True):
+        """
+        Tenta abrir o arquivo com o programa padrão (o que geralmente abre a caixa de diálogo de impressão).
+        Com notify=False não confirma cada envio (impressão de várias notas).
+        """
         try:
             if os.name == 'nt':  # Windows
                 os.startfile(filepath, "print")
-                messagebox.showinfo("Comando de Impressão Enviado", "A caixa de diálogo da impressora deve ter sido aberta.")
+                if notify:
+                    messagebox.showinfo("Comando de Impressão Enviado", "A caixa de diálogo da impressora deve ter sido aberta.")
             elif os.uname()[0] == 'Darwin':  # macOS
                 os.system(f'open -a "Microsoft Excel" -p "{filepath}"')
-                messagebox.showinfo("Comando de Impressão Enviado", "Verifique a fila de impressão do sistema.")
+                if notify:
+                    messagebox.showinfo("Comando de Impressão Enviado", "Verifique a fila de impressão do sistema.")
             else:  # Linux (genérico)
                 os.system(f'xdg-open "{filepath}"')
-                messagebox.showinfo("Impressão", "Comando enviado. Verifique a fila de impressão do sistema ou abra o arquivo manualmente.")
+                if notify:
+                    messagebox.showinfo("Impressão", "Comando enviado. Verifique a fila de impressão do sistema ou abra o arquivo manualmente.")
         except Exception as e:
             messagebox.showerror("Erro de Impressão/Abertura", f"Não foi possível abrir o arquivo para impressão. Tente abrir o arquivo manualmente: {filepath}\nDetalhe: {e}")
 
+    def _show_archive_export_modal(self):
+        """Modal de exportação do pacote mensal (ZIP) com filtro de período, fornecedor e cliente."""
+        modal = Toplevel(self)
+        modal.title("Exportar Pacote de Notas")
+        modal.transient(self)
+        modal.grab_set()
+        modal.resizable(False, False)
+        modal.geometry("420x420")
+
+        self.update_idletasks()
+        x = self.winfo_x() + self.winfo_width() // 2 - modal.winfo_width() // 2
+        y = self.winfo_y() + self.winfo_height() // 2 - modal.winfo_height() // 2
+        modal.geometry(f'+{x}+{y}')
+
+        today = datetime.date.today()
+        first_day = today.replace(day=1)
+
+        ctk.CTkLabel(modal, text="Data Inicial (DD/MM/AAAA):").pack(pady=(10, 0), padx=10)
+        start_entry = ctk.CTkEntry(modal, width=300, corner_radius=10)
+        start_entry.insert(0, first_day.strftime("%d/%m/%Y"))
+        start_entry.pack(padx=10)
+
+        ctk.CTkLabel(modal, text="Data Final (DD/MM/AAAA):").pack(pady=(10, 0), padx=10)
+        end_entry = ctk.CTkEntry(modal, width=300, corner_radius=10)
+        end_entry.insert(0, today.strftime("%d/%m/%Y"))
+        end_entry.pack(padx=10)
+
+        all_suppliers = "Todos os fornecedores"
+        ctk.CTkLabel(modal, text="Fornecedor:").pack(pady=(10, 0), padx=10)
+        supplier_var = ctk.StringVar(value=all_suppliers)
+        ctk.CTkOptionMenu(modal, variable=supplier_var, width=300,
+                          values=[all_suppliers] + [s['nome'] for s in self.fornecedores]).pack(padx=10)
+
+        ctk.CTkLabel(modal, text="Código do Cliente (opcional):").pack(pady=(10, 0), padx=10)
+        client_entry = ctk.CTkEntry(modal, width=300, corner_radius=10)
+        client_entry.pack(padx=10)
+
+        manifest_var = tk.BooleanVar(value=True)
+        ctk.CTkCheckBox(modal, text="Incluir manifesto CSV", variable=manifest_var).pack(pady=(10, 0), padx=10)
+
+        def do_export():
+            zip_path = filedialog.asksaveasfilename(
+                parent=modal,
+                defaultextension=".zip",
+                filetypes=[("Arquivo ZIP", "*.zip")],
+                initialfile=f"Notas_{first_day.strftime('%Y_%m')}.zip",
+            )
+            if not zip_path:
+                return
+            supplier = supplier_var.get()
+            args = dict(
+                data_inicio=start_entry.get().strip(),
+                data_fim=end_entry.get().strip(),
+                fornecedor=None if supplier == all_suppliers else supplier,
+                codigo_cliente=client_entry.get().strip() or None,
+                incluir_manifesto=manifest_var.get(),
+            )
+            modal.destroy()
+
+            def on_done(result):
+                success, count_or_error = result
+                if success:
+                    messagebox.showinfo("Exportação Concluída", f"{count_or_error} nota(s) exportada(s) para:\n{zip_path}")
+                else:
+                    messagebox.showerror("Erro de Exportação", count_or_error)
+
+            self._run_in_background(lambda: export_archive(zip_path, **args), on_done)
+
+        ctk.CTkButton(modal, text="Exportar", command=do_export, fg_color=CTK_COLOR_SUCCESS, hover_color="#27AE60", corner_radius=10).pack(pady=20, padx=10)
+
     def _print_last_note(self):
         """Imprime o último arquivo salvo."""
-        if not self.last_saved_file or not os.path.exists(self.last_saved_file):
+        # Enquanto a cópia para a pasta de saída não termina, a nota está no spool local
+        filepath = resolve_output_path(self.last_saved_file) if self.last_saved_file else None
+        if not filepath or not os.path.exists(filepath):
             # Tenta encontrar o último arquivo salvo se a aplicação foi reiniciada
             if os.path.exists(SAIDA_FOLDER):
                 files = [os.path.join(SAIDA_FOLDER, f) for f in os.listdir(SAIDA_FOLDER)]
                 if files:
-                    self.last_saved_file = max(files, key=os.path.getctime)
+                    self.last_saved_file = filepath = max(files, key=os.path.getctime)
             
-        if not self.last_saved_file or not os.path.exists(self.last_saved_file):
+        if not filepath or not os.path.exists(filepath):
             messagebox.showwarning("Atenção", "Nenhuma nota foi gerada nesta sessão ou o último arquivo salvo não foi encontrado.")
             return
 
-        if messagebox.askyesno("Confirmar Impressão", f"Deseja enviar para impressão o arquivo:\n{os.path.basename(self.last_saved_file)}?"):
-            self._print_file(self.last_saved_file)
-
+        if messagebox.askyesno("Confirmar Impressão", f"Deseja enviar para impressão o arquivo:\n{os.path.basename(filepath)}?"):
+            self._print_file(filepath)
 
 if __name__ == "__main__":
-    app = CreditNoteApp()
+    # --medir-abertura: imprime os tempos de abertura (JSON) e fecha; --paineis-imediatos:
+    # monta tudo antes da primeira pintura, para comparação (ver benchmarks.py abertura);
+    # --durabilidade-estado=agrupada: ver persistence.py
+    app = CreditNoteApp(lazy_panels="--paineis-imediatos" not in sys.argv,
+                        estado_durability=configured_estado_durability(sys.argv))
+    app.exit_after_startup = "--medir-abertura" in sys.argv
     app.mainloop()
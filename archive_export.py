@@ -0,0 +1,190 @@
+"""
+Exportação do pacote mensal de notas (ZIP) para a contabilidade.
+
+Os arquivos são copiados para o ZIP em blocos, um por vez, então o consumo de
+memória não depende da quantidade de notas. Os .xlsx já são compactados e entram
+no modo "stored" (sem recompressão); o manifesto CSV entra comprimido.
+
+O manifesto tem uma linha por nota e cada arquivo entra no ZIP uma vez só, mesmo
+numa pasta de trabalho consolidada (várias notas, uma aba cada). Se o filtro de
+fornecedor/cliente deixar abas de fora de uma pasta consolidada, o ZIP recebe uma
+cópia dela só com as abas das notas selecionadas.
+"""
+import csv
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+
+from backend_data import SAIDA_FOLDER, iter_note_records, resolve_output_path
+from transfer_queue import spool_path_for
+
+CHUNK_SIZE = 1024 * 1024
+# Formatos que já são comprimidos: recomprimir só gasta CPU
+STORED_EXTENSIONS = ('.xlsx', '.zip', '.pdf', '.png', '.jpg')
+MANIFEST_NAME = "manifesto.csv"
+MANIFEST_FIELDS = ["arquivo", "fatura", "data", "codigo_cliente", "nome_cliente", "fornecedor", "valor", "descricao"]
+
+
+def _parse_date(text):
+    """Converte DD/MM/AAAA em date (None se vazio ou inválido)."""
+    try:
+        return datetime.datetime.strptime(text.strip(), "%d/%m/%Y").date()
+    except (AttributeError, ValueError):
+        return None
+
+
+def _add_file(zf, path, arcname):
+    """Copia um arquivo para o ZIP em blocos, sem carregá-lo inteiro na memória."""
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    if arcname.lower().endswith(STORED_EXTENSIONS):
+        zinfo.compress_type = zipfile.ZIP_STORED
+    else:
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+    with open(path, 'rb') as src, zf.open(zinfo, 'w', force_zip64=True) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def _current_location(path):
+    """
+    Onde a nota está agora (None se em lugar nenhum): a cópia do spool enquanto não
+    for transferida, senão o destino. Sem spool ativo (ex.: linha de comando), a
+    nota pode estar no spool padrão, aguardando a próxima transferência.
+    """
+    resolved = resolve_output_path(path)
+    if resolved == path:
+        spooled = spool_path_for(path)
+        if os.path.exists(spooled):
+            return spooled
+    return resolved if os.path.exists(resolved) else None
+
+
+def _matching_notes(start, end, fornecedor, codigo_cliente):
+    """
+    Gera (caminho, registros, abas) por arquivo, cada arquivo uma vez: os registros
+    das notas que atendem ao filtro e, se o filtro deixou de fora notas de uma pasta
+    consolidada, os títulos das abas a manter (senão None). Primeiro vêm as notas do
+    registro de emitidas; depois, se não houver filtro de fornecedor/cliente, os
+    arquivos antigos da pasta de saída sem registro (período pela data do arquivo).
+
+    As notas avulsas saem direto do registro, à medida que são lidas; só as pastas
+    consolidadas (registros com 'planilha') ficam em memória até o fim da leitura,
+    para saber se alguma aba ficou de fora do filtro.
+    """
+    seen = set()
+    sheets_in_file = {}
+    consolidated = {}
+    for record in iter_note_records():
+        path = record.get('arquivo')
+        if not path:
+            continue
+        sheet = record.get('planilha')
+        if sheet:
+            sheets_in_file.setdefault(path, set()).add(sheet)
+        elif path in seen:
+            continue
+        if fornecedor and record.get('fornecedor') != fornecedor:
+            continue
+        if codigo_cliente and record.get('codigo_cliente') != codigo_cliente:
+            continue
+        date = _parse_date(record.get('data', ''))
+        if (start and (date is None or date < start)) or (end and (date is None or date > end)):
+            continue
+        if sheet:
+            # Uma aba regerada na mesma pasta conta uma vez: vale o último registro
+            consolidated.setdefault(path, {})[sheet] = record
+            continue
+        seen.add(path)
+        yield path, [record], None
+
+    for path, records in consolidated.items():
+        sheets = list(records) if len(records) < len(sheets_in_file[path]) else None
+        yield path, list(records.values()), sheets
+
+    if fornecedor or codigo_cliente or not os.path.isdir(SAIDA_FOLDER):
+        return
+    recorded = {os.path.normpath(p) for p in seen}
+    for record in iter_note_records():
+        recorded.add(os.path.normpath(record.get('arquivo', '')))
+    for entry in os.scandir(SAIDA_FOLDER):
+        if not entry.is_file() or not entry.name.lower().endswith('.xlsx'):
+            continue
+        if os.path.normpath(entry.path) in recorded:
+            continue
+        date = datetime.date.fromtimestamp(entry.stat().st_mtime)
+        if (start and date < start) or (end and date > end):
+            continue
+        yield entry.path, [{"arquivo": entry.path, "data": date.strftime("%d/%m/%Y")}], None
+
+
+def _copy_with_sheets(source, sheets, target):
+    """Grava em target uma cópia da pasta consolidada só com as abas indicadas."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source)
+    for ws in list(wb.worksheets):
+        if ws.title not in sheets:
+            wb.remove(ws)
+    if not wb.worksheets:
+        raise ValueError(f"nenhuma das abas {sheets} foi encontrada em {source}")
+    wb.save(target)
+
+
+def export_archive(zip_path, data_inicio="", data_fim="", fornecedor=None, codigo_cliente=None, incluir_manifesto=True):
+    """
+    Gera o ZIP com as notas do período (datas DD/MM/AAAA, inclusive), opcionalmente
+    filtradas por fornecedor e código de cliente.
+    Retorna (True, quantidade_de_notas) ou (False, mensagem_de_erro).
+    """
+    start = _parse_date(data_inicio) if data_inicio else None
+    end = _parse_date(data_fim) if data_fim else None
+    if (data_inicio and start is None) or (data_fim and end is None):
+        return False, "Período inválido. Use DD/MM/AAAA."
+
+    count = 0
+    tmp_zip = zip_path + ".tmp"
+    try:
+        # O manifesto é escrito em arquivo temporário enquanto as notas entram no ZIP
+        # (o zipfile só aceita um membro aberto para escrita por vez).
+        with zipfile.ZipFile(tmp_zip, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf, \
+                tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='') as manifest, \
+                tempfile.TemporaryDirectory() as scratch:
+            writer = csv.DictWriter(manifest, fieldnames=MANIFEST_FIELDS, extrasaction='ignore', delimiter=';')
+            writer.writeheader()
+            arcnames = set()
+            for path, records, sheets in _matching_notes(start, end, fornecedor, codigo_cliente):
+                source = _current_location(path)
+                if source is None:
+                    print(f"AVISO: nota registrada não encontrada, ignorada: {path}")
+                    continue
+                arcname = os.path.basename(path)
+                root, ext = os.path.splitext(arcname)
+                suffix = 1
+                while arcname in arcnames:
+                    arcname = f"{root}_{suffix}{ext}"
+                    suffix += 1
+                arcnames.add(arcname)
+                if sheets is not None:
+                    filtered = os.path.join(scratch, arcname)
+                    _copy_with_sheets(source, sheets, filtered)
+                    _add_file(zf, filtered, arcname)
+                    os.remove(filtered)
+                else:
+                    _add_file(zf, source, arcname)
+                for record in records:
+                    writer.writerow(dict(record, arquivo=arcname))
+                count += len(records)
+
+            if incluir_manifesto:
+                manifest.seek(0)
+                with zf.open(MANIFEST_NAME, 'w', force_zip64=True) as dst, \
+                        io.TextIOWrapper(dst, encoding='utf-8-sig', newline='') as text_dst:
+                    shutil.copyfileobj(manifest, text_dst, CHUNK_SIZE)
+        os.replace(tmp_zip, zip_path)
+    except Exception as e:
+        if os.path.exists(tmp_zip):
+            os.remove(tmp_zip)
+        return False, f"Erro ao exportar o pacote de notas: {e}"
+    return True, count
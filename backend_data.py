@@ -1,9 +1,17 @@
 import os
+import io
+import contextlib
+import hashlib
 import json
 import re
-from openpyxl import load_workbook
-from openpyxl.utils import get_column_letter
+import stat
+import datetime
+import tempfile
+import threading
 import sys # Importação necessária para PyInstaller
+from file_lock import exclusive
+# O openpyxl é importado sob demanda (ver _load_template_workbook): a importação
+# é cara e não deve atrasar a abertura da janela; o pré-aquecimento a faz em segundo plano.
 
 # --- Utilitário de Caminho para PyInstaller ---
 def _is_packed():
@@ -25,9 +33,17 @@ CLIENTES_FILE = "clientes.json"
 ESTADO_FILE = "estado.json"
 TEMPLATES_FILE = "templates.json"
 FORNECEDORES_FILE = "fornecedores.json" # NOVO ARQUIVO DE DADOS
+USO_CLIENTES_FILE = "uso_clientes.json" # Estatísticas de uso (atalho de clientes frequentes)
 MODELO_FILE = "modelo.xlsx" 
 MODELO2_FILE = "modelo2.xlsx" # NOVO MODELO
 SAIDA_FOLDER = "Notas_de_Credito_Geradas"
+NOTAS_EMITIDAS_FILE = "notas_emitidas.jsonl" # Registro (append-only) das notas geradas
+CURRENCY_NUMBER_FORMAT = 'R$ #,##0.00' # Formato da célula de valor (K50)
+MODELOS_OTIMIZADOS_FOLDER = "modelos_otimizados" # Cópias enxutas dos modelos (ver template_optimizer.py)
+MODELOS_OTIMIZADOS_MANIFEST = os.path.join(MODELOS_OTIMIZADOS_FOLDER, "manifesto.json")
+ESTADO_LOCK = "estado.lock" # Trava da numeração entre processos (ver estado_lock)
+ESTADO_LOCK_STALE_SECONDS = 60 # só é mantida enquanto se relê, numera e grava o estado
+ESTADO_LOCK_TIMEOUT_SECONDS = 30
 
 # --- Dados Iniciais ---
 INITIAL_ESTADO = {
@@ -41,10 +57,39 @@ INITIAL_FORNECEDORES = [
     {"nome": "DU PONT DO BRASIL SA", "modelo": MODELO2_FILE}
 ]
 
+# --- Carimbo de Versão dos Arquivos de Dados ---
+# Guarda a versão (mtime_ns, tamanho) de cada arquivo no último load/save feito
+# por este processo. Se a versão em disco divergir, o arquivo foi alterado por
+# fora (outra máquina, exportação do ERP) e não deve ser sobrescrito às cegas.
+_file_versions = {}
+
+def get_file_version(filename):
+    """Retorna o carimbo de versão atual do arquivo em disco (ou None se não existir)."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def get_known_version(filename):
+    """Retorna a versão vista no último load/save deste processo."""
+    return _file_versions.get(filename)
+
+def is_externally_modified(filename):
+    """Indica se o arquivo mudou em disco desde o último load/save deste processo."""
+    return get_file_version(filename) != _file_versions.get(filename)
+
 # --- Gerenciamento de Dados (JSON) ---
 
-def _load_json_file(filename):
-    """Função genérica para carregar dados JSON."""
+def _load_json_file(filename, strict=False):
+    """
+    Função genérica para carregar dados JSON.
+    Com strict=True, retorna None em caso de erro de leitura (em vez de lista vazia),
+    para que o recarregamento não apague os dados em memória.
+    """
+    # A versão é lida ANTES do conteúdo: se o arquivo mudar durante a leitura,
+    # o próximo poll detecta a diferença e recarrega de novo.
+    _file_versions[filename] = get_file_version(filename)
     if not os.path.exists(filename):
         return []
     try:
@@ -52,15 +97,34 @@ def _load_json_file(filename):
             return json.load(f)
     except Exception as e:
         print(f"Erro ao carregar {filename}: {e}")
-        return []
+        return None if strict else []
 
-def _save_json_file(data, filename):
-    """Função genérica para salvar dados JSON."""
+def _save_json_file(data, filename, durable=False):
+    """
+    Função genérica para salvar dados JSON.
+    Grava num arquivo temporário e o renomeia por cima do original, para que uma
+    queda no meio da escrita não deixe o arquivo truncado. Cada gravação usa um
+    temporário próprio (mkstemp), então gravações simultâneas do mesmo arquivo
+    (threads, outra instância) não escrevem uma por cima da outra. Com durable=True
+    o conteúdo é sincronizado em disco (fsync) antes da troca.
+    """
+    tmp_filename = None
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
+        fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename) or '.',
+                                            prefix=os.path.basename(filename) + ".", suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=4, ensure_ascii=False)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        # mkstemp cria o arquivo só para o dono: mantém as permissões do original
+        os.chmod(tmp_filename, stat.S_IMODE(os.stat(filename).st_mode) if os.path.exists(filename) else 0o644)
+        os.replace(tmp_filename, filename)
+        _file_versions[filename] = get_file_version(filename)
     except Exception as e:
         print(f"Erro ao salvar {filename}: {e}")
+        if tmp_filename and os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
 
 # Funções de Clientes (inalteradas na lógica)
 def load_clientes():
@@ -75,7 +139,24 @@ def load_estado():
         return INITIAL_ESTADO
     return data
 def save_estado(estado):
-    _save_json_file(estado, ESTADO_FILE)
+    # O estado guarda a próxima fatura: sempre sincronizado em disco
+    _save_json_file(estado, ESTADO_FILE, durable=True)
+
+@contextlib.contextmanager
+def estado_lock():
+    """
+    Trava de estado.json entre processos (aplicativo, linha de comando, daemon de
+    ingestão): quem avança a numeração relê o estado (sync_estado), numera e grava
+    dentro dela, para que dois processos nunca reservem as mesmas faturas.
+    """
+    with exclusive(ESTADO_LOCK, ESTADO_LOCK_STALE_SECONDS, ESTADO_LOCK_TIMEOUT_SECONDS):
+        yield
+
+def sync_estado(estado):
+    """Traz para o estado em memória a próxima fatura gravada em disco, se outro processo a avançou (sob estado_lock)."""
+    on_disk = int(load_estado().get('ultima_fatura', 0))
+    if on_disk > int(estado.get('ultima_fatura', 0)):
+        estado['ultima_fatura'] = on_disk
 
 # Funções de Templates (inalteradas na lógica)
 def load_templates():
@@ -95,6 +176,40 @@ def save_fornecedores(fornecedores):
     """Salva a lista de fornecedores no arquivo JSON."""
     _save_json_file(fornecedores, FORNECEDORES_FILE)
 
+# Funções de Uso dos Clientes
+def load_uso_clientes():
+    """Estatísticas de uso por código de cliente ({} se não houver)."""
+    data = _load_json_file(USO_CLIENTES_FILE)
+    return data if isinstance(data, dict) else {}
+def save_uso_clientes(uso):
+    _save_json_file(uso, USO_CLIENTES_FILE)
+
+
+# --- Registro de Notas Emitidas (JSON Lines, somente acréscimo) ---
+
+def append_note_record(record):
+    """Acrescenta o registro de uma nota emitida ao final do arquivo de notas."""
+    try:
+        with open(NOTAS_EMITIDAS_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"Erro ao registrar nota emitida em {NOTAS_EMITIDAS_FILE}: {e}")
+
+def iter_note_records():
+    """Percorre os registros de notas emitidas sem carregar o arquivo inteiro."""
+    if not os.path.exists(NOTAS_EMITIDAS_FILE):
+        return
+    with open(NOTAS_EMITIDAS_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Linha truncada (ex.: queda de energia durante a escrita)
+                continue
+
 
 def _create_initial_model(filename):
     """Cria um arquivo modelo XLSX mínimo se não existir no ambiente de DEV."""
@@ -132,104 +247,305 @@ def _create_initial_model(filename):
         except Exception as e:
             print(f"Erro ao criar modelo inicial ({filename}): {e}")
 
-# --- Processamento de XLSX ---
+# --- Cache de Modelos XLSX ---
+# Conteúdo bruto de cada modelo, validado pelo carimbo de versão do arquivo.
+# Evita reler o modelo do disco a cada nota; cada nota ainda recebe seu próprio Workbook.
+_template_cache = {}
+_template_cache_lock = threading.Lock()
 
-def process_and_save_note(data_input, invoice_number, client_code, client_name, description_text, value_float, estado, model_filename, supplier_name):
+def _optimized_template_bytes(model_path, source_bytes):
     """
-    Carrega o modelo, preenche os dados e salva o novo arquivo XLSX, 
-    usando o modelo especificado.
+    Conteúdo da cópia otimizada do modelo, se houver uma derivada exatamente deste
+    conteúdo (SHA-256 do original no manifesto) e íntegra; senão None.
     """
+    manifest = _load_json_file(MODELOS_OTIMIZADOS_MANIFEST)
+    entry = manifest.get(os.path.basename(model_path)) if isinstance(manifest, dict) else None
+    if not entry or entry.get("origem_sha256") != hashlib.sha256(source_bytes).hexdigest():
+        return None
+    try:
+        with open(os.path.join(MODELOS_OTIMIZADOS_FOLDER, entry["arquivo"]), 'rb') as f:
+            data = f.read()
+    except (OSError, KeyError):
+        return None
+    if hashlib.sha256(data).hexdigest() != entry.get("sha256"):
+        return None
+    return data
+
+def _load_template_workbook(model_path, optimized=True):
+    """
+    Carrega o Workbook do modelo a partir do cache em memória (relendo se o arquivo
+    ou o manifesto dos modelos otimizados mudou). Usa a cópia otimizada quando
+    houver uma válida para o conteúdo atual do modelo.
+    """
+    from openpyxl import load_workbook
+
+    version = (get_file_version(model_path), get_file_version(MODELOS_OTIMIZADOS_MANIFEST))
+    with _template_cache_lock:
+        cached = _template_cache.get(model_path)
+        if cached is None or cached[0] != version:
+            with open(model_path, 'rb') as f:
+                source = f.read()
+            cached = (version, source, _optimized_template_bytes(model_path, source))
+            _template_cache[model_path] = cached
+    data = cached[2] if optimized and cached[2] is not None else cached[1]
+    return load_workbook(io.BytesIO(data))
+
+def _build_data_map(data_input, invoice_number, client_code, client_name, description_text, value_float, model_filename, supplier_name):
+    """Monta o mapeamento célula -> valor da nota para o modelo informado."""
+    data_map = {
+        'H9': data_input, 
+        'K9': invoice_number, 
+        'A13': client_code, 
+        'J52': client_code, 
+        'A15': client_name, 
+        'G15': client_name, 
+        'B28': description_text, 
+        'K50': value_float, 
+        'L52': invoice_number, 
+    }
     
-    # 1. Obter caminho do modelo (MODELO_FILE ou MODELO2_FILE)
+    # Mapeamento Específico do Fornecedor/Modelo (NOVA LÓGICA)
+    # O nome do fornecedor é mapeado para E2 apenas se for o modelo2
+    if model_filename == "modelo2.xlsx":
+         data_map['E2'] = supplier_name 
+    # O modelo.xlsx não tem mapeamento especial, usa o PRODUZA.
+    elif model_filename == "modelo.xlsx":
+         # O mapeamento para E2 não é usado, mas a célula E2 no modelo.xlsx 
+         # deve ser preenchida com o nome fixo se a célula não estiver mesclada.
+         # Como o mapeamento é igual (exceto a célula extra), verificamos o 
+         # mapeamento original do modelo.xlsx na imagem que tem a PRODUZA na linha 2.
+         # Para ser fiel ao requisito:
+         pass # A célula E2:J3 no modelo.xlsx é ignorada pelo script.
+    return data_map
+
+# --- Pré-aquecimento (openpyxl, modelos e pasta de saída) ---
+
+def prewarm(fornecedores):
+    """
+    Importa o openpyxl, carrega e valida todos os modelos usados pelos fornecedores
+    e verifica se a pasta de saída aceita gravação.
+    Retorna a lista de problemas encontrados (vazia se tudo estiver certo).
+    """
+    from openpyxl.cell.cell import MergedCell
+
+    problems = []
+    model_names = sorted({f.get('modelo') for f in fornecedores if f.get('modelo')})
+    for model_filename in model_names:
+        model_path = _get_resource_path(model_filename)
+        if not os.path.exists(model_path):
+            problems.append(f"Modelo '{model_filename}' não encontrado em {model_path}.")
+            continue
+        try:
+            ws = _load_template_workbook(model_path).active
+        except Exception as e:
+            problems.append(f"Modelo '{model_filename}' não pôde ser carregado: {e}")
+            continue
+        cells = _build_data_map('', '', '', '', '', 0.0, model_filename, '')
+        for cell in cells:
+            if isinstance(ws[cell], MergedCell):
+                problems.append(f"Modelo '{model_filename}': a célula {cell} está no meio de uma mesclagem e não será preenchida.")
+
+    try:
+        os.makedirs(SAIDA_FOLDER, exist_ok=True)
+        with tempfile.TemporaryFile(dir=SAIDA_FOLDER):
+            pass
+    except OSError as e:
+        problems.append(f"A pasta de saída '{SAIDA_FOLDER}' não aceita gravação: {e}")
+    return problems
+
+# --- Processamento de XLSX ---
+
+def _resolve_model_path(model_filename):
+    """Caminho do modelo; tenta criar o fallback em DEV. Retorna None se não existir."""
     model_path = _get_resource_path(model_filename)
     
-    # 1.1 Tenta criar o modelo se não for encontrado e estiver em ambiente DEV
+    # Tenta criar o modelo se não for encontrado e estiver em ambiente DEV
     if not os.path.exists(model_path):
         print(f"DIAGNÓSTICO: Modelo '{model_filename}' não encontrado em {model_path}. Tentando criar fallback.")
         _create_initial_model(model_filename)
         model_path = _get_resource_path(model_filename) # Tenta obter o caminho novamente
         
     if not os.path.exists(model_path):
+        return None
+    return model_path
+
+def _build_sheet_title(base_name, invoice_number):
+    """Título da planilha (aba): cliente + fatura, limitado a 31 caracteres pelo Excel."""
+    return f"{base_name}_{invoice_number}"[:31].replace(' ', '_')
+
+def _fill_note_sheet(ws, data_map):
+    """Preenche as células da nota na planilha e formata o valor como moeda."""
+    for cell, value in data_map.items():
+        try:
+            ws[cell] = value
+        except Exception:
+             pass # Ignora se a célula for o meio de uma mesclagem
+
+    # Formata o valor como moeda
+    try:
+        ws['K50'].number_format = CURRENCY_NUMBER_FORMAT
+    except:
+        pass 
+
+def _save_workbook_hashed(wb, path):
+    """
+    Salva o Workbook em `path` e retorna o SHA-256 do arquivo gravado. O hash é
+    calculado sobre os mesmos bytes escritos em disco, sem reler o arquivo.
+    """
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    data = buffer.getbuffer()
+    with open(path, 'wb') as f:
+        f.write(data)
+    return hashlib.sha256(data).hexdigest()
+
+# --- Spool local (ver transfer_queue.py) ---
+# Com um TransferQueue ativo, as notas são salvas na pasta local de spool e
+# copiadas para SAIDA_FOLDER em segundo plano.
+_output_spool = None
+
+def set_output_spool(spool):
+    """Ativa (TransferQueue) ou desativa (None) a gravação via spool local."""
+    global _output_spool
+    _output_spool = spool
+
+def resolve_output_path(output_path):
+    """Onde a nota está agora: no spool, se ainda não foi transferida, ou no destino."""
+    spool = _output_spool
+    return output_path if spool is None else spool.resolve(output_path)
+
+def _write_output(wb, output_path):
+    """
+    Salva a nota (temporário + rename) em output_path ou, com spool ativo, na cópia
+    local, agendando a transferência. Retorna o SHA-256 do arquivo.
+    """
+    spool = _output_spool
+    target = output_path if spool is None else spool.local_path(output_path)
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    tmp_path = target + ".tmp"
+    digest = _save_workbook_hashed(wb, tmp_path)
+    os.replace(tmp_path, target)
+    if spool is not None:
+        spool.submit(target)
+    return digest
+
+def _build_note_record(data_input, invoice_number, client_code, client_name, description_text, value_float, model_filename, supplier_name, output_path, sheet_title=None):
+    """Monta o registro de nota emitida gravado em NOTAS_EMITIDAS_FILE."""
+    record = {
+        "fatura": str(invoice_number),
+        "codigo_cliente": client_code,
+        "nome_cliente": client_name,
+        "fornecedor": supplier_name,
+        "modelo": model_filename,
+        "data": data_input,
+        "valor": value_float,
+        "descricao": description_text,
+        "arquivo": output_path,
+        "emitida_em": datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    if sheet_title:
+        record["planilha"] = sheet_title
+    return record
+
+def _build_base_name(client_name):
+    """Duas primeiras palavras do cliente, usadas no nome da planilha e do arquivo."""
+    cleaned_name = re.sub(r'[\\/?*\[\]\':]', '', client_name).strip()
+    name_parts = [p for p in cleaned_name.split() if p]
+    
+    if len(name_parts) >= 2:
+        return f"{name_parts[0]}_{name_parts[1]}"
+    elif len(name_parts) == 1:
+        return name_parts[0]
+    return "CLIENTE_SEM_NOME"
+
+def get_output_path(client_name, invoice_number):
+    """Caminho do arquivo de saída de uma nota (cliente + número da fatura)."""
+    return os.path.join(SAIDA_FOLDER, f"{_build_base_name(client_name)}_{invoice_number}.xlsx")
+
+def process_and_save_note(data_input, invoice_number, client_code, client_name, description_text, value_float, estado, model_filename, supplier_name, persist_estado=True, idempotency_key=None):
+    """
+    Carrega o modelo, preenche os dados e salva o novo arquivo XLSX, 
+    usando o modelo especificado.
+    Com persist_estado=False o estado é atualizado só em memória (quem chama
+    fica responsável por salvá-lo, ex.: lotes com faturas já reservadas).
+    Com idempotency_key, uma requisição já concluída com a mesma chave e o mesmo
+    conteúdo devolve o arquivo e a fatura registrados sem gerar nada nem avançar o
+    estado; com conteúdo diferente levanta IdempotencyConflict (ver idempotency.py).
+    Retorna (sucesso, caminho_ou_erro, fatura da nota).
+    """
+    if idempotency_key is None:
+        success, result = _process_and_save_note(data_input, invoice_number, client_code, client_name, description_text,
+                                                 value_float, estado, model_filename, supplier_name, persist_estado)
+        return success, result, str(invoice_number)
+
+    from idempotency import get_store, request_fingerprint
+
+    store = get_store()
+    fingerprint = request_fingerprint(data_input, client_code, client_name, description_text, value_float,
+                                      model_filename, supplier_name)
+    with store.hold(idempotency_key):
+        done = store.lookup(idempotency_key, fingerprint)
+        if done is not None:
+            return True, done["arquivo"], str(done.get("fatura", invoice_number))
+        success, result = _process_and_save_note(data_input, invoice_number, client_code, client_name, description_text,
+                                                 value_float, estado, model_filename, supplier_name, persist_estado)
+        if success:
+            store.record(idempotency_key, fingerprint, result, invoice_number)
+        return success, result, str(invoice_number)
+
+def _process_and_save_note(data_input, invoice_number, client_code, client_name, description_text, value_float, estado, model_filename, supplier_name, persist_estado):
+    """Geração propriamente dita (ver process_and_save_note)."""
+    # 1. Obter caminho do modelo (MODELO_FILE ou MODELO2_FILE)
+    model_path = _resolve_model_path(model_filename)
+    if model_path is None:
         return False, f"Erro Fatal: O arquivo modelo '{model_filename}' não foi encontrado nem pôde ser criado."
 
     try:
-        # Carrega o modelo usando o caminho obtido
-        wb = load_workbook(model_path)
+        # Carrega o modelo usando o caminho obtido (conteúdo em cache)
+        wb = _load_template_workbook(model_path)
         ws = wb.active
         
         # 2. Preparação dos Nomes (para Planilha e Arquivo)
-        cleaned_name = re.sub(r'[\\/?*\[\]\':]', '', client_name).strip()
-        name_parts = [p for p in cleaned_name.split() if p]
-        
-        if len(name_parts) >= 2:
-            base_name = f"{name_parts[0]}_{name_parts[1]}"
-        elif len(name_parts) == 1:
-            base_name = name_parts[0]
-        else:
-            base_name = "CLIENTE_SEM_NOME"
-
+        base_name = _build_base_name(client_name)
 
         # 2.1 Renomeia a Planilha (Tab)
-        sheet_name_raw = f"{base_name}_{invoice_number}"
-        new_sheet_name = sheet_name_raw[:31].replace(' ', '_')
-        ws.title = new_sheet_name
+        ws.title = _build_sheet_title(base_name, invoice_number)
 
         # 3. Preenchimento de Células
         
-        data_map = {
-            'H9': data_input, 
-            'K9': invoice_number, 
-            'A13': client_code, 
-            'J52': client_code, 
-            'A15': client_name, 
-            'G15': client_name, 
-            'B28': description_text, 
-            'K50': value_float, 
-            'L52': invoice_number, 
-        }
-        
-        # 3.1 Mapeamento Específico do Fornecedor/Modelo (NOVA LÓGICA)
-        # O nome do fornecedor é mapeado para E2 apenas se for o modelo2
-        if model_filename == "modelo2.xlsx":
-             data_map['E2'] = supplier_name 
-        # O modelo.xlsx não tem mapeamento especial, usa o PRODUZA.
-        elif model_filename == "modelo.xlsx":
-             # O mapeamento para E2 não é usado, mas a célula E2 no modelo.xlsx 
-             # deve ser preenchida com o nome fixo se a célula não estiver mesclada.
-             # Como o mapeamento é igual (exceto a célula extra), verificamos o 
-             # mapeamento original do modelo.xlsx na imagem que tem a PRODUZA na linha 2.
-             # Para ser fiel ao requisito:
-             pass # A célula E2:J3 no modelo.xlsx é ignorada pelo script.
-
-        for cell, value in data_map.items():
-            try:
-                ws[cell] = value
-            except Exception:
-                 pass # Ignora se a célula for o meio de uma mesclagem
-
-        # Formata o valor como moeda
-        try:
-            ws['K50'].number_format = 'R$ #,##0.00'
-        except:
-            pass 
+        data_map = _build_data_map(data_input, invoice_number, client_code, client_name,
+                                   description_text, value_float, model_filename, supplier_name)
+        _fill_note_sheet(ws, data_map)
 
         # 4. Define o Caminho de Saída (NOVA REGRA DE NOME DE ARQUIVO)
-        if not os.path.exists(SAIDA_FOLDER):
-            os.makedirs(SAIDA_FOLDER)
-
         # Usando as duas primeiras palavras do cliente + número da nota
-        output_filename = f"{base_name}_{invoice_number}.xlsx"
-        output_path = os.path.join(SAIDA_FOLDER, output_filename)
+        output_path = get_output_path(client_name, invoice_number)
         
-        # 5. Salva o Arquivo
-        wb.save(output_path)
+        # 5. Salva o Arquivo (com o SHA-256 para a verificação de integridade;
+        #    com spool ativo, a cópia para a pasta de saída é feita em segundo plano)
+        digest = _write_output(wb, output_path)
+
+        # 5.1 Registra a nota emitida (usado na exportação do arquivo mensal)
+        record = _build_note_record(
+            data_input, invoice_number, client_code, client_name, description_text,
+            value_float, model_filename, supplier_name, output_path,
+        )
+        record["sha256"] = digest
+        append_note_record(record)
 
         # 6. Atualiza o Estado (Próxima Fatura e Descrição)
         try:
             current_invoice = int(invoice_number)
-            estado['ultima_fatura'] = current_invoice + 1
-            estado['ultima_descricao'] = description_text
-            save_estado(estado)
+            # Uma fatura abaixo da sugerida (ex.: informada à mão) não faz a numeração retroceder
+            if persist_estado:
+                with estado_lock():
+                    sync_estado(estado)
+                    estado['ultima_fatura'] = max(int(estado.get('ultima_fatura', 0)), current_invoice + 1)
+                    estado['ultima_descricao'] = description_text
+                    save_estado(estado)
+            else:
+                estado['ultima_fatura'] = max(int(estado.get('ultima_fatura', 0)), current_invoice + 1)
+                estado['ultima_descricao'] = description_text
         except ValueError:
             pass 
 
@@ -237,3 +553,115 @@ def process_and_save_note(data_input, invoice_number, client_code, client_name,
 
     except Exception as e:
         return False, f"Erro ao processar o arquivo XLSX: {e}"
+
+
+# --- Saída Consolidada (uma pasta de trabalho com uma aba por nota) ---
+
+class ConsolidatedWorkbook:
+    """
+    Acumula várias notas como abas de uma única pasta de trabalho.
+    O modelo é lido uma vez; cada aba é uma cópia da planilha do modelo dentro do
+    mesmo Workbook, então estilos e mesclagens são reaproveitados (os estilos ficam
+    na tabela compartilhada do arquivo). O arquivo é salvo uma única vez, no final.
+    """
+
+    def __init__(self, model_filename):
+        model_path = _resolve_model_path(model_filename)
+        if model_path is None:
+            raise FileNotFoundError(f"O arquivo modelo '{model_filename}' não foi encontrado nem pôde ser criado.")
+        self.model_filename = model_filename
+        self._wb = _load_template_workbook(model_path)
+        self._template_ws = self._wb.active
+        # Image._data() fecha o arquivo da imagem: os bytes do modelo são lidos uma vez só
+        self._template_images = [(image._data(), image) for image in self._template_ws._images]
+        self._titles = {name.lower() for name in self._wb.sheetnames}
+        self.records = []
+        self._idempotency = [] # (chave, impressão digital, fatura) das notas desta pasta
+        self._holds = contextlib.ExitStack() # chaves seguradas de add_note até save/close
+
+    def _unique_title(self, title):
+        """Evita colisão de nomes de aba (o Excel não diferencia maiúsculas)."""
+        candidate = title
+        counter = 2
+        while candidate.lower() in self._titles:
+            suffix = f"_{counter}"
+            candidate = title[:31 - len(suffix)] + suffix
+            counter += 1
+        self._titles.add(candidate.lower())
+        return candidate
+
+    def _copy_images(self, ws):
+        """copy_worksheet não copia imagens (ex.: logotipo); replica as do modelo."""
+        from copy import copy
+        from openpyxl.drawing.image import Image
+
+        for data, image in self._template_images:
+            clone = Image(io.BytesIO(data))
+            clone.anchor = copy(image.anchor)
+            clone.width, clone.height = image.width, image.height
+            ws.add_image(clone)
+
+    def add_note(self, data_input, invoice_number, client_code, client_name, description_text, value_float, supplier_name, idempotency_key=None):
+        """
+        Adiciona uma nota como nova aba. Retorna o título da aba criada, ou None se a
+        chave de idempotência já foi concluída com o mesmo conteúdo (a nota já existe).
+        A chave fica segurada (IdempotencyStore.hold) até save() ou close().
+        """
+        if idempotency_key is not None:
+            from idempotency import get_store, request_fingerprint
+
+            store = get_store()
+            fingerprint = request_fingerprint(data_input, client_code, client_name, description_text, value_float,
+                                              self.model_filename, supplier_name)
+            self._holds.enter_context(store.hold(idempotency_key))
+            if store.lookup(idempotency_key, fingerprint) is not None:
+                return None
+            self._idempotency.append((idempotency_key, fingerprint, invoice_number))
+        ws = self._wb.copy_worksheet(self._template_ws)
+        ws.title = self._unique_title(_build_sheet_title(_build_base_name(client_name), invoice_number))
+        self._copy_images(ws)
+        data_map = _build_data_map(data_input, invoice_number, client_code, client_name,
+                                   description_text, value_float, self.model_filename, supplier_name)
+        _fill_note_sheet(ws, data_map)
+        self.records.append(_build_note_record(
+            data_input, invoice_number, client_code, client_name, description_text,
+            value_float, self.model_filename, supplier_name, None, ws.title,
+        ))
+        return ws.title
+
+    def save(self, output_path):
+        """
+        Remove a aba do modelo, salva (tmp + rename, via spool se ativo), registra
+        as notas emitidas e libera as chaves de idempotência.
+        """
+        try:
+            if not self.records:
+                return
+            self._wb.remove(self._template_ws)
+            digest = _write_output(self._wb, output_path)
+            for record in self.records:
+                record["arquivo"] = output_path
+                record["sha256"] = digest
+                append_note_record(record)
+            if self._idempotency:
+                from idempotency import get_store
+
+                store = get_store()
+                for key, fingerprint, invoice_number in self._idempotency:
+                    store.record(key, fingerprint, output_path, invoice_number)
+        finally:
+            self.close()
+
+    def close(self):
+        """Libera as chaves de idempotência seguradas (ex.: pasta descartada por erro)."""
+        self._holds.close()
+
+def get_consolidated_output_path(supplier_name, data_input, first_invoice, last_invoice):
+    """
+    Pasta de trabalho consolidada: fornecedor + período (AAAA_MM) + faixa de faturas.
+    É uma pasta por fornecedor e período DENTRO DE CADA LOTE: um segundo lote do
+    mesmo período gera outra pasta (outra faixa de faturas) em vez de reabrir e
+    regravar uma pasta que pode já ter sido entregue à contabilidade.
+    """
+    period = f"{data_input[6:10]}_{data_input[3:5]}"
+    return os.path.join(SAIDA_FOLDER, f"{_build_base_name(supplier_name)}_{period}_{first_invoice}-{last_invoice}.xlsx")
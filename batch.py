@@ -0,0 +1,275 @@
+"""
+Geração de notas em lote a partir de CSV (ex.: exportação do ERP).
+
+O lote é validado por inteiro (validation.BatchValidator) antes de qualquer
+planilha ser aberta; só então as faturas são reservadas e as notas geradas,
+com checkpoint em journal (checkpoint.BatchJournal) para retomada.
+"""
+import csv
+import os
+import zipfile
+
+from backend_data import (
+    process_and_save_note, save_estado, estado_lock, sync_estado, get_output_path, resolve_output_path,
+    ConsolidatedWorkbook, get_consolidated_output_path, iter_note_records,
+)
+from validation import BatchValidator, number_invoices
+from idempotency import IdempotencyConflict, get_store
+from checkpoint import BatchJournal, new_journal_path
+
+BATCH_COLUMNS = ('data', 'fatura', 'codigo_cliente', 'fornecedor', 'valor', 'descricao')
+
+
+def read_batch_csv(path):
+    """
+    Lê o CSV do lote (separador ';' ou ',', cabeçalho na primeira linha) e retorna a
+    lista de linhas como dicts com os nomes de coluna em minúsculas.
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        header = f.readline()
+        delimiter = ';' if header.count(';') >= header.count(',') else ','
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter=delimiter)
+        reader.fieldnames = [(name or '').strip().lower() for name in reader.fieldnames or []]
+        return list(reader)
+
+
+def validate_batch(rows, clientes, fornecedores, estado, templates=()):
+    """Valida o lote inteiro. Retorna (notas, erros) — ver BatchValidator.validate."""
+    return BatchValidator(clientes, fornecedores, templates).validate(rows, estado['ultima_fatura'])
+
+
+def generate_note(note):
+    """
+    Gera uma nota de lote com fatura já reservada, sem gravar o estado.
+    Função de módulo para poder rodar em processos do pool de workers.
+    Retorna (linha, sucesso, fatura, caminho_ou_erro, final); a fatura é a já
+    emitida se a chave de idempotência da nota já tiver sido concluída, e final
+    indica uma falha que se repetiria com a mesma fatura (conflito de chave).
+    """
+    try:
+        success, path_or_error, invoice = process_and_save_note(
+            note['data'], note['fatura'], note['codigo_cliente'], note['nome_cliente'],
+            note['descricao'], note['valor'], {}, note['modelo'], note['fornecedor'],
+            persist_estado=False, idempotency_key=note.get('chave'),
+        )
+    except IdempotencyConflict as e:
+        return note['linha'], False, note['fatura'], str(e), True
+    return note['linha'], success, invoice, path_or_error, False
+
+
+def generate_consolidated(notes):
+    """
+    Gera um grupo de notas (mesmo fornecedor e período) como abas de uma única
+    pasta de trabalho, salva uma vez no final. Retorna os resultados por linha
+    (no formato de generate_note). Se uma chave do grupo conflitar, essa nota é
+    recusada e as demais falham sem resultado final, para a retomada gerá-las.
+    """
+    path = notes[0]['arquivo_consolidado']
+    stored = {}
+    book = None
+    try:
+        book = ConsolidatedWorkbook(notes[0]['modelo'])
+        for note in notes:
+            title = book.add_note(note['data'], note['fatura'], note['codigo_cliente'], note['nome_cliente'],
+                                  note['descricao'], note['valor'], note['fornecedor'], idempotency_key=note.get('chave'))
+            if title is None: # chave já concluída: a nota está no arquivo registrado, com a fatura registrada
+                done = get_store().completed(note['chave'])
+                stored[note['linha']] = (str(done.get('fatura', note['fatura'])), done['arquivo'])
+        book.save(path)
+    except Exception as e:
+        if book is not None:
+            book.close()
+        conflict = e.key if isinstance(e, IdempotencyConflict) else None
+        return [(n['linha'], False, n['fatura'], f"Erro ao gerar a pasta consolidada: {e}",
+                 conflict is not None and n.get('chave') == conflict) for n in notes]
+    return [(n['linha'], True) + stored.get(n['linha'], (n['fatura'], path)) + (False,) for n in notes]
+
+
+def assign_consolidated_outputs(notes):
+    """
+    Define a pasta de trabalho de destino das notas de fornecedores com saída
+    consolidada: uma por fornecedor e período (MM/AAAA) dentro do lote (lotes
+    diferentes do mesmo período geram pastas distintas; ver get_consolidated_output_path).
+    """
+    groups = {}
+    for note in notes:
+        if note.get('saida') == 'consolidada':
+            groups.setdefault((note['fornecedor'], note['data'][3:]), []).append(note)
+    for group in groups.values():
+        invoices = [int(n['fatura']) for n in group]
+        path = get_consolidated_output_path(group[0]['fornecedor'], group[0]['data'], min(invoices), max(invoices))
+        for note in group:
+            note['arquivo_consolidado'] = path
+
+
+def note_output_path(note):
+    """Arquivo onde a nota do lote é (ou será) gravada."""
+    return note.get('arquivo_consolidado') or get_output_path(note['nome_cliente'], note['fatura'])
+
+
+def is_output_complete(note):
+    """Indica se o arquivo da nota já existe (no destino ou no spool) e é um .xlsx íntegro (não truncado)."""
+    path = resolve_output_path(note_output_path(note))
+    return os.path.exists(path) and zipfile.is_zipfile(path)
+
+
+def write_results_csv(results, path):
+    """Grava o resultado por linha do lote: linha;status;fatura;arquivo_ou_erro."""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['linha', 'status', 'fatura', 'arquivo_ou_erro'])
+        for line, success, invoice, path_or_error in sorted(results, key=lambda r: r[0]):
+            writer.writerow([line, 'OK' if success else 'ERRO', invoice, path_or_error])
+
+
+def reserve_invoices(notes, estado):
+    """
+    Reserva de uma vez as faturas do lote: avança e grava o estado antes da geração,
+    para que nenhuma outra nota use esses números, mesmo se o lote for interrompido.
+
+    Tudo sob a trava do estado (backend_data.estado_lock), para que processos
+    diferentes (aplicativo, linha de comando, daemons) nunca reservem a mesma faixa:
+    o estado é relido do disco e, se outro processo avançou a numeração depois da
+    validação, as notas numeradas automaticamente são renumeradas a partir dela.
+    As faturas informadas no lote (e as de um journal reaberto) não mudam.
+    """
+    if not notes:
+        return
+    with estado_lock():
+        sync_estado(estado)
+        if any(n.get('fatura_automatica') for n in notes):
+            number_invoices(notes, estado['ultima_fatura'])
+        for note in notes:
+            note.pop('fatura_automatica', None)
+        highest = max(int(n['fatura']) for n in notes) + 1
+        # Faturas informadas fora de ordem não podem fazer a numeração retroceder
+        if int(estado['ultima_fatura']) < highest:
+            estado['ultima_fatura'] = highest
+            estado['ultima_descricao'] = notes[-1]['descricao']
+            save_estado(estado)
+
+
+def _issued_since(journal):
+    """(fatura, arquivo) das notas emitidas depois da criação do journal."""
+    created = journal.header.get('criado_em', '')
+    return {(str(r.get('fatura')), r.get('arquivo')) for r in iter_note_records()
+            if r.get('emitida_em', '') >= created}
+
+
+def _completed_by_key(note, path):
+    """Indica se o arquivo da nota é o registrado para a sua chave de idempotência (mesma fatura)."""
+    if not note.get('chave'):
+        return False
+    done = get_store().completed(note['chave'])
+    return done is not None and done.get('arquivo') == path and str(done.get('fatura')) == str(note['fatura'])
+
+
+def execute_journal(journal, map_func=map, archive=True):
+    """
+    Gera as notas do journal que ainda não têm resultado final e registra cada resultado.
+
+    - linhas concluídas com arquivo presente e íntegro: puladas;
+    - linhas concluídas cujo arquivo sumiu: regeradas com a MESMA fatura (com aviso);
+    - linhas recusadas (falha final, ver checkpoint): puladas, com o erro registrado;
+    - linhas cuja chave de idempotência já foi concluída com esse arquivo e essa
+      fatura (repetição do lote): dadas como concluídas, sem regerar;
+    - na retomada, linhas sem entrada (perdidas no último grupo antes da queda)
+      cujo arquivo existe, está íntegro e foi registrado em notas emitidas depois
+      da criação do journal: dadas como concluídas, sem regerar;
+    - demais linhas cujo arquivo de destino já existe: recusadas, sem sobrescrever
+      (arquivo de outra emissão com a mesma fatura);
+    - linhas com ERRO de uma execução anterior: geradas de novo, com a MESMA fatura.
+
+    Quando toda linha está OK ou recusada, o journal recebe o FIM e, com archive, é
+    arquivado (ver BatchJournal.archive). Uma falha de geração (disco cheio, modelo
+    ilegível) deixa o journal aberto: a retomada tenta de novo com a fatura reservada.
+
+    map_func permite usar o map de um pool de workers (ex.: executor.map).
+    Retorna a lista de resultados (linha, sucesso, fatura, caminho_ou_erro) do lote todo.
+    """
+    results = []
+    pending = []
+    issued = None
+    for note in journal.notes:
+        done = journal.completed.get(note['linha'])
+        path = note_output_path(note)
+        if done is not None and done[0]:
+            if is_output_complete(note):
+                results.append((note['linha'], True, note['fatura'], path))
+                continue
+            print(f"AVISO: o arquivo da fatura {note['fatura']} (linha {note['linha']}) não foi encontrado; gerando novamente.")
+        elif done is not None and journal.is_final(note['linha']):
+            results.append((note['linha'], False, note['fatura'], done[2]))
+            continue
+        elif os.path.exists(resolve_output_path(path)):
+            if _completed_by_key(note, path):
+                journal.record(note['linha'], True, note['fatura'], path)
+                results.append((note['linha'], True, note['fatura'], path))
+                continue
+            if journal.reopened and is_output_complete(note):
+                if issued is None:
+                    issued = _issued_since(journal)
+                if (str(note['fatura']), path) in issued:
+                    journal.record(note['linha'], True, note['fatura'], path)
+                    results.append((note['linha'], True, note['fatura'], path))
+                    continue
+            result = (note['linha'], False, note['fatura'], f"O arquivo {path} já existe; a nota não foi gerada.")
+            journal.record(*result, final=True)
+            results.append(result)
+            continue
+        pending.append(note)
+
+    singles = [n for n in pending if not n.get('arquivo_consolidado')]
+    groups = {}
+    for note in pending:
+        if note.get('arquivo_consolidado'):
+            groups.setdefault(note['arquivo_consolidado'], []).append(note)
+
+    try:
+        for result in map_func(generate_note, singles):
+            journal.record(*result)
+            results.append(result[:4])
+        for group_results in map_func(generate_consolidated, list(groups.values())):
+            for result in group_results:
+                journal.record(*result)
+                results.append(result[:4])
+    finally:
+        journal.close(finished=all(journal.is_final(n['linha']) for n in journal.notes))
+    if journal.finished and archive:
+        journal.archive()
+    return sorted(results, key=lambda r: r[0])
+
+
+def start_journal(notes, estado, journal_path, origem=""):
+    """Reserva as faturas, define as saídas consolidadas e cria o journal do lote."""
+    reserve_invoices(notes, estado)
+    assign_consolidated_outputs(notes)
+    return BatchJournal.create(journal_path, notes, origem)
+
+
+def run_batch(notes, estado, journal_path=None, origem=""):
+    """
+    Gera as notas já validadas com checkpoint: reserva as faturas, cria o journal
+    e gera as notas registrando cada resultado. Se o processo cair, resume_batch()
+    continua do ponto exato da falha.
+    Retorna a lista de resultados (linha, sucesso, fatura, caminho_ou_erro), na ordem do lote.
+    """
+    journal = start_journal(notes, estado, journal_path or new_journal_path(), origem)
+    return execute_journal(journal)
+
+
+def reopen_journal(journal_path, estado):
+    """
+    Abre o journal de um lote interrompido para retomada, sem renumerar nada: as
+    faturas vêm do cabeçalho. Garante a reserva mesmo que o estado tenha sido
+    restaurado de um backup (na GUI, chamar na thread do Tk, como start_journal).
+    """
+    journal = BatchJournal.open(journal_path)
+    reserve_invoices(journal.notes, estado)
+    return journal
+
+
+def resume_batch(journal_path, estado, map_func=map):
+    """Retoma um lote interrompido a partir do seu journal (ver reopen_journal)."""
+    return execute_journal(reopen_journal(journal_path, estado), map_func)
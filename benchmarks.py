@@ -0,0 +1,446 @@
+"""
+Benchmarks de desempenho do gestor de notas de crédito.
+
+Uso:
+    python benchmarks.py memoria-clientes [--tamanhos 10000 100000 1000000]
+    python benchmarks.py consolidada [--notas 500] [--modelo modelo2.xlsx]
+    python benchmarks.py busca-clientes [--clientes 100000] [--repeticoes 20]
+    python benchmarks.py spool [--notas 50] [--latencia 0.2] [--falhas 0.2]
+    python benchmarks.py descricoes [--linhas 20000] [--valores 500]
+    python benchmarks.py abertura [--clientes 100000] [--repeticoes 5]
+    python benchmarks.py snapshot [--clientes 100000] [--repeticoes 5]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def _fake_client_records(n):
+    """Gera n clientes sintéticos no formato de clientes.json."""
+    return [
+        {"codigo": str(6000 + i), "nome": f"WR FILIAL {i} COMERCIO DE INSUMOS AGRICOLAS LTDA"}
+        for i in range(n)
+    ]
+
+
+_NAME_PARTS = (
+    ["WR", "AGRO", "COMERCIAL", "CEREALISTA", "COOPERATIVA", "DISTRIBUIDORA", "CASA", "FAZENDA", "AGROPECUÁRIA", "GRÃOS"],
+    ["SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "PEREIRA", "LIMA", "FERREIRA", "COSTA", "RODRIGUES", "ALMEIDA",
+     "CARVALHO", "GOMES", "ARAÚJO", "RIBEIRO", "SCHMITT", "KLEIN", "WEBER", "MÜLLER", "BECKER", "HOFFMANN",
+     "ZANATTA", "BORTOLINI", "DALLA COSTA"],
+    ["CACHOEIRA DO SUL", "CARAZINHO", "PASSO FUNDO", "CRUZ ALTA", "IJUÍ", "SANTA ROSA", "SANTO ÂNGELO",
+     "NÃO-ME-TOQUE", "PALMEIRA DAS MISSÕES", "ERECHIM", "FREDERICO WESTPHALEN"],
+    ["COMÉRCIO DE INSUMOS AGRÍCOLAS LTDA", "INSUMOS LTDA", "ME", "EIRELI", "E CIA LTDA", "AGRONEGÓCIOS S.A.", ""],
+)
+
+
+def _varied_client_records(n, seed=1):
+    """n clientes com nomes parecidos entre si (o caso difícil para a busca)."""
+    rng = random.Random(seed)
+    prefixes, surnames, cities, suffixes = _NAME_PARTS
+    return [
+        {"codigo": str(10000 + i * 7),
+         "nome": f"{rng.choice(prefixes)} {rng.choice(surnames)} {rng.choice(surnames)} {rng.choice(cities)} {rng.choice(suffixes)}".strip()}
+        for i in range(n)
+    ]
+
+
+def _rss_bytes():
+    """Memória residente do processo (Linux via /proc; None se indisponível)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _measure_client_case(kind, n):
+    """Mede, no processo atual, a memória para manter n clientes na representação dada."""
+    from client_registry import ClientRegistry, _client_object_hook
+
+    # Mesmo caminho da aplicação: parse do JSON e lista filtrada da GUI
+    payload = json.dumps(_fake_client_records(n))
+    rss_before = _rss_bytes()
+    tracemalloc.start()
+    if kind == "dict":
+        # Representação atual: lista de dicts + filtered_clients com as mesmas referências
+        clientes = json.loads(payload)
+        filtered = sorted(clientes, key=lambda c: c['codigo'].lower())
+    else:
+        clientes = ClientRegistry.from_records(json.loads(payload, object_hook=_client_object_hook))
+        filtered = list(clientes.sorted_by_code())
+    traced, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = _rss_bytes()
+    rss = None if rss_before is None else rss_after - rss_before
+    return {"tipo": kind, "clientes": n, "python_bytes": traced, "pico_bytes": peak, "rss_bytes": rss,
+            "_keep": len(clientes) + len(filtered)}
+
+
+def bench_client_memory(sizes):
+    """Compara lista de dicts x ClientRegistry, cada caso num subprocesso limpo."""
+    print(f"{'clientes':>10} | {'tipo':>9} | {'heap Python (MB)':>16} | {'pico (MB)':>9} | {'RSS (MB)':>9}")
+    for n in sizes:
+        results = {}
+        for kind in ("dict", "registro"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "_caso-memoria", kind, str(n)],
+                capture_output=True, text=True, check=True,
+            )
+            results[kind] = json.loads(out.stdout)
+            r = results[kind]
+            rss = "n/d" if r["rss_bytes"] is None else f"{r['rss_bytes'] / 1e6:9.1f}"
+            print(f"{n:>10} | {kind:>9} | {r['python_bytes'] / 1e6:16.1f} | {r['pico_bytes'] / 1e6:9.1f} | {rss:>9}")
+        ratio = results["registro"]["python_bytes"] / results["dict"]["python_bytes"]
+        print(f"{'':>10}   registro usa {ratio:.0%} da memória da lista de dicts")
+
+
+def bench_consolidated(n_notes, model_filename):
+    """Vazão: N arquivos separados x uma pasta de trabalho com N abas (saídas em pasta temporária)."""
+    import backend_data
+
+    notes = [
+        ("30/09/2026", str(1000 + i), str(6000 + i), f"WR FILIAL {i} COMERCIO DE INSUMOS AGRICOLAS LTDA",
+         "BONIFICAÇÃO POR VOLUME DE COMPRAS CONFORME ACORDO COMERCIAL DO PERÍODO.", 1234.56 + i)
+        for i in range(n_notes)
+    ]
+    supplier = "BAYER S/A"
+    original_saida = backend_data.SAIDA_FOLDER
+    original_log = backend_data.NOTAS_EMITIDAS_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        backend_data.SAIDA_FOLDER = os.path.join(tmp, "saida")
+        backend_data.NOTAS_EMITIDAS_FILE = os.path.join(tmp, "notas.jsonl")
+        try:
+            backend_data.prewarm([{"modelo": model_filename}])  # mesma condição "quente" nos dois casos
+
+            start = time.perf_counter()
+            for data, fatura, codigo, nome, desc, valor in notes:
+                ok, msg, _ = backend_data.process_and_save_note(
+                    data, fatura, codigo, nome, desc, valor, {}, model_filename, supplier, persist_estado=False)
+                if not ok:
+                    raise RuntimeError(msg)
+            separate = time.perf_counter() - start
+
+            start = time.perf_counter()
+            book = backend_data.ConsolidatedWorkbook(model_filename)
+            for data, fatura, codigo, nome, desc, valor in notes:
+                book.add_note(data, fatura, codigo, nome, desc, valor, supplier)
+            book.save(os.path.join(tmp, "consolidada.xlsx"))
+            consolidated = time.perf_counter() - start
+        finally:
+            backend_data.SAIDA_FOLDER = original_saida
+            backend_data.NOTAS_EMITIDAS_FILE = original_log
+
+    print(f"{n_notes} notas com {model_filename}:")
+    print(f"  arquivos separados : {separate:7.2f} s ({n_notes / separate:7.1f} notas/s)")
+    print(f"  pasta consolidada  : {consolidated:7.2f} s ({n_notes / consolidated:7.1f} notas/s)")
+    print(f"  ganho              : {separate / consolidated:7.2f}x")
+
+
+def bench_client_search(n_clients, repetitions):
+    """Tempo de montagem do índice e de consultas típicas (código, prefixo, acento, erro de digitação)."""
+    from client_registry import ClientRegistry
+
+    registry = ClientRegistry.from_records(_varied_client_records(n_clients))
+    start = time.perf_counter()
+    registry.prepare_search()
+    print(f"{n_clients} clientes: índice montado em {time.perf_counter() - start:.2f} s")
+
+    queries = ["10007", "1000", "comercio", "COMÉRCIO", "schmit carazinho", "mueller", "cachoera do sul",
+               "dala costa", "wr silva", "agropecuaria zanata", "ltda", "a", "xyz"]
+    print(f"{'busca':>22} | {'mediana (ms)':>12} | {'máx (ms)':>9} | {'resultados':>10}")
+    for query in queries:
+        timings = []
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            found = registry.search(query, limit=500) # mesmo limite da lista da GUI
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{query:>22} | {statistics.median(timings):12.2f} | {max(timings):9.2f} | {len(found):>10}")
+
+    # Edição incremental: o índice é atualizado sem ser remontado
+    start = time.perf_counter()
+    registry.update("10007", "10007", "CLIENTE RENOMEADO TESTE")
+    registry.add("999999", "OUTRO CLIENTE NOVO")
+    registry.remove("10014")
+    print(f"Edições no registro com o índice já montado (alterar, incluir, excluir): {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+def bench_spool(n_notes, latency, failure_rate, model_filename="modelo2.xlsx"):
+    """
+    Geração com a pasta de saída num "compartilhamento" simulado (pasta local com
+    atraso e falhas aleatórias na cópia): gravação direta x spool local.
+    """
+    import backend_data
+    from transfer_queue import TransferQueue
+
+    rng = random.Random(1)
+
+    def slow_copy(src, dst):
+        time.sleep(latency)
+        if rng.random() < failure_rate:
+            with open(dst, 'wb') as f:
+                f.write(b"PK") # simula a conexão caindo no meio da escrita
+            raise OSError("conexão perdida (simulada)")
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fdst.write(fsrc.read())
+
+    class SlowShareQueue(TransferQueue):
+        def _copy(self, src, dst):
+            slow_copy(src, dst)
+
+    original_saida = backend_data.SAIDA_FOLDER
+    original_log = backend_data.NOTAS_EMITIDAS_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        share = os.path.join(tmp, "compartilhamento")
+        backend_data.SAIDA_FOLDER = share
+        backend_data.NOTAS_EMITIDAS_FILE = os.path.join(tmp, "notas.jsonl")
+        queue = SlowShareQueue(os.path.join(tmp, "spool"), share, retry_delay=0.05, max_retry_delay=0.5, max_attempts=20)
+        try:
+            backend_data.prewarm([{"modelo": model_filename}])
+
+            def generate(i):
+                start = time.perf_counter()
+                ok, msg, _ = backend_data.process_and_save_note(
+                    "30/09/2026", str(1000 + i), str(6000 + i), f"WR FILIAL {i} COMERCIO",
+                    "BONIFICAÇÃO POR VOLUME", 100.0 + i, {}, model_filename, "BAYER S/A", persist_estado=False)
+                if not ok:
+                    raise RuntimeError(msg)
+                return msg, time.perf_counter() - start
+
+            # Direto: a nota só "termina" quando a cópia no compartilhamento termina (sem nova tentativa)
+            direct, direct_failures = [], 0
+            local = os.path.join(tmp, "local")
+            backend_data.SAIDA_FOLDER = local
+            for i in range(n_notes):
+                path, elapsed = generate(i)
+                start = time.perf_counter()
+                os.makedirs(share, exist_ok=True)
+                try:
+                    slow_copy(path, os.path.join(share, "direto_" + os.path.basename(path)))
+                except OSError:
+                    direct_failures += 1
+                direct.append(elapsed + time.perf_counter() - start)
+
+            backend_data.SAIDA_FOLDER = share
+            backend_data.set_output_spool(queue)
+            queue.start()
+            spooled = []
+            start_all = time.perf_counter()
+            for i in range(n_notes):
+                spooled.append(generate(n_notes + i)[1])
+            queue.wait_idle()
+            drained = time.perf_counter() - start_all
+            st = queue.status()
+            arrived = [name for name in os.listdir(share) if not name.startswith("direto_") and name.endswith(".xlsx")]
+        finally:
+            queue.stop()
+            backend_data.set_output_spool(None)
+            backend_data.SAIDA_FOLDER = original_saida
+            backend_data.NOTAS_EMITIDAS_FILE = original_log
+
+    print(f"{n_notes} notas, latência simulada {latency * 1000:.0f} ms por cópia, {failure_rate:.0%} de falhas:")
+    print(f"  direto : mediana {statistics.median(direct) * 1000:7.1f} ms por nota, {direct_failures} arquivo(s) truncado(s) no destino")
+    print(f"  spool  : mediana {statistics.median(spooled) * 1000:7.1f} ms por nota; fila esvaziada em {drained:.2f} s")
+    print(f"           {len(arrived)} nota(s) no destino, {st['falhas']} falha(s) definitiva(s)")
+
+
+def bench_descriptions(n_rows, n_values):
+    """Descrições com campos num lote: template compilado e valores em cache x formatação a cada linha."""
+    import description_templates as dt
+    from validation import BatchValidator
+
+    text = "BONIFICAÇÃO {periodo} - {fornecedor} - {cliente} ({codigo}): {valor} ({valor_extenso})."
+    rng = random.Random(1)
+    values = [rng.randint(100, 5_000_000) / 100 for _ in range(n_values)]
+    clients = _fake_client_records(1000)
+    notes = [{"nome_cliente": c['nome'], "codigo_cliente": c['codigo'], "fornecedor": "FORNECEDOR TESTE",
+              "data": "15/03/2025", "valor": rng.choice(values)} for c in (rng.choice(clients) for _ in range(n_rows))]
+
+    def naive(note):
+        # Reanalisa o texto e refaz os valores por extenso em toda linha
+        return text.format(cliente=note["nome_cliente"], codigo=note["codigo_cliente"], fornecedor=note["fornecedor"],
+                           data=note["data"], periodo=dt._period(note["data"]),
+                           valor=dt._format_cents.__wrapped__(round(note["valor"] * 100)),
+                           valor_extenso=dt._cents_in_words.__wrapped__(round(note["valor"] * 100)))
+
+    start = time.perf_counter()
+    expected = [naive(note) for note in notes]
+    naive_time = time.perf_counter() - start
+
+    dt._format_cents.cache_clear()
+    dt._cents_in_words.cache_clear()
+    dt.compile_template.cache_clear()
+    start = time.perf_counter()
+    template = dt.compile_template(text)
+    rendered = [template.render(note) for note in notes]
+    compiled_time = time.perf_counter() - start
+    assert rendered == expected
+
+    print(f"{n_rows} linhas, {n_values} valores distintos")
+    print(f"  formatação a cada linha:        {naive_time * 1000:8.1f} ms ({naive_time / n_rows * 1e6:.2f} µs/linha)")
+    print(f"  template compilado + cache:     {compiled_time * 1000:8.1f} ms ({compiled_time / n_rows * 1e6:.2f} µs/linha)")
+
+    # Validação completa do lote (inclui os campos por nota)
+    rows = [{"data": "15/03/2025", "codigo_cliente": c['codigo'], "fornecedor": "FORNECEDOR TESTE",
+             "valor": f"{v:.2f}".replace(".", ","), "descricao": text}
+            for c, v in ((rng.choice(clients), rng.choice(values)) for _ in range(n_rows))]
+    validator = BatchValidator(clients, [{"nome": "FORNECEDOR TESTE", "modelo": "modelo.xlsx"}])
+    start = time.perf_counter()
+    validated, errors = validator.validate(rows, 1)
+    elapsed = time.perf_counter() - start
+    print(f"  validação do lote com template: {elapsed * 1000:8.1f} ms ({len(validated)} notas, {len(errors)} erros)")
+
+
+def bench_startup(n_clients, repetitions):
+    """
+    Tempo até a janela ficar interativa: painéis de gestão e lista de clientes
+    montados depois da primeira pintura x tudo montado antes (precisa de display).
+    Cada abertura é um processo novo, numa pasta temporária com n clientes sintéticos.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    app = os.path.join(here, "CreditNoteApp.py")
+    modes = (("montagem adiada", []), ("tudo antes", ["--paineis-imediatos"]))
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("estado.json", "templates.json", "fornecedores.json"):
+            if os.path.exists(os.path.join(here, name)):
+                shutil.copy(os.path.join(here, name), tmp)
+        with open(os.path.join(tmp, "clientes.json"), "w", encoding="utf-8") as f:
+            json.dump(_varied_client_records(n_clients), f)
+
+        print(f"{n_clients} clientes, mediana de {repetitions} aberturas (ms desde o início do processo)")
+        for label, flags in modes:
+            samples = []
+            for _ in range(repetitions):
+                out = subprocess.run([sys.executable, app, "--medir-abertura", *flags], cwd=tmp,
+                                     capture_output=True, text=True, check=True)
+                samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+            interactive = statistics.median(s["interativa_ms"] for s in samples)
+            complete = statistics.median(s["completa_ms"] for s in samples)
+            print(f"  {label:<16} interativa: {interactive:8.1f} ms   montagem completa: {complete:8.1f} ms")
+
+
+def _measure_snapshot_case(kind):
+    """
+    Mede, no processo atual (novo, pasta com clientes.json), o tempo até os clientes
+    estarem prontos para a GUI: registro, ordem por código e índice de busca.
+    """
+    from client_registry import load_clientes_registry, refresh_clientes_snapshot
+
+    if kind == "gravar":
+        start = time.perf_counter()
+        saved = refresh_clientes_snapshot()
+        return {"tipo": kind, "gravado": saved, "ms": (time.perf_counter() - start) * 1000}
+    start = time.perf_counter()
+    registry = load_clientes_registry(use_snapshot=kind == "snapshot")
+    registry.sorted_by_code() # o que a janela precisa para abrir
+    loaded = time.perf_counter() - start
+    registry.prepare_search()
+    ready = time.perf_counter() - start
+    return {"tipo": kind, "clientes": len(registry), "carga_ms": loaded * 1000, "pronto_ms": ready * 1000,
+            "amostra": [c.nome for c in registry.search("schmit carazinho", limit=5)]}
+
+
+def bench_snapshot(n_clients, repetitions):
+    """Abertura a frio (processo novo): parse do clientes.json + índice x snapshot binário validado."""
+    from snapshot_cache import snapshot_path
+
+    def run(kind, cwd):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "_caso-snapshot", kind],
+                             cwd=cwd, capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "clientes.json")
+        with open(source, "w", encoding="utf-8") as f:
+            json.dump(_varied_client_records(n_clients), f, indent=4, ensure_ascii=False) # como _save_json_file
+        written = run("gravar", tmp)
+        snapshot_size = os.path.getsize(os.path.join(tmp, snapshot_path("clientes.json")))
+        print(f"{n_clients} clientes: clientes.json {os.path.getsize(source) / 1e6:.1f} MB, "
+              f"snapshot {snapshot_size / 1e6:.1f} MB (gravado em segundo plano em {written['ms']:.0f} ms)")
+
+        results = {}
+        print(f"{'carga':>26} | {'lista (ms)':>10} | {'pronto p/ busca (ms)':>20}")
+        for kind, label in (("json", "JSON (parse + índice)"), ("snapshot", "snapshot validado")):
+            samples = [run(kind, tmp) for _ in range(repetitions)]
+            results[kind] = samples[-1]
+            print(f"{label:>26} | {statistics.median(r['carga_ms'] for r in samples):10.1f} | "
+                  f"{statistics.median(r['pronto_ms'] for r in samples):20.1f}")
+        assert results["json"]["amostra"] == results["snapshot"]["amostra"]
+
+        # Origem alterada: o snapshot é descartado e a carga volta ao JSON
+        with open(source, "a", encoding="utf-8") as f:
+            f.write("\n")
+        stale = run("snapshot", tmp)
+        print(f"{'origem alterada -> JSON':>26} | {stale['carga_ms']:10.1f} | {stale['pronto_ms']:20.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do gestor de notas de crédito.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("memoria-clientes", help="Memória: lista de dicts x ClientRegistry.")
+    p.add_argument("--tamanhos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+
+    p = sub.add_parser("consolidada", help="Vazão: arquivos separados x pasta de trabalho consolidada.")
+    p.add_argument("--notas", type=int, default=500)
+    p.add_argument("--modelo", default="modelo2.xlsx")
+
+    p = sub.add_parser("busca-clientes", help="Latência da busca ranqueada de clientes.")
+    p.add_argument("--clientes", type=int, default=100_000)
+    p.add_argument("--repeticoes", type=int, default=20)
+
+    p = sub.add_parser("spool", help="Latência por nota: gravação direta x spool local com transferência.")
+    p.add_argument("--notas", type=int, default=50)
+    p.add_argument("--latencia", type=float, default=0.2, help="Atraso simulado por cópia (s).")
+    p.add_argument("--falhas", type=float, default=0.2, help="Fração de cópias que falham (simulado).")
+
+    p = sub.add_parser("descricoes", help="Descrições com campos: template compilado x formatação por linha.")
+    p.add_argument("--linhas", type=int, default=20_000)
+    p.add_argument("--valores", type=int, default=500)
+
+    p = sub.add_parser("abertura", help="Tempo até a janela ficar interativa: montagem adiada x tudo antes.")
+    p.add_argument("--clientes", type=int, default=100_000)
+    p.add_argument("--repeticoes", type=int, default=5)
+
+    p = sub.add_parser("snapshot", help="Abertura a frio: clientes.json + índice x snapshot binário.")
+    p.add_argument("--clientes", type=int, default=100_000)
+    p.add_argument("--repeticoes", type=int, default=5)
+
+    p = sub.add_parser("_caso-snapshot")  # uso interno (subprocesso)
+    p.add_argument("tipo", choices=["json", "snapshot", "gravar"])
+
+    p = sub.add_parser("_caso-memoria")  # uso interno (subprocesso)
+    p.add_argument("tipo")
+    p.add_argument("n", type=int)
+
+    args = parser.parse_args(argv)
+    if args.bench == "memoria-clientes":
+        bench_client_memory(args.tamanhos)
+    elif args.bench == "consolidada":
+        bench_consolidated(args.notas, args.modelo)
+    elif args.bench == "busca-clientes":
+        bench_client_search(args.clientes, args.repeticoes)
+    elif args.bench == "spool":
+        bench_spool(args.notas, args.latencia, args.falhas)
+    elif args.bench == "descricoes":
+        bench_descriptions(args.linhas, args.valores)
+    elif args.bench == "abertura":
+        bench_startup(args.clientes, args.repeticoes)
+    elif args.bench == "snapshot":
+        bench_snapshot(args.clientes, args.repeticoes)
+    elif args.bench == "_caso-snapshot":
+        print(json.dumps(_measure_snapshot_case(args.tipo)))
+    elif args.bench == "_caso-memoria":
+        print(json.dumps(_measure_client_case(args.tipo, args.n)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Operações em massa sobre clientes, fornecedores e templates.
+
+Cada operação é primeiro planejada (plan_*), sem alterar nada: o plano lista as
+linhas afetadas (antes -> depois) para a prévia. Todas as alterações são
+validadas no planejamento; apply() aplica o plano inteiro de uma vez e devolve a
+função que desfaz a operação. Quem chama grava e redesenha a lista uma única vez
+no final (em vez de uma gravação e um redesenho por item, como nos modais).
+
+As funções de planejamento retornam (True, plano) ou (False, mensagem de erro).
+"""
+import re
+
+from description_templates import template_errors
+
+CLIENTES, FORNECEDORES, TEMPLATES = "clientes", "fornecedores", "templates"
+
+
+class BulkPlan:
+    """Alteração em massa planejada: linhas afetadas e a aplicação (com desfazer)."""
+
+    def __init__(self, dataset, title, rows, apply_func):
+        self.dataset = dataset # nome do conjunto de dados (o mesmo de _mark_dirty na GUI)
+        self.title = title
+        self.rows = rows # [(identificação, antes, depois)]; depois None = exclusão
+        self._apply_func = apply_func
+        self.applied = False
+
+    def __len__(self):
+        return len(self.rows)
+
+    def preview(self, limit=None):
+        """Texto da prévia: uma linha por item afetado."""
+        shown = self.rows if limit is None else self.rows[:limit]
+        lines = [f"{self.title} — {len(self.rows)} item(ns):"]
+        for key, before, after in shown:
+            lines.append(f"[{key}] {before}  ->  EXCLUIR" if after is None else f"[{key}] {before}  ->  {after}")
+        if limit is not None and len(self.rows) > limit:
+            lines.append(f"... e mais {len(self.rows) - limit} item(ns).")
+        return "\n".join(lines)
+
+    def apply(self):
+        """Aplica todas as alterações. Retorna a função que desfaz a operação."""
+        if self.applied:
+            raise RuntimeError("Operação em massa já aplicada.")
+        self.applied = True
+        return self._apply_func()
+
+
+def _replacer(find, replace, ignore_case=True):
+    pattern = re.compile(re.escape(find), re.IGNORECASE if ignore_case else 0)
+    return lambda text: pattern.sub(lambda _: replace, text).strip()
+
+
+# --- Clientes ---
+
+def plan_client_rename(registry, codes, find, replace, ignore_case=True):
+    """Localizar e substituir no nome dos clientes selecionados."""
+    if not find:
+        return False, "Informe o texto a localizar."
+    substitute = _replacer(find, replace, ignore_case)
+    rows = []
+    for codigo in codes:
+        client = registry.get(codigo)
+        if client is None:
+            continue
+        new_name = substitute(client.nome)
+        if not new_name:
+            return False, f"O nome do cliente {codigo} ficaria vazio."
+        if new_name != client.nome:
+            rows.append((codigo, client.nome, new_name))
+    if not rows:
+        return False, f"Nenhum nome selecionado contém '{find}'."
+
+    def apply():
+        undo = registry.apply_bulk(renames={codigo: new for codigo, _, new in rows})
+        return lambda: registry.restore_bulk(undo)
+
+    return True, BulkPlan(CLIENTES, f"Substituir '{find}' por '{replace}'", rows, apply)
+
+
+def plan_client_delete(registry, codes, usage=None):
+    """Exclusão dos clientes selecionados (e do histórico de uso deles, se informado)."""
+    rows = [(c.codigo, c.nome, None) for c in (registry.get(codigo) for codigo in codes) if c is not None]
+    if not rows:
+        return False, "Nenhum cliente selecionado."
+
+    def apply():
+        undo = registry.apply_bulk(removals=[codigo for codigo, _, _ in rows])
+        usage_entries = {}
+        if usage is not None:
+            for codigo, _, _ in rows:
+                entry = usage.pop(codigo)
+                if entry is not None:
+                    usage_entries[codigo] = entry
+
+        def revert():
+            registry.restore_bulk(undo)
+            for codigo, entry in usage_entries.items():
+                usage.restore(codigo, entry)
+        return revert
+
+    return True, BulkPlan(CLIENTES, "Excluir clientes", rows, apply)
+
+
+# --- Listas de dicionários (fornecedores e templates) ---
+
+def _plan_field_change(dataset, title, items, key_field, names, field, new_value_func):
+    """Alteração de um campo nos itens selecionados; new_value_func(valor) -> (novo, erro)."""
+    selected = set(names)
+    changes = []
+    for item in items:
+        if item[key_field] not in selected:
+            continue
+        new_value, error = new_value_func(item[field])
+        if error:
+            return False, f"{item[key_field]}: {error}"
+        if new_value != item[field]:
+            changes.append((item, item[field], new_value))
+    if not changes:
+        return False, "Nenhum item selecionado seria alterado."
+
+    def apply():
+        for item, _, new_value in changes:
+            item[field] = new_value
+
+        def revert():
+            for item, old_value, _ in changes:
+                item[field] = old_value
+        return revert
+
+    rows = [(item[key_field], old, new) for item, old, new in changes]
+    return True, BulkPlan(dataset, title, rows, apply)
+
+
+def _plan_list_delete(dataset, title, items, key_field, names):
+    selected = set(names)
+    rows = [(item[key_field], item[key_field], None) for item in items if item[key_field] in selected]
+    if not rows:
+        return False, "Nenhum item selecionado."
+
+    def apply():
+        before = list(items)
+        items[:] = [item for item in items if item[key_field] not in selected]
+
+        def revert():
+            items[:] = before
+        return revert
+
+    return True, BulkPlan(dataset, title, rows, apply)
+
+
+def plan_supplier_model(fornecedores, names, model):
+    """Troca o arquivo modelo (.xlsx) dos fornecedores selecionados."""
+    model = model.strip().lower()
+    if not model.endswith('.xlsx'):
+        return False, "O nome do modelo deve terminar com '.xlsx'."
+    return _plan_field_change(FORNECEDORES, f"Trocar o modelo para '{model}'", fornecedores, 'nome', names,
+                              'modelo', lambda _: (model, None))
+
+
+def plan_template_replace(templates, names, find, replace, ignore_case=True):
+    """Localizar e substituir na descrição dos templates selecionados."""
+    if not find:
+        return False, "Informe o texto a localizar."
+    substitute = _replacer(find, replace, ignore_case)
+
+    def new_description(text):
+        new_text = substitute(text)
+        if not new_text:
+            return None, "a descrição ficaria vazia."
+        errors = template_errors(new_text)
+        return new_text, " ".join(errors) or None
+
+    return _plan_field_change(TEMPLATES, f"Substituir '{find}' por '{replace}'", templates, 'nome', names,
+                              'descricao', new_description)
+
+
+def plan_template_delete(templates, names):
+    return _plan_list_delete(TEMPLATES, "Excluir templates", templates, 'nome', names)
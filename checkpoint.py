@@ -0,0 +1,201 @@
+"""
+Journal de checkpoint dos lotes (retomada após queda de energia, disco cheio etc.).
+
+Formato (texto, uma entrada por linha):
+    1ª linha: cabeçalho JSON com a origem do lote e as notas com as faturas reservadas
+    demais:   OK<TAB>linha<TAB>fatura<TAB>arquivo   ou   ERRO|RECUSADA<TAB>linha<TAB>fatura<TAB>mensagem
+    última:   FIM<TAB>falhas (todas as linhas com resultado final; falhas = linhas RECUSADAS)
+
+ERRO é uma falha da geração (disco cheio, modelo ilegível...): o lote não chega
+ao FIM e, na retomada, a linha é gerada de novo com a fatura do cabeçalho.
+RECUSADA é uma falha que se repetiria com a mesma fatura (o arquivo de destino já
+existe, a chave de idempotência foi usada com outro conteúdo): é resultado final.
+Um lote em que toda linha está OK ou RECUSADA recebe o FIM e é arquivado em
+<pasta do journal>/concluidos, fora da lista de retomada.
+
+As entradas são sincronizadas em disco (fsync) em grupos, não a cada linha. Uma
+queda pode perder as últimas entradas do grupo, mas não a numeração: as faturas
+estão no cabeçalho, e na retomada uma nota sem entrada cujo arquivo já existe,
+está íntegro e foi registrado em notas emitidas depois da criação do journal é
+dada como concluída, sem ser refeita.
+"""
+import datetime
+import json
+import os
+import time
+
+CHECKPOINT_FOLDER = "Lotes_em_Andamento"
+JOURNAL_SUFFIX = ".journal"
+ARCHIVE_FOLDER = "concluidos" # journals finalizados, dentro da pasta do journal
+DEFAULT_GROUP_SIZE = 50
+DEFAULT_GROUP_SECONDS = 2.0
+_END_MARK = "FIM"
+_REFUSED = "RECUSADA"
+
+
+def _clean(text):
+    return str(text).replace("\t", " ").replace("\r", " ").replace("\n", " ")
+
+
+def new_journal_path(label="lote"):
+    """Caminho para um novo journal em CHECKPOINT_FOLDER (nome com data e hora)."""
+    os.makedirs(CHECKPOINT_FOLDER, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(CHECKPOINT_FOLDER, f"{label}_{stamp}{JOURNAL_SUFFIX}")
+
+
+def list_archived_journals(folder=CHECKPOINT_FOLDER, label=""):
+    """Journals finalizados e arquivados (ver BatchJournal.archive), opcionalmente só os de nome iniciado por `label`."""
+    archive = os.path.join(folder, ARCHIVE_FOLDER)
+    if not os.path.isdir(archive):
+        return []
+    return [os.path.join(archive, name) for name in sorted(os.listdir(archive))
+            if name.startswith(label) and name.endswith(JOURNAL_SUFFIX)]
+
+
+def list_incomplete_journals(folder=CHECKPOINT_FOLDER):
+    """Journals de lotes que não chegaram ao fim (candidatos à retomada)."""
+    if not os.path.isdir(folder):
+        return []
+    pending = []
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith(JOURNAL_SUFFIX):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            if not BatchJournal.open(path).finished:
+                pending.append(path)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao ler journal {path}: {e}")
+    return pending
+
+
+class BatchJournal:
+    """Journal de um lote: notas reservadas no cabeçalho e resultados por linha."""
+
+    def __init__(self, path, header, completed, finished, group_size, group_seconds):
+        self.path = path
+        self.header = header
+        self.completed = completed  # linha -> (sucesso, fatura, caminho_ou_erro)
+        self.refused = set() # linhas RECUSADAS (falha final, não retomada)
+        self.finished = finished
+        self.failures = None # linhas RECUSADAS, conhecidas quando o lote chega ao FIM
+        self.reopened = False # lido de um journal existente (retomada), não criado agora
+        self._group_size = group_size
+        self._group_seconds = group_seconds
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    @property
+    def notes(self):
+        return self.header['notas']
+
+    @classmethod
+    def create(cls, path, notes, origem="", group_size=DEFAULT_GROUP_SIZE, group_seconds=DEFAULT_GROUP_SECONDS):
+        """Cria o journal com as notas (faturas já reservadas) e o sincroniza em disco."""
+        header = {
+            "versao": 1,
+            "origem": origem,
+            "criado_em": datetime.datetime.now().isoformat(timespec='seconds'),
+            "notas": notes,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return cls(path, header, {}, False, group_size, group_seconds)
+
+    @classmethod
+    def open(cls, path, group_size=DEFAULT_GROUP_SIZE, group_seconds=DEFAULT_GROUP_SECONDS):
+        """Lê um journal existente. Uma última linha truncada (queda no meio da escrita) é ignorada."""
+        completed = {}
+        refused = set()
+        finished = False
+        failures = None
+        with open(path, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            for raw in f:
+                if not raw.endswith("\n"):
+                    break
+                line = raw.rstrip("\n")
+                if line.split("\t")[0] == _END_MARK:
+                    finished = True
+                    count = line.partition("\t")[2]
+                    failures = int(count) if count.isdigit() else None
+                    continue
+                parts = line.split("\t", 3)
+                if len(parts) != 4 or not parts[1].isdigit():
+                    continue
+                status, linha, fatura, info = parts
+                completed[int(linha)] = (status == "OK", fatura, info)
+                if status == _REFUSED:
+                    refused.add(int(linha))
+                else:
+                    refused.discard(int(linha))
+        journal = cls(path, header, completed, finished, group_size, group_seconds)
+        journal.refused = refused
+        journal.reopened = True
+        if finished:
+            # Journals antigos terminam só com "FIM": conta as falhas pelas entradas
+            journal.failures = failures if failures is not None else sum(1 for r in completed.values() if not r[0])
+        return journal
+
+    def record(self, linha, success, fatura, path_or_error, final=False):
+        """
+        Registra o resultado de uma linha; o fsync acontece a cada grupo de entradas.
+        Uma falha com final=True é RECUSADA (não retomada); sem ele, ERRO (retomada).
+        """
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        status = "OK" if success else (_REFUSED if final else "ERRO")
+        self._file.write(f"{status}\t{linha}\t{_clean(fatura)}\t{_clean(path_or_error)}\n")
+        self.completed[int(linha)] = (success, fatura, path_or_error)
+        if status == _REFUSED:
+            self.refused.add(int(linha))
+        else:
+            self.refused.discard(int(linha))
+        self._unsynced += 1
+        if self._unsynced >= self._group_size or time.monotonic() - self._last_sync >= self._group_seconds:
+            self.sync()
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def is_final(self, linha):
+        """Indica se a linha já tem resultado final (OK ou RECUSADA)."""
+        result = self.completed.get(int(linha))
+        return result is not None and (result[0] or int(linha) in self.refused)
+
+    def close(self, finished=False):
+        """
+        Sincroniza as entradas pendentes. Com finished=True (toda linha com resultado
+        final, OK ou RECUSADA) marca o lote como concluído, com o número de falhas.
+        """
+        if finished:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self.failures = sum(1 for r in self.completed.values() if not r[0])
+            self._file.write(f"{_END_MARK}\t{self.failures}\n")
+            self._unsynced += 1
+            self.finished = True
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def archive(self):
+        """Move o journal finalizado para <pasta do journal>/concluidos (fora da lista de retomada)."""
+        if os.path.basename(os.path.dirname(self.path)) == ARCHIVE_FOLDER:
+            return # já arquivado (ex.: journal concluído retomado de novo pela linha de comando)
+        folder = os.path.join(os.path.dirname(self.path), ARCHIVE_FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        target = os.path.join(folder, os.path.basename(self.path))
+        os.replace(self.path, target)
+        self.path = target
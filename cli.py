@@ -0,0 +1,304 @@
+"""
+Linha de comando do gestor de notas de crédito (operações sem interface gráfica).
+
+Uso:
+    python cli.py [--perfil] <comando> ...   (--perfil grava um perfil de amostragem em perfis/)
+    python cli.py daemon [--pasta Entrada_ERP] [--workers 4] [--intervalo 5] [--uma-vez]
+    python cli.py lote arquivo.csv
+    python cli.py retomar [arquivo.journal]
+    python cli.py exportar-notas [--formato csv|jsonl] [--saida arquivo] [--reiniciar]
+    python cli.py verificar [--pasta Notas_de_Credito_Geradas] [--workers 16] [--completo]
+    python cli.py otimizar-modelos [modelo.xlsx ...] [--simular] [--forcar] [--desfazer]
+    python cli.py transferir [--status] [--workers 2]
+    python cli.py recorrencias [--periodo MM/AAAA] [--gerar] [--agora] [--repetir-falhas]
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import sys
+
+
+def _cmd_daemon(args):
+    from ingest_daemon import IngestDaemon
+
+    daemon = IngestDaemon(args.pasta, max_workers=args.workers, poll_seconds=args.intervalo,
+                          use_processes=not args.threads)
+    if args.uma_vez:
+        daemon.run_once()
+    else:
+        daemon.run_forever()
+    return 0
+
+
+def _print_results(results):
+    failures = [r for r in results if not r[1]]
+    for line, _, invoice, msg in failures:
+        print(f"Linha {line} (fatura {invoice}): {msg}")
+    print(f"{len(results) - len(failures)} nota(s) gerada(s), {len(failures)} falha(s).")
+    return 0 if not failures else 1
+
+
+def _cmd_lote(args):
+    from backend_data import load_estado, load_fornecedores, load_templates
+    from batch import read_batch_csv, validate_batch, run_batch
+    from client_registry import load_clientes_registry
+    from validation import format_errors
+
+    estado = load_estado()
+    notes, errors = validate_batch(read_batch_csv(args.arquivo), load_clientes_registry(), load_fornecedores(), estado,
+                                   load_templates())
+    if errors:
+        print(f"O lote tem {len(errors)} erro(s); nenhuma nota foi gerada.")
+        print(format_errors(errors))
+        return 2
+    return _print_results(run_batch(notes, estado, origem=args.arquivo))
+
+
+def _cmd_retomar(args):
+    from backend_data import load_estado
+    from batch import resume_batch
+    from checkpoint import list_incomplete_journals
+
+    journals = [args.journal] if args.journal else list_incomplete_journals()
+    if not journals:
+        print("Nenhum lote interrompido encontrado.")
+        return 0
+    status = 0
+    for journal_path in journals:
+        print(f"Retomando {journal_path}...")
+        status = max(status, _print_results(resume_batch(journal_path, load_estado())))
+    return status
+
+
+def _cmd_exportar_notas(args):
+    from export_feed import export_feed
+
+    ok, result = export_feed(args.saida, formato=args.formato, cursor_path=args.cursor,
+                             reiniciar=args.reiniciar, avancar=not args.simular)
+    if not ok:
+        print(result, file=sys.stderr)
+        return 1
+    # Com saída padrão o resumo vai para stderr, para não misturar com os dados
+    print(f"{result} nota(s) exportada(s).", file=sys.stderr if args.saida in (None, "-") else sys.stdout)
+    return 0
+
+
+def _cmd_verificar(args):
+    from integrity import verify_archive
+
+    ok, report = verify_archive(args.pasta, workers=args.workers, completo=args.completo)
+    if not ok:
+        print(report, file=sys.stderr)
+        return 1
+    for label, key in (("ALTERADA", "alteradas"), ("AUSENTE", "ausentes"), ("PENDENTE", "pendentes"),
+                       ("INESPERADA", "inesperadas"), ("SEM HASH", "sem_hash"), ("ERRO", "erros")):
+        for item in report[key]:
+            print(f"{label}: {item}")
+    print(f"{report['ok']} nota(s) íntegra(s), {len(report['alteradas'])} alterada(s), "
+          f"{len(report['ausentes'])} ausente(s), {len(report['pendentes'])} aguardando transferência, "
+          f"{len(report['inesperadas'])} inesperada(s), {len(report['sem_hash'])} sem hash registrado.")
+    print(f"{report['hasheadas']} arquivo(s) lido(s), {report['reaproveitadas']} sem alteração desde a última verificação.")
+    problems = report['alteradas'] or report['ausentes'] or report['inesperadas'] or report['erros']
+    return 1 if problems else 0
+
+
+def _cmd_otimizar_modelos(args):
+    from template_optimizer import optimize_template, remove_optimized_template, supplier_models
+
+    models = args.modelos or supplier_models()
+    if args.desfazer:
+        for model in models:
+            removed = remove_optimized_template(model)
+            print(f"{model}: {'voltou a usar o modelo original' if removed else 'não havia cópia otimizada'}.")
+        return 0
+
+    status = 0
+    for model in models:
+        ok, report = optimize_template(model, instalar=not args.simular, forcar=args.forcar)
+        if not ok:
+            print(report, file=sys.stderr)
+            status = 1
+            continue
+        removed = report["removidos"]
+        tables = ", ".join(f"{name} {before}->{after}" for name, (before, after) in removed["tabelas"].items() if before != after)
+        print(f"{model}: modelo {report['tamanho_original']} -> {report['tamanho']} bytes, "
+              f"nota {report['nota_original']} -> {report['nota']} bytes, "
+              f"salvar {report['salvar_ms_original']:.1f} -> {report['salvar_ms']:.1f} ms")
+        print(f"    removidos: {removed['celulas_vazias']} célula(s) vazia(s), {removed['textos_de_exemplo']} texto(s) de exemplo, "
+              f"{removed['nomes_quebrados']} nome(s) quebrado(s), {removed['propriedades']} propriedade(s); {tables or 'estilos já enxutos'}")
+        for difference in report["diferencas"]:
+            print(f"    DIFERENÇA: {difference}")
+        if report["total_diferencas"] > len(report["diferencas"]):
+            print(f"    ... e mais {report['total_diferencas'] - len(report['diferencas'])} diferença(s).")
+        if report["instalado"]:
+            print("    cópia otimizada instalada.")
+        elif not args.simular:
+            print("    cópia NÃO instalada (há diferenças visíveis; use --forcar para instalar assim mesmo).")
+            status = 1
+    return status
+
+
+def _cmd_transferir(args):
+    from transfer_queue import TransferQueue
+
+    queue = TransferQueue(max_workers=args.workers)
+    if args.status:
+        count = 0
+        if os.path.isdir(queue.spool_folder):
+            for root, _, files in os.walk(queue.spool_folder):
+                for name in files:
+                    if not name.endswith(".tmp"):
+                        print(f"PENDENTE: {queue.final_path(os.path.join(root, name))}")
+                        count += 1
+        print(f"{count} nota(s) aguardando transferência para {queue.destination}.")
+        return 0
+
+    queue.start()
+    try:
+        while not queue.wait_idle(timeout=2):
+            st = queue.status()
+            print(f"{st['transferidas']} transferida(s), {st['pendentes'] + st['em_andamento']} na fila...", file=sys.stderr)
+    finally:
+        queue.stop()
+    st = queue.status()
+    for local_path, error in queue.failed.items():
+        print(f"FALHA: {local_path}: {error}")
+    print(f"{st['transferidas']} nota(s) transferida(s), {st['falhas']} falha(s).")
+    return 1 if st['falhas'] else 0
+
+
+def _cmd_recorrencias(args):
+    from backend_data import load_estado, load_fornecedores, load_templates
+    from client_registry import load_clientes_registry
+    from recurrence import format_period, parse_period, is_off_peak, pregenerate, period_report, load_recorrencias
+
+    try:
+        periods = [format_period(*parse_period(args.periodo))] if args.periodo else None
+    except ValueError:
+        print(f"Período inválido '{args.periodo}'. Use MM/AAAA.", file=sys.stderr)
+        return 2
+
+    status = 0
+    if args.gerar:
+        # Agendado a cada hora, por exemplo: só gera na janela fora do pico (ou com --agora)
+        if not args.agora and not is_off_peak():
+            print("Horário de pico: nada gerado (use --agora para gerar assim mesmo).")
+            return 0
+        summary = pregenerate(load_estado(), load_clientes_registry(), load_fornecedores(), load_templates(),
+                              periods=periods, retry_failed=args.repetir_falhas)
+        if summary is None:
+            print("Outra pré-geração de notas recorrentes está em andamento.", file=sys.stderr)
+            return 1
+        for period, (results, errors) in summary.items():
+            failures = [r for r in results if not r[1]]
+            for name, msg in errors:
+                print(f"ERRO {period} {name}: {msg}")
+            for _, _, invoice, msg in failures:
+                print(f"FALHA {period} fatura {invoice}: {msg}")
+            print(f"{period}: {len(results) - len(failures)} nota(s) gerada(s), {len(failures)} falha(s), "
+                  f"{len(errors)} definição(ões) com erro.")
+            if failures or errors:
+                status = 1
+        periods = periods or [period for period in summary if period != "retomadas"]
+
+    definitions = load_recorrencias()
+    if not periods:
+        today = datetime.date.today()
+        periods = [format_period(today.year, today.month)]
+    for period in periods:
+        report = period_report(period, definitions)
+        for item in report:
+            print(f"{item['situacao'].upper():<10} {period} {item['fatura']:>8}  {item['nome']}  {item['arquivo']}")
+        done = sum(1 for item in report if item['situacao'] == 'gerada')
+        print(f"{period}: {done} de {len(report)} nota(s) recorrente(s) gerada(s).")
+    return status
+
+
+def build_parser():
+    from ingest_daemon import INGESTAO_FOLDER, DEFAULT_POLL_SECONDS
+    from export_feed import CURSOR_FILE, FORMATS
+    from integrity import DEFAULT_WORKERS
+    from transfer_queue import DEFAULT_TRANSFER_WORKERS
+
+    parser = argparse.ArgumentParser(description="Gestor de Notas de Crédito - linha de comando.")
+    parser.add_argument("--perfil", action="store_true",
+                        help="Perfila o comando por amostragem e grava .folded/.speedscope.json em perfis/.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("daemon", help="Monitora a pasta de entrada do ERP e gera as notas dos lotes CSV.")
+    p.add_argument("--pasta", default=INGESTAO_FOLDER, help="Pasta base (com entrada/processando/concluidos/falhas).")
+    p.add_argument("--workers", type=int, default=None, help="Máximo de notas geradas em paralelo.")
+    p.add_argument("--intervalo", type=float, default=DEFAULT_POLL_SECONDS, help="Segundos entre verificações da entrada.")
+    p.add_argument("--threads", action="store_true", help="Usa threads em vez de processos no pool de workers.")
+    p.add_argument("--uma-vez", action="store_true", help="Processa o que estiver na entrada e encerra.")
+    p.set_defaults(func=_cmd_daemon)
+
+    p = sub.add_parser("lote", help="Valida e gera um lote CSV com checkpoint.")
+    p.add_argument("arquivo", help="CSV com as colunas data;fatura;codigo_cliente;fornecedor;valor;descricao (template e chave opcionais).")
+    p.set_defaults(func=_cmd_lote)
+
+    p = sub.add_parser("retomar", help="Retoma lotes interrompidos a partir do journal de checkpoint.")
+    p.add_argument("journal", nargs="?", help="Journal específico (padrão: todos os lotes incompletos).")
+    p.set_defaults(func=_cmd_retomar)
+
+    p = sub.add_parser("exportar-notas", help="Exporta as notas emitidas desde a última exportação (conciliação com o ERP).")
+    p.add_argument("--formato", choices=FORMATS, default="csv", help="csv (separado por ;) ou jsonl.")
+    p.add_argument("--saida", default=None, help="Arquivo de saída (padrão: saída padrão).")
+    p.add_argument("--cursor", default=CURSOR_FILE, help="Arquivo com a posição da última exportação.")
+    p.add_argument("--reiniciar", action="store_true", help="Exporta todo o histórico, ignorando o cursor.")
+    p.add_argument("--simular", action="store_true", help="Exporta sem avançar o cursor.")
+    p.set_defaults(func=_cmd_exportar_notas)
+
+    p = sub.add_parser("verificar", help="Confere o SHA-256 das notas geradas (ausentes, alteradas, inesperadas).")
+    p.add_argument("--pasta", default=None, help="Pasta das notas (padrão: pasta de saída do sistema).")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Arquivos lidos em paralelo.")
+    p.add_argument("--completo", action="store_true", help="Relê todos os arquivos, ignorando o cache da última verificação.")
+    p.set_defaults(func=_cmd_verificar)
+
+    p = sub.add_parser("otimizar-modelos", help="Gera cópias enxutas dos modelos XLSX, usadas na geração das notas.")
+    p.add_argument("modelos", nargs="*", help="Modelos a otimizar (padrão: os usados pelos fornecedores).")
+    p.add_argument("--simular", action="store_true", help="Só compara e informa; não instala as cópias.")
+    p.add_argument("--forcar", action="store_true", help="Instala mesmo que a comparação encontre diferenças.")
+    p.add_argument("--desfazer", action="store_true", help="Remove as cópias otimizadas (volta aos modelos originais).")
+    p.set_defaults(func=_cmd_otimizar_modelos)
+
+    p = sub.add_parser("transferir", help="Copia para a pasta de saída as notas que ficaram no spool local.")
+    p.add_argument("--status", action="store_true", help="Só lista as notas aguardando transferência.")
+    p.add_argument("--workers", type=int, default=DEFAULT_TRANSFER_WORKERS, help="Cópias simultâneas.")
+    p.set_defaults(func=_cmd_transferir)
+
+    p = sub.add_parser("recorrencias", help="Confere e pré-gera as notas recorrentes (recorrencias.json).")
+    p.add_argument("--periodo", help="Período MM/AAAA (padrão: mês atual; com --gerar, os períodos próximos da emissão).")
+    p.add_argument("--gerar", action="store_true", help="Reserva as faturas e gera as notas pendentes.")
+    p.add_argument("--agora", action="store_true", help="Com --gerar: gera mesmo no horário de pico.")
+    p.add_argument("--repetir-falhas", action="store_true",
+                   help="Com --gerar: tenta de novo as notas recusadas (ex.: arquivo já existente), com uma nova "
+                        "fatura. Falhas de geração são retomadas sempre, com a fatura já reservada.")
+    p.set_defaults(func=_cmd_recorrencias)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    profiler = None
+    if args.perfil:
+        from sampling_profiler import SamplingProfiler
+
+        profiler = SamplingProfiler()
+        profiler.start()
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            folded, speedscope = profiler.save()
+            print(f"Perfil ({profiler.samples} amostras em {profiler.elapsed:.1f} s): {speedscope} e {folded}",
+                  file=sys.stderr)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support() # Necessário para o pool de processos no executável PyInstaller
+    sys.exit(main())
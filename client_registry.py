@@ -0,0 +1,378 @@
+"""
+Registro compacto de clientes.
+
+Substitui a lista de dicionários `{"codigo": ..., "nome": ...}` por objetos com
+`__slots__` (sem dicionário por instância) e um mapa `codigo` -> índice, mantendo
+o acesso no estilo dicionário (`cliente['codigo']`) usado pela GUI.
+
+Linhas de clientes.json sem código ou com código repetido não entram no registro
+(o código é a chave), mas são avisadas e mantidas como estão: voltam ao final do
+arquivo na próxima gravação, para serem corrigidas à mão.
+"""
+import json
+import os
+
+from backend_data import CLIENTES_FILE, get_file_version, _file_versions
+from client_search import ClientSearchIndex
+from snapshot_cache import load_snapshot, save_snapshot, source_key, is_current
+
+# Alterações em massa acima desta fração do cadastro descartam o índice de busca
+# (remontado de uma vez na próxima busca) em vez de atualizá-lo cliente a cliente
+BULK_REINDEX_FRACTION = 0.2
+
+
+class Client:
+    """Cliente com acesso por atributo ou por chave, como o dicionário original."""
+    __slots__ = ('codigo', 'nome')
+
+    def __init__(self, codigo, nome):
+        self.codigo = codigo
+        self.nome = nome
+
+    def __getitem__(self, key):
+        if key not in Client.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        # Alterar o código diretamente quebraria o índice do registro;
+        # use ClientRegistry.update para isso.
+        if key != 'nome':
+            raise KeyError(key)
+        self.nome = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return {"codigo": self.codigo, "nome": self.nome}
+
+    def __repr__(self):
+        return f"Client({self.codigo!r}, {self.nome!r})"
+
+
+class ClientRegistry:
+    """Coleção de clientes indexada por código, na ordem do arquivo JSON."""
+
+    def __init__(self):
+        self._clients = []
+        self._index = {}          # codigo -> posição em _clients
+        self._sorted_cache = None  # lista ordenada por código (invalidada em alterações)
+        self._search_index = None  # índice de busca (criado na primeira busca, depois incremental)
+        self._index_loader = None  # carrega o índice do snapshot (ver load_clientes_registry)
+        self._rejected = []        # linhas sem código ou com código repetido, mantidas para a gravação
+
+    @classmethod
+    def from_records(cls, records):
+        """Cria o registro a partir da lista de dicionários carregada do JSON."""
+        registry = cls()
+        rejected = []
+        for record in records:
+            original = record
+            if not isinstance(record, Client):
+                record = Client(str(record.get('codigo', '')).strip(), record.get('nome', ''))
+            if not record.codigo or record.codigo in registry._index:
+                rejected.append(record.to_dict() if original is record else dict(original))
+                continue
+            registry._index[record.codigo] = len(registry._clients)
+            registry._clients.append(record)
+        registry._set_rejected(rejected)
+        return registry
+
+    def _set_rejected(self, rejected):
+        """Guarda as linhas fora do registro (regravadas por to_records) e avisa quais são."""
+        self._rejected = rejected
+        if rejected:
+            sample = ", ".join(f"'{r.get('codigo', '')}' ({r.get('nome', '')})" for r in rejected[:5])
+            more = f" e mais {len(rejected) - 5}" if len(rejected) > 5 else ""
+            print(f"AVISO: {len(rejected)} cliente(s) sem código ou com código repetido ficaram fora do "
+                  f"cadastro (mantidos no arquivo): {sample}{more}")
+
+    def __getstate__(self):
+        """
+        Estado do snapshot (ver snapshot_cache): códigos e nomes em listas paralelas,
+        bem mais rápidas de carregar do que um objeto por cliente, e a ordem por
+        código como posições. O índice de busca vai numa seção à parte.
+        """
+        return {
+            'codigos': [c.codigo for c in self._clients],
+            'nomes': [c.nome for c in self._clients],
+            'ordem': None if self._sorted_cache is None else [self._index[c.codigo] for c in self._sorted_cache],
+            'rejeitados': self._rejected,
+        }
+
+    def __setstate__(self, state):
+        self.__init__()
+        self._clients = list(map(Client, state['codigos'], state['nomes']))
+        self._index = dict(zip(state['codigos'], range(len(self._clients))))
+        if state['ordem'] is not None:
+            self._sorted_cache = list(map(self._clients.__getitem__, state['ordem']))
+        self._rejected = state['rejeitados']
+
+    def to_records(self):
+        """Converte de volta para a lista de dicionários salva em clientes.json (com as linhas rejeitadas no final)."""
+        return [c.to_dict() for c in self._clients] + [dict(r) for r in self._rejected]
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __iter__(self):
+        return iter(self._clients)
+
+    def __contains__(self, codigo):
+        return codigo in self._index
+
+    def get(self, codigo):
+        """Retorna o cliente pelo código, ou None."""
+        idx = self._index.get(codigo)
+        return None if idx is None else self._clients[idx]
+
+    def add(self, codigo, nome):
+        """Cadastra um cliente. Retorna None se o código já existir."""
+        if codigo in self._index:
+            return None
+        client = Client(codigo, nome)
+        self._index[client.codigo] = len(self._clients)
+        self._clients.append(client)
+        self._sorted_cache = None
+        self._index_loader = None
+        if self._search_index is not None:
+            self._search_index.add(client)
+        return client
+
+    def update(self, original_codigo, codigo, nome):
+        """Altera código e nome de um cliente. Retorna False se o novo código já existir."""
+        idx = self._index.get(original_codigo)
+        if idx is None or (codigo != original_codigo and codigo in self._index):
+            return False
+        client = self._clients[idx]
+        if codigo != original_codigo:
+            del self._index[original_codigo]
+            client.codigo = codigo
+            self._index[client.codigo] = idx
+        client.nome = nome
+        self._sorted_cache = None
+        self._index_loader = None
+        if self._search_index is not None:
+            self._search_index.update(client)
+        return True
+
+    def remove(self, codigo):
+        """Exclui o cliente pelo código. Retorna o cliente removido, ou None."""
+        idx = self._index.pop(codigo, None)
+        if idx is None:
+            return None
+        client = self._clients.pop(idx)
+        for pos in range(idx, len(self._clients)):
+            self._index[self._clients[pos].codigo] = pos
+        self._sorted_cache = None
+        self._index_loader = None
+        if self._search_index is not None:
+            self._search_index.remove(client)
+        return client
+
+    def apply_bulk(self, renames=None, removals=()):
+        """
+        Aplica renomeações ({codigo: novo_nome}) e exclusões de uma vez: as posições
+        são refeitas numa única passada e o índice de busca é atualizado só no final.
+        Retorna os dados para restore_bulk desfazer a operação.
+        """
+        old_names = {}
+        for codigo, nome in (renames or {}).items():
+            client = self.get(codigo)
+            if client is not None and client.nome != nome:
+                old_names[codigo] = client.nome
+                client.nome = nome
+        removals = set(removals)
+        removed = [] # (posição original, cliente), em ordem crescente
+        if removals:
+            kept = []
+            for pos, client in enumerate(self._clients):
+                if client.codigo in removals:
+                    removed.append((pos, client))
+                else:
+                    kept.append(client)
+            self._clients = kept
+            self._index = {c.codigo: i for i, c in enumerate(kept)}
+        self._sorted_cache = None
+        self._index_loader = None
+        self._refresh_search_bulk([self.get(c) for c in old_names], [c for _, c in removed])
+        return old_names, removed
+
+    def restore_bulk(self, undo):
+        """Desfaz um apply_bulk: nomes anteriores e clientes excluídos de volta às posições originais."""
+        old_names, removed = undo
+        renamed = []
+        for codigo, nome in old_names.items():
+            client = self.get(codigo)
+            if client is not None:
+                client.nome = nome
+                renamed.append(client)
+        restored = []
+        for pos, client in removed:
+            if client.codigo not in self._index: # código recadastrado depois da exclusão: mantém o atual
+                self._clients.insert(min(pos, len(self._clients)), client)
+                restored.append(client)
+        if restored:
+            self._index = {c.codigo: i for i, c in enumerate(self._clients)}
+        self._sorted_cache = None
+        self._index_loader = None
+        self._refresh_search_bulk(renamed + restored, [])
+
+    def _refresh_search_bulk(self, changed, removed):
+        if self._search_index is None:
+            return
+        if len(changed) + len(removed) > len(self._clients) * BULK_REINDEX_FRACTION:
+            self._search_index = None # remontado na próxima busca (ou em prepare_search)
+            return
+        for client in removed:
+            self._search_index.remove(client)
+        for client in changed:
+            self._search_index.update(client)
+
+    def merge(self, records):
+        """
+        Mescla a lista recarregada do disco: clientes existentes são atualizados no
+        lugar (referências continuam válidas), novos entram e removidos saem.
+        """
+        current = self._index
+        old_clients = self._clients
+        self._clients = []
+        self._index = {}
+        rejected = []
+        for record in records:
+            codigo = str(record.get('codigo', '')).strip()
+            if not codigo or codigo in self._index:
+                rejected.append(dict(record))
+                continue
+            idx = current.get(codigo)
+            nome = record.get('nome', '')
+            if idx is not None:
+                client = old_clients[idx]
+                changed = client.nome != nome
+                client.nome = nome
+            else:
+                client = Client(codigo, nome)
+                changed = True
+            if changed and self._search_index is not None:
+                self._search_index.update(client)
+            self._index[client.codigo] = len(self._clients)
+            self._clients.append(client)
+        if self._search_index is not None:
+            for codigo, idx in current.items():
+                if codigo not in self._index:
+                    self._search_index.remove(old_clients[idx])
+        self._sorted_cache = None
+        self._index_loader = None
+        self._set_rejected(rejected)
+
+    def sorted_by_code(self):
+        """Clientes ordenados por código (cache reaproveitado até a próxima alteração)."""
+        if self._sorted_cache is None:
+            self._sorted_cache = sorted(self._clients, key=lambda c: c.codigo.lower())
+        return self._sorted_cache
+
+    def prepare_search(self):
+        """Monta o índice de busca agora (ex.: logo após abrir a janela), se ainda não existir."""
+        if self._search_index is None:
+            loader, self._index_loader = self._index_loader, None
+            index = loader() if loader is not None else None
+            self._search_index = index if index is not None else ClientSearchIndex(self._clients)
+
+    def search(self, text, limit=None, tie_break=None):
+        """
+        Busca ranqueada por código/nome, sem acentos e tolerante a erros de digitação
+        (ver client_search). O índice é montado na primeira chamada.
+        tie_break: codigo -> peso (maior primeiro) para desempatar, ex.: uso recente.
+        """
+        self.prepare_search()
+        boost = None
+        if tie_break:
+            boost = {}
+            for codigo, weight in tie_break.items():
+                client = self.get(codigo)
+                if client is not None:
+                    boost[client] = weight
+        return self._search_index.search(text, limit, boost)
+
+
+def _client_object_hook(obj):
+    """Converte cada objeto do JSON em Client durante o parse (sem dict intermediário)."""
+    if 'codigo' in obj:
+        return Client(str(obj['codigo']).strip(), obj.get('nome', ''))
+    return obj
+
+
+def load_clientes_registry(filename=CLIENTES_FILE, use_snapshot=True):
+    """
+    Carrega clientes.json direto para um ClientRegistry. Os dicionários do parse
+    são convertidos um a um, então o pico de memória fica próximo do tamanho final.
+    Se houver snapshot válido para a versão em disco (ver snapshot_cache), o
+    registro vem dele, já com o índice de busca montado.
+    """
+    _file_versions[filename] = get_file_version(filename)
+    if not os.path.exists(filename):
+        return ClientRegistry()
+    if use_snapshot:
+        registry = _load_registry_snapshot(filename)
+        if registry is not None:
+            return registry
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return ClientRegistry.from_records(json.load(f, object_hook=_client_object_hook))
+    except Exception as e:
+        print(f"Erro ao carregar {filename}: {e}")
+        return ClientRegistry()
+
+
+def refresh_clientes_snapshot(filename=CLIENTES_FILE):
+    """
+    Regrava o snapshot de clientes.json se estiver desatualizado. O registro é
+    montado de novo a partir do arquivo (independente do registro em uso, que pode
+    ter alterações ainda não gravadas), com o índice de busca e a ordem por código.
+    Pensado para rodar em segundo plano depois da abertura. Retorna True se gravou.
+    """
+    if not os.path.exists(filename) or is_current(filename):
+        return False
+    try:
+        st = os.stat(filename) # antes da leitura (ver source_key)
+        with open(filename, 'rb') as f:
+            data = f.read()
+        registry = ClientRegistry.from_records(json.loads(data, object_hook=_client_object_hook))
+    except Exception as e:
+        print(f"Erro ao preparar o snapshot de {filename}: {e}")
+        return False
+    registry.prepare_search()
+    registry.sorted_by_code()
+    return save_snapshot(filename, source_key(st, data), [registry, registry._search_index], shared=registry._clients)
+
+
+def _load_registry_snapshot(filename):
+    """
+    Registro (com a ordem por código) do snapshot; o índice de busca, na seção
+    seguinte, só é carregado em prepare_search, depois da abertura da janela.
+    """
+    reader = load_snapshot(filename)
+    if reader is None:
+        return None
+    try:
+        registry = reader.load()
+    except Exception as e:
+        print(f"Snapshot de {filename} ignorado: {e}")
+        return None
+    if not isinstance(registry, ClientRegistry):
+        return None
+    clients = registry._clients
+
+    def load_index():
+        try:
+            return reader.load(shared=clients)
+        except Exception as e:
+            print(f"Índice de busca do snapshot ignorado (remontado): {e}")
+            return None
+
+    registry._index_loader = load_index
+    return registry
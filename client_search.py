@@ -0,0 +1,344 @@
+"""
+Busca de clientes tolerante a acentos e erros de digitação.
+
+O índice guarda o vocabulário das palavras normalizadas (sem acento, minúsculas)
+dos nomes: cada palavra aponta para os clientes que a contêm, e cada trigrama
+aponta para as palavras do vocabulário. Como nomes se repetem muito
+("COMERCIO DE INSUMOS AGRICOLAS LTDA"), o vocabulário é bem menor que a lista de
+clientes, e a busca aproximada (trigramas) roda sobre ele, não sobre os clientes.
+Códigos ficam numa lista ordenada à parte (exato e prefixo; sem aproximação, para
+que 10007 não traga 10008).
+
+Ordem dos resultados: código exato, depois prefixo (código ou nome), depois
+relevância; empates pelo peso opcional `boost` (ex.: uso recente) e pelo código. A relevância é calculada por faixas (conjuntos
+de clientes com a mesma pontuação), com operações de conjunto em vez de um laço
+por cliente, e só os primeiros `limit` de cada faixa são ordenados.
+"""
+import bisect
+import heapq
+import itertools
+import math
+import re
+import unicodedata
+
+MIN_SIMILARITY = 0.45 # Similaridade mínima (Dice de trigramas) para erro de digitação
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_PREFIX_END = '￿'
+
+# Peso de cada tipo de casamento entre palavra da busca e palavra do cliente
+SIM_EXACT = 1.0
+SIM_PREFIX = 0.95 # Palavra ainda sendo digitada
+SIM_SUBSTRING = 0.85
+SIM_FUZZY_FACTOR = 0.8 # Multiplica a similaridade de trigramas
+
+
+def normalize_words(text):
+    """'Comércio  de Insumos' -> ['comercio', 'de', 'insumos']."""
+    text = str(text)
+    if not text.isascii():
+        # Decompõe 'É' em 'E' + acento e descarta o acento (e o que não tiver equivalente ASCII)
+        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return _NON_ALNUM.sub(' ', text.lower()).split()
+
+
+def _trigrams(word):
+    """Trigramas com bordas marcadas ('  c', ' co', ..., 'io '), para palavras curtas também."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _inner_trigrams(word):
+    """Trigramas internos (sem bordas): toda palavra que contém `word` contém todos eles."""
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def _prefix_range(sorted_list, prefix):
+    """Fatia de uma lista ordenada com os itens que começam com `prefix`."""
+    start = bisect.bisect_left(sorted_list, prefix)
+    end = bisect.bisect_left(sorted_list, prefix + _PREFIX_END, start)
+    return sorted_list[start:end]
+
+
+def _add_to_keyed(mapping, sorted_keys, key, client):
+    clients = mapping.get(key)
+    if clients is None:
+        clients = mapping[key] = set()
+        if sorted_keys is not None:
+            bisect.insort(sorted_keys, key)
+    clients.add(client)
+
+
+def _remove_from_keyed(mapping, sorted_keys, key, client):
+    clients = mapping.get(key)
+    if clients is None:
+        return False
+    clients.discard(client)
+    if clients:
+        return False
+    del mapping[key]
+    idx = bisect.bisect_left(sorted_keys, key)
+    if idx < len(sorted_keys) and sorted_keys[idx] == key:
+        del sorted_keys[idx]
+    return True
+
+
+class ClientSearchIndex:
+    """Índice incremental de busca sobre objetos Client."""
+
+    def __init__(self, clients=()):
+        self._postings = {}     # palavra do nome -> set de clientes
+        self._grams = {}        # trigrama (com e sem borda) -> set de palavras
+        self._vocabulary = []   # palavras em ordem alfabética (prefixo via bisect)
+        self._codes = {}        # código normalizado -> set de clientes
+        self._sorted_codes = []
+        self._first_words = {}  # primeira palavra do nome -> set de clientes (prefixo de nome)
+        self._sorted_first_words = []
+        self._docs = {}         # cliente -> (palavras, código normalizado, nome normalizado)
+        self._sort_key = {}     # cliente -> chave de desempate (código em minúsculas)
+        self._ordered = []      # clientes na ordem de _sort_key
+        self._ordered_keys = []
+
+        # Carga inicial: as listas ordenadas são montadas uma vez só no final
+        for client in clients:
+            self._index(client, bulk=True)
+        self._vocabulary = sorted(self._postings)
+        self._sorted_codes = sorted(self._codes)
+        self._sorted_first_words = sorted(self._first_words)
+        self._ordered = sorted(self._docs, key=self._sort_key.__getitem__)
+        self._ordered_keys = [self._sort_key[c] for c in self._ordered]
+
+    def __len__(self):
+        return len(self._docs)
+
+    # --- Manutenção incremental ---
+
+    def _index(self, client, bulk=False):
+        name_words = normalize_words(client.nome)
+        words = frozenset(name_words)
+        code = ''.join(normalize_words(client.codigo))
+        name = ' '.join(name_words)
+        sort_key = client.codigo.lower()
+        self._docs[client] = (words, code, name)
+        self._sort_key[client] = sort_key
+        for word in words:
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = set()
+                self._add_word(word, bulk)
+            postings.add(client)
+        _add_to_keyed(self._codes, None if bulk else self._sorted_codes, code, client)
+        if name_words:
+            _add_to_keyed(self._first_words, None if bulk else self._sorted_first_words, name_words[0], client)
+        if not bulk:
+            pos = bisect.bisect_right(self._ordered_keys, sort_key)
+            self._ordered_keys.insert(pos, sort_key)
+            self._ordered.insert(pos, client)
+
+    def add(self, client):
+        """Indexa um cliente novo (ou reindexa, se já estiver no índice)."""
+        self.remove(client)
+        self._index(client)
+
+    def update(self, client):
+        """Reindexa um cliente cujo código ou nome mudou."""
+        self.add(client)
+
+    def remove(self, client):
+        """Tira o cliente do índice; palavras que ficam sem clientes saem do vocabulário."""
+        doc = self._docs.pop(client, None)
+        if doc is None:
+            return
+        words, code, name = doc
+        sort_key = self._sort_key.pop(client)
+        pos = bisect.bisect_left(self._ordered_keys, sort_key)
+        while self._ordered[pos] is not client:
+            pos += 1
+        del self._ordered[pos]
+        del self._ordered_keys[pos]
+        for word in words:
+            if _remove_from_keyed(self._postings, self._vocabulary, word, client):
+                self._remove_word_grams(word)
+        _remove_from_keyed(self._codes, self._sorted_codes, code, client)
+        if name:
+            _remove_from_keyed(self._first_words, self._sorted_first_words, name.split(' ', 1)[0], client)
+
+    def _add_word(self, word, bulk):
+        if not bulk:
+            bisect.insort(self._vocabulary, word)
+        for gram in _trigrams(word) | _inner_trigrams(word):
+            self._grams.setdefault(gram, set()).add(word)
+
+    def _remove_word_grams(self, word):
+        for gram in _trigrams(word) | _inner_trigrams(word):
+            words = self._grams.get(gram)
+            if words is not None:
+                words.discard(word)
+                if not words:
+                    del self._grams[gram]
+
+    # --- Casamento de uma palavra da busca ---
+
+    def _rarest_first(self, grams):
+        return sorted(grams, key=lambda g: len(self._grams.get(g, ())))
+
+    def _substring_words(self, token):
+        """Palavras que contêm `token` (interseção dos trigramas, do mais raro ao mais comum)."""
+        candidates = None
+        for gram in self._rarest_first(_inner_trigrams(token)):
+            words = self._grams.get(gram)
+            if not words:
+                return set()
+            candidates = set(words) if candidates is None else candidates & words
+            if not candidates:
+                break
+        return {w for w in candidates or () if token in w}
+
+    def _fuzzy_words(self, token):
+        """
+        Palavras com similaridade de Dice >= MIN_SIMILARITY. Só os trigramas mais
+        raros geram candidatos: quem não compartilha nenhum deles não atinge o
+        mínimo de trigramas em comum (filtro de prefixo).
+        """
+        grams = _trigrams(token)
+        min_overlap = max(1, math.ceil(MIN_SIMILARITY * len(grams) / (2 - MIN_SIMILARITY)))
+        ordered = self._rarest_first(grams)
+        candidates = set()
+        for gram in ordered[:len(ordered) - min_overlap + 1]:
+            candidates.update(self._grams.get(gram, ()))
+
+        matches = {}
+        for word in candidates:
+            word_grams = _trigrams(word)
+            similarity = 2 * len(grams & word_grams) / (len(grams) + len(word_grams))
+            if similarity >= MIN_SIMILARITY:
+                matches[word] = similarity * SIM_FUZZY_FACTOR
+        return matches
+
+    def _token_levels(self, token):
+        """
+        Clientes que casam com a palavra buscada, em faixas disjuntas de pontuação:
+        [(pontuação, set de clientes), ...] da maior para a menor.
+        """
+        word_sims = {}
+        if len(token) >= 3:
+            word_sims.update(self._fuzzy_words(token))
+            for word in self._substring_words(token):
+                word_sims[word] = SIM_SUBSTRING
+        for word in _prefix_range(self._vocabulary, token):
+            word_sims[word] = SIM_EXACT if word == token else SIM_PREFIX
+
+        by_sim = {}
+        for word, sim in word_sims.items():
+            by_sim.setdefault(round(sim, 2), []).append(self._postings[word])
+        for code in _prefix_range(self._sorted_codes, token):
+            by_sim.setdefault(SIM_EXACT if code == token else SIM_PREFIX, []).append(self._codes[code])
+
+        levels = []
+        assigned = set()
+        for sim in sorted(by_sim, reverse=True):
+            clients = set().union(*by_sim[sim])
+            clients -= assigned
+            if clients:
+                assigned |= clients
+                levels.append((sim, clients))
+        return levels
+
+    # --- Consulta ---
+
+    def _take(self, clients, count, seen, out, boost=None):
+        """
+        Acrescenta a `out` os `count` primeiros de `clients`: antes os presentes em
+        `boost` (cliente -> peso, maior primeiro), depois os demais pela ordem do código.
+        """
+        if boost:
+            favored = [c for c in boost if c in clients and c not in seen]
+            favored.sort(key=lambda c: (-boost[c], self._sort_key[c]))
+            if count is not None:
+                favored = favored[:count]
+                count -= len(favored)
+            out.extend(favored)
+            seen.update(favored)
+            if count == 0:
+                return
+        if count is not None and count * len(self._ordered) < len(clients) ** 2:
+            # Conjunto denso: percorrer a ordem global acha os primeiros logo no início
+            chosen = list(itertools.islice(
+                (c for c in self._ordered if c in clients and c not in seen), count))
+        else:
+            if seen:
+                clients = clients - seen
+            if count is None or len(clients) <= count:
+                chosen = sorted(clients, key=self._sort_key.__getitem__)
+            else:
+                chosen = heapq.nsmallest(count, clients, key=self._sort_key.__getitem__)
+        out.extend(chosen)
+        seen.update(chosen)
+
+    def _prefix_matches(self, tokens, query_code, per_token):
+        """Clientes cujo código ou nome começa com a busca."""
+        sets = [self._codes[code] for code in _prefix_range(self._sorted_codes, query_code)]
+        if len(tokens) == 1:
+            sets += [self._first_words[w] for w in _prefix_range(self._sorted_first_words, tokens[0])]
+        else:
+            # Só quem tem a 1ª palavra exata e todas as outras por prefixo pode começar com a busca
+            candidates = set(self._first_words.get(tokens[0], ()))
+            for levels in per_token:
+                if not candidates:
+                    break
+                candidates &= set().union(*(c for sim, c in levels if sim >= SIM_PREFIX))
+            query_name = ' '.join(tokens)
+            docs = self._docs
+            sets.append({c for c in candidates if docs[c][2].startswith(query_name)})
+        return set().union(*sets)
+
+    def search(self, text, limit=None, boost=None):
+        """
+        Clientes que casam com todas as palavras de `text`, do mais ao menos relevante.
+        `boost` (cliente -> peso) desempata dentro de cada nível antes do código.
+        """
+        tokens = normalize_words(text)
+        if not tokens:
+            return []
+        query_code = ''.join(tokens)
+
+        # Com uma palavra só, o prefixo não depende das faixas: elas só são calculadas
+        # se os níveis 1 e 2 não preencherem o limite (ex.: busca por uma letra)
+        per_token = [self._token_levels(token) for token in dict.fromkeys(tokens)] if len(tokens) > 1 else None
+        results = []
+        seen = set()
+
+        def remaining():
+            return None if limit is None else limit - len(results)
+
+        # 1. Código exato e 2. prefixo de código/nome
+        for clients in (self._codes.get(query_code, ()), self._prefix_matches(tokens, query_code, per_token)):
+            if clients and remaining() != 0:
+                self._take(set(clients), remaining(), seen, results, boost)
+
+        if remaining() == 0:
+            return results
+        if per_token is None:
+            per_token = [self._token_levels(tokens[0])]
+        if any(not levels for levels in per_token):
+            return results
+        # 3. Relevância: combina as faixas de cada palavra (a mais seletiva primeiro)
+        per_token.sort(key=lambda levels: sum(len(c) for _, c in levels))
+        groups = {sim: clients for sim, clients in per_token[0]}
+        for levels in per_token[1:]:
+            combined = {}
+            for score, group in groups.items():
+                for sim, clients in levels:
+                    common = group & clients
+                    if common:
+                        key = round(score + sim, 2)
+                        if key in combined:
+                            combined[key] |= common
+                        else:
+                            combined[key] = common
+            groups = combined
+
+        for score in sorted(groups, reverse=True):
+            if remaining() == 0:
+                break
+            self._take(groups[score], remaining(), seen, results, boost)
+        return results
@@ -0,0 +1,87 @@
+"""
+Estatísticas de uso dos clientes (atalho de clientes frequentes).
+
+Cada nota emitida soma 1 à pontuação do cliente, que decai pela metade a cada
+HALF_LIFE_DAYS dias sem uso: clientes recentes e frequentes ficam no topo.
+A ordem entre dois clientes não muda com o passar do tempo (ambos decaem no mesmo
+ritmo), então a pontuação é guardada já convertida numa chave fixa,
+log2(pontuação) + instante/meia-vida, e só é recalculada quando o cliente é usado.
+"""
+import heapq
+import math
+import time
+
+HALF_LIFE_DAYS = 30
+SHORTLIST_SIZE = 6
+_HALF_LIFE_SECONDS = HALF_LIFE_DAYS * 24 * 3600
+
+
+class ClientUsage:
+    """Contagem, último uso e pontuação com decaimento por código de cliente."""
+
+    def __init__(self, records=None):
+        # codigo -> {"contagem": int, "ultimo_uso": epoch (s), "chave": float}
+        self._usage = {}
+        for codigo, entry in (records or {}).items():
+            try:
+                self._usage[str(codigo)] = {
+                    "contagem": int(entry["contagem"]),
+                    "ultimo_uso": float(entry["ultimo_uso"]),
+                    "chave": float(entry["chave"]),
+                }
+            except (KeyError, TypeError, ValueError):
+                continue # Entrada inválida: o cliente só volta ao atalho quando for usado de novo
+
+    def __len__(self):
+        return len(self._usage)
+
+    def __contains__(self, codigo):
+        return codigo in self._usage
+
+    def record_use(self, codigo, now=None):
+        """Registra uma nota emitida para o cliente (O(1))."""
+        now = time.time() if now is None else now
+        entry = self._usage.get(codigo)
+        if entry is None:
+            self._usage[codigo] = {"contagem": 1, "ultimo_uso": now, "chave": now / _HALF_LIFE_SECONDS}
+            return
+        score = self.score(codigo, now) + 1
+        entry["contagem"] += 1
+        entry["ultimo_uso"] = now
+        entry["chave"] = math.log2(score) + now / _HALF_LIFE_SECONDS
+
+    def score(self, codigo, now=None):
+        """Pontuação atual (notas emitidas, com decaimento); 0 se nunca usado."""
+        entry = self._usage.get(codigo)
+        if entry is None:
+            return 0.0
+        now = time.time() if now is None else now
+        return 2 ** (entry["chave"] - now / _HALF_LIFE_SECONDS)
+
+    def ranking_keys(self):
+        """codigo -> chave de ordenação (maior = mais relevante), para desempate na busca."""
+        return {codigo: entry["chave"] for codigo, entry in self._usage.items()}
+
+    def shortlist(self, size=SHORTLIST_SIZE, exists=None):
+        """Códigos dos clientes mais relevantes; `exists` filtra clientes que já não existem."""
+        codes = (c for c in self._usage if exists is None or exists(c))
+        return heapq.nlargest(size, codes, key=lambda c: self._usage[c]["chave"])
+
+    def rename(self, old_codigo, new_codigo):
+        """Mantém o histórico quando o código do cliente é alterado."""
+        if old_codigo != new_codigo and old_codigo in self._usage:
+            self._usage[new_codigo] = self._usage.pop(old_codigo)
+
+    def remove(self, codigo):
+        return self._usage.pop(codigo, None) is not None
+
+    def pop(self, codigo):
+        """Remove e retorna o histórico do cliente (None se não houver), para poder restaurá-lo."""
+        return self._usage.pop(codigo, None)
+
+    def restore(self, codigo, entry):
+        self._usage[codigo] = entry
+
+    def to_records(self):
+        """Cópia independente para gravação (snapshot do PersistenceManager)."""
+        return {codigo: dict(entry) for codigo, entry in self._usage.items()}
@@ -0,0 +1,190 @@
+"""
+Modelos de descrição com campos por nota.
+
+Um template de descrição (templates.json, campo "descricao") pode conter campos
+entre chaves, preenchidos com os dados de cada nota:
+
+    {cliente} {codigo} {fornecedor} {data} {periodo} {valor} {valor_extenso}
+
+Ex.: "BONIFICAÇÃO {periodo} - {fornecedor}: {valor} ({valor_extenso})."
+Chaves literais são escritas em dobro ("{{" e "}}"). Não há campo para o número
+da fatura: a descrição entra na impressão digital de idempotência, que não
+depende da numeração (ver idempotency.py).
+
+Cada texto é analisado uma única vez (compile_template, com cache) e vira uma
+lista de partes fixas e campos; aplicar o template a uma nota só junta as partes.
+Os campos caros (valor em reais e por extenso) só são calculados se o template
+os usa, e ficam em cache por valor: num lote de milhares de linhas com poucos
+valores distintos, cada um é formatado uma vez.
+"""
+import functools
+import string
+
+FIELDS = ("cliente", "codigo", "fornecedor", "data", "periodo", "valor", "valor_extenso")
+_formatter = string.Formatter()
+
+
+# --- Valores em reais ---
+
+@functools.lru_cache(maxsize=4096)
+def _format_cents(cents):
+    sign = "-" if cents < 0 else ""
+    reais, centavos = divmod(abs(cents), 100)
+    return f"{sign}R$ {reais:,}".replace(",", ".") + f",{centavos:02d}"
+
+def format_brl(value):
+    """1234.5 -> 'R$ 1.234,50'."""
+    return _format_cents(round(value * 100))
+
+
+_UNITS = ("zero", "um", "dois", "três", "quatro", "cinco", "seis", "sete", "oito", "nove", "dez",
+          "onze", "doze", "treze", "quatorze", "quinze", "dezesseis", "dezessete", "dezoito", "dezenove")
+_TENS = ("", "", "vinte", "trinta", "quarenta", "cinquenta", "sessenta", "setenta", "oitenta", "noventa")
+_HUNDREDS = ("", "cento", "duzentos", "trezentos", "quatrocentos", "quinhentos", "seiscentos",
+             "setecentos", "oitocentos", "novecentos")
+_SCALES = ((10 ** 9, "bilhão", "bilhões"), (10 ** 6, "milhão", "milhões"), (10 ** 3, "mil", "mil"))
+
+
+def _below_thousand(n):
+    if n == 100:
+        return "cem"
+    parts = []
+    hundreds, rest = divmod(n, 100)
+    if hundreds:
+        parts.append(_HUNDREDS[hundreds])
+    if rest >= 20:
+        tens, units = divmod(rest, 10)
+        parts.append(_TENS[tens] + (f" e {_UNITS[units]}" if units else ""))
+    elif rest:
+        parts.append(_UNITS[rest])
+    return " e ".join(parts)
+
+
+def _number_in_words(n):
+    """Inteiro não negativo por extenso ("mil duzentos e trinta e quatro")."""
+    if n == 0:
+        return _UNITS[0]
+    groups = [] # (texto, valor do grupo)
+    for scale, singular, plural in _SCALES:
+        count, n = divmod(n, scale)
+        if count:
+            if scale == 1000:
+                text = "mil" if count == 1 else f"{_number_in_words(count)} mil"
+            else:
+                text = f"{_number_in_words(count)} {singular if count == 1 else plural}"
+            groups.append((text, count))
+    if n:
+        groups.append((_below_thousand(n), n))
+    words = groups[0][0]
+    for text, value in groups[1:]:
+        # "mil e cem", "mil e vinte", mas "mil duzentos e trinta"
+        words += (" e " if value < 100 or value % 100 == 0 else " ") + text
+    return words
+
+
+@functools.lru_cache(maxsize=4096)
+def _cents_in_words(cents):
+    reais, centavos = divmod(abs(cents), 100)
+    parts = []
+    if reais:
+        words = _number_in_words(reais)
+        if reais == 1:
+            parts.append(f"{words} real")
+        elif reais % 10 ** 6 == 0:
+            parts.append(f"{words} de reais") # "um milhão de reais"
+        else:
+            parts.append(f"{words} reais")
+    if centavos:
+        parts.append(f"{_number_in_words(centavos)} {'centavo' if centavos == 1 else 'centavos'}")
+    text = " e ".join(parts) or "zero reais"
+    return f"menos {text}" if cents < 0 else text
+
+def amount_in_words(value):
+    """1234.56 -> 'mil duzentos e trinta e quatro reais e cinquenta e seis centavos'."""
+    return _cents_in_words(round(value * 100))
+
+
+# --- Templates ---
+
+def _period(data_input):
+    return data_input[3:10] if len(data_input) >= 10 else data_input
+
+_FIELD_VALUES = {
+    "cliente": lambda note: note["nome_cliente"],
+    "codigo": lambda note: str(note["codigo_cliente"]),
+    "fornecedor": lambda note: note["fornecedor"],
+    "data": lambda note: note["data"],
+    "periodo": lambda note: _period(note["data"]),
+    "valor": lambda note: format_brl(note["valor"]),
+    "valor_extenso": lambda note: amount_in_words(note["valor"]),
+}
+
+
+class CompiledTemplate:
+    """Template já analisado: partes fixas e funções dos campos, na ordem do texto."""
+
+    __slots__ = ("text", "fields", "_parts", "_static")
+
+    def __init__(self, text, parts, fields):
+        self.text = text
+        self.fields = fields
+        self._parts = parts # str (parte fixa) ou função (campo)
+        self._static = "".join(parts) if not fields else None
+
+    @property
+    def is_static(self):
+        return not self.fields
+
+    def render(self, note):
+        """
+        Aplica o template a uma nota (dict com nome_cliente, codigo_cliente,
+        fornecedor, data e valor — o formato das notas do lote).
+        """
+        if self._static is not None:
+            return self._static
+        return "".join(part if part.__class__ is str else part(note) for part in self._parts)
+
+
+def _iter_fields(text):
+    for _, name, spec, conversion in _formatter.parse(text):
+        if name is not None:
+            yield name, (spec, conversion)
+
+
+def template_errors(text):
+    """Lista os problemas do template (campos desconhecidos, chaves sem par); vazia se válido."""
+    try:
+        fields = list(_iter_fields(text))
+    except ValueError as e:
+        return [f"Chaves inválidas no texto ({e}). Use {{{{ e }}}} para chaves literais."]
+    errors = []
+    for name, (spec, conversion) in fields:
+        if name not in _FIELD_VALUES:
+            errors.append(f"Campo desconhecido '{{{name}}}'. Campos disponíveis: {', '.join('{' + f + '}' for f in FIELDS)}.")
+        elif spec or conversion:
+            errors.append(f"O campo '{{{name}}}' não aceita formatação.")
+    return errors
+
+
+@functools.lru_cache(maxsize=256)
+def compile_template(text):
+    """
+    Analisa o texto uma vez e retorna o CompiledTemplate (em cache por texto).
+    Levanta ValueError se o template for inválido (ver template_errors).
+    """
+    errors = template_errors(text)
+    if errors:
+        raise ValueError(" ".join(errors))
+    parts, fields = [], set()
+    for literal, name, _, _ in _formatter.parse(text):
+        if literal:
+            parts.append(literal)
+        if name is not None:
+            parts.append(_FIELD_VALUES[name])
+            fields.add(name)
+    return CompiledTemplate(text, tuple(parts), tuple(sorted(fields)))
+
+
+def render_description(text, note):
+    """Atalho: compila (com cache) e aplica o template à nota."""
+    return compile_template(text).render(note)
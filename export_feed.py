@@ -0,0 +1,119 @@
+"""
+Exportação incremental das notas emitidas para conciliação com o ERP.
+
+Lê o registro append-only de notas emitidas (NOTAS_EMITIDAS_FILE) a partir de um
+cursor persistido (posição em bytes), então cada execução só percorre as notas
+criadas desde a exportação anterior, qualquer que seja o tamanho do histórico.
+O cursor só avança depois que a saída foi gravada por completo.
+"""
+import csv
+import hashlib
+import json
+import os
+import sys
+
+from backend_data import NOTAS_EMITIDAS_FILE, _load_json_file, _save_json_file
+
+CURSOR_FILE = "exportacao_cursor.json"
+FEED_FIELDS = ["fatura", "codigo_cliente", "nome_cliente", "fornecedor", "data", "valor", "descricao", "arquivo", "emitida_em"]
+FORMATS = ("csv", "jsonl")
+
+
+def _first_line_hash(f):
+    """Identifica o arquivo de registro pela primeira linha (detecta arquivo substituído)."""
+    f.seek(0)
+    return hashlib.sha1(f.readline()).hexdigest()
+
+
+def load_cursor(cursor_path=CURSOR_FILE):
+    """Cursor salvo ({'offset', 'arquivo_id', 'exportadas'}); começa do zero se não houver."""
+    cursor = _load_json_file(cursor_path)
+    if not isinstance(cursor, dict):
+        return {"offset": 0, "arquivo_id": None, "exportadas": 0}
+    return cursor
+
+
+def iter_new_records(cursor):
+    """
+    Gera (registro, offset_após_a_linha) das notas gravadas depois do cursor.
+    Uma última linha sem quebra (escrita em andamento) fica para a próxima execução.
+    """
+    if not os.path.exists(NOTAS_EMITIDAS_FILE):
+        return
+    with open(NOTAS_EMITIDAS_FILE, 'rb') as f:
+        offset = cursor.get("offset", 0)
+        file_id = _first_line_hash(f)
+        size = os.fstat(f.fileno()).st_size
+        if offset > size or (offset and cursor.get("arquivo_id") not in (None, file_id)):
+            print(f"AVISO: {NOTAS_EMITIDAS_FILE} foi substituído ou truncado; exportando desde o início.", file=sys.stderr)
+            offset = 0
+        cursor["offset"] = offset
+        cursor["arquivo_id"] = file_id
+
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            offset += len(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Linha truncada (ex.: queda de energia durante a escrita)
+                continue
+            yield record, offset
+
+
+def _open_output(output_path):
+    if output_path in (None, "-"):
+        return sys.stdout, False
+    return open(output_path, 'w', encoding='utf-8', newline=''), True
+
+
+def export_feed(output_path=None, formato="csv", cursor_path=CURSOR_FILE, reiniciar=False, avancar=True):
+    """
+    Grava as notas emitidas desde a última exportação em CSV (;) ou JSON Lines.
+    output_path None ou '-' escreve na saída padrão. Com reiniciar=True exporta o
+    histórico inteiro; com avancar=False o cursor não é atualizado (simulação).
+    Retorna (True, quantidade_de_notas) ou (False, mensagem_de_erro).
+    """
+    if formato not in FORMATS:
+        return False, f"Formato inválido: '{formato}'. Use {' ou '.join(FORMATS)}."
+
+    cursor = {"offset": 0, "arquivo_id": None, "exportadas": 0} if reiniciar else load_cursor(cursor_path)
+    count = 0
+    tmp_path = None if output_path in (None, "-") else output_path + ".tmp"
+    try:
+        out, should_close = _open_output(tmp_path)
+        try:
+            writer = None
+            if formato == "csv":
+                writer = csv.DictWriter(out, fieldnames=FEED_FIELDS, extrasaction='ignore', delimiter=';')
+                writer.writeheader()
+            new_offset = None
+            for record, new_offset in iter_new_records(cursor):
+                row = {field: record.get(field, "") for field in FEED_FIELDS}
+                if writer is not None:
+                    writer.writerow(row)
+                else:
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                count += 1
+            out.flush()
+        finally:
+            if should_close:
+                out.close()
+        if tmp_path:
+            os.replace(tmp_path, output_path)
+    except Exception as e:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False, f"Erro ao exportar as notas emitidas: {e}"
+
+    if avancar:
+        if new_offset is not None:
+            cursor["offset"] = new_offset
+        cursor["exportadas"] = (0 if reiniciar else cursor.get("exportadas", 0)) + count
+        _save_json_file(cursor, cursor_path, durable=True)
+    return True, count
@@ -0,0 +1,59 @@
+"""
+Travas entre processos por arquivo, criado com O_EXCL.
+
+Usadas onde processos diferentes (aplicativo, linha de comando, daemon de
+ingestão e os workers do seu pool) disputam o mesmo recurso: a numeração das
+faturas em estado.json e as chaves de idempotência. O arquivo guarda máquina e
+PID de quem trava; uma trava mais antiga que stale_seconds é de um processo que
+caiu e é removida (como em recurrence.acquire_lock).
+"""
+import contextlib
+import os
+import socket
+import time
+
+POLL_SECONDS = 0.05
+
+
+def try_acquire(path, stale_seconds):
+    """Cria a trava com O_EXCL. Retorna False se outro processo a mantém (há menos de stale_seconds)."""
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) < stale_seconds:
+                    return False
+                print(f"Removendo trava abandonada: {path}")
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        os.write(fd, f"{socket.gethostname()} {os.getpid()}".encode())
+        os.close(fd)
+        return True
+    return False
+
+
+def release(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@contextlib.contextmanager
+def exclusive(path, stale_seconds, timeout):
+    """
+    Mantém a trava durante o bloco, esperando até timeout segundos por ela.
+    Levanta TimeoutError se outro processo não a liberar nesse prazo.
+    """
+    deadline = time.monotonic() + timeout
+    while not try_acquire(path, stale_seconds):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"a trava {path} está em uso por outro processo há mais de {timeout:.0f} s")
+        time.sleep(POLL_SECONDS)
+    try:
+        yield
+    finally:
+        release(path)
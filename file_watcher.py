@@ -0,0 +1,97 @@
+"""
+Monitoramento dos arquivos de dados (clientes, estado, templates, fornecedores).
+
+Detecta alterações feitas por fora do aplicativo (outra máquina, exportação do
+ERP) por polling de mtime/tamanho via `after()` do Tk. Cada verificação custa
+apenas um `os.stat` por arquivo; nada é lido enquanto nada muda.
+"""
+from backend_data import get_file_version, get_known_version
+
+DEFAULT_POLL_INTERVAL_MS = 2000
+
+
+class DataFileWatcher:
+    """Observa arquivos de dados e chama o callback do arquivo que mudou."""
+
+    def __init__(self, tk_root, interval_ms=DEFAULT_POLL_INTERVAL_MS):
+        self._root = tk_root
+        self._interval_ms = interval_ms
+        self._callbacks = {}      # filename -> callback
+        self._pending = {}        # filename -> versão vista no poll anterior
+        self._after_id = None
+
+    def watch(self, filename, on_change):
+        """Registra um arquivo e o callback chamado quando ele for alterado por fora."""
+        self._callbacks[filename] = on_change
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self._root.after(self._interval_ms, self._tick)
+
+    def stop(self):
+        if self._after_id is not None:
+            self._root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def poll(self):
+        """
+        Verifica todos os arquivos e dispara os callbacks dos alterados.
+        Uma alteração só é aceita quando a versão em disco fica estável por dois
+        polls seguidos, evitando ler um arquivo no meio da escrita.
+        Retorna a lista de arquivos recarregados.
+        """
+        changed = []
+        for filename, callback in self._callbacks.items():
+            current = get_file_version(filename)
+            if current == get_known_version(filename):
+                self._pending.pop(filename, None)
+                continue
+            if self._pending.get(filename) != current:
+                # Primeira vez que vemos esta versão: espera o próximo poll
+                self._pending[filename] = current
+                continue
+            self._pending.pop(filename, None)
+            try:
+                callback()
+                changed.append(filename)
+            except Exception as e:
+                print(f"Erro ao recarregar {filename}: {e}")
+        return changed
+
+    def _tick(self):
+        self.poll()
+        self._after_id = self._root.after(self._interval_ms, self._tick)
+
+
+def merge_records(current, incoming, key):
+    """
+    Mescla a lista recarregada do disco na lista em memória, pela chave `key`.
+    Os dicionários já existentes são atualizados no lugar (referências como o
+    cliente selecionado continuam válidas); novos entram e removidos saem.
+    Retorna a lista resultante, na ordem do arquivo em disco.
+    """
+    by_key = {item[key]: item for item in current}
+    merged = []
+    for record in incoming:
+        existing = by_key.get(record[key])
+        if existing is not None:
+            existing.clear()
+            existing.update(record)
+            merged.append(existing)
+        else:
+            merged.append(record)
+    return merged
+
+
+def merge_estado(current, incoming):
+    """
+    Mescla o estado recarregado. A próxima fatura nunca retrocede: se outra
+    máquina emitiu notas, vale o maior número para não reutilizar faturas.
+    """
+    try:
+        ultima = max(int(current.get('ultima_fatura', 1)), int(incoming.get('ultima_fatura', 1)))
+    except (TypeError, ValueError):
+        ultima = current.get('ultima_fatura', 1)
+    current.update(incoming)
+    current['ultima_fatura'] = ultima
+    return current
@@ -0,0 +1,146 @@
+"""
+Geração idempotente de notas por chave de requisição.
+
+Quem chama a geração (integração com o ERP, lotes) pode informar uma chave de
+idempotência. Na primeira vez a nota é gerada normalmente e o resultado (arquivo
+e número da fatura) fica registrado em IDEMPOTENCIA_FILE; repetições com a mesma
+chave e o mesmo conteúdo devolvem o resultado registrado na hora, sem abrir o
+modelo e sem avançar a numeração. A mesma chave com conteúdo diferente é um erro
+de quem chamou: levanta IdempotencyConflict.
+
+O conteúdo é identificado pela impressão digital dos dados da nota SEM o número
+da fatura: a fatura faz parte do resultado (uma repetição após timeout costuma
+chegar com o próximo número sugerido, e deve receber a nota já emitida).
+
+O registro é append-only (uma linha JSON por chave concluída, sincronizada em
+disco) e é relido de forma incremental, então processos diferentes (ex.: workers
+do daemon de ingestão) enxergam as chaves concluídas uns dos outros. Duas
+requisições simultâneas com a mesma chave, em threads do mesmo processo ou em
+processos diferentes (workers do daemon, aplicativo, linha de comando), são
+serializadas por uma trava de arquivo por chave (ver IdempotencyStore.hold).
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from file_lock import exclusive
+
+IDEMPOTENCIA_FILE = "idempotencia.jsonl"
+# A trava de uma chave dura a geração da nota (ou da pasta consolidada inteira)
+HOLD_STALE_SECONDS = 600
+HOLD_TIMEOUT_SECONDS = 600
+
+
+class IdempotencyConflict(Exception):
+    """A chave já foi usada numa requisição com conteúdo diferente."""
+
+    def __init__(self, key, stored):
+        self.key = key
+        self.stored = stored
+        super().__init__(
+            f"A chave de idempotência '{key}' já foi usada com outro conteúdo "
+            f"(fatura {stored.get('fatura')}, arquivo {stored.get('arquivo')})."
+        )
+
+
+def request_fingerprint(data_input, client_code, client_name, description_text, value_float, model_filename, supplier_name):
+    """SHA-256 do conteúdo da requisição (sem o número da fatura)."""
+    payload = [data_input, str(client_code), client_name, description_text, repr(float(value_float)),
+               model_filename, supplier_name]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class IdempotencyStore:
+    """Chaves concluídas: chave -> {impressao, arquivo, fatura, concluida_em}."""
+
+    def __init__(self, path=IDEMPOTENCIA_FILE):
+        self.path = path
+        self._entries = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Lê as linhas acrescentadas desde a última leitura (inclusive por outros processos)."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size < self._offset: # arquivo substituído: relê tudo
+            self._entries, self._offset = {}, 0
+        if size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break # linha ainda sendo escrita
+                self._offset += len(raw)
+                try:
+                    entry = json.loads(raw)
+                    self._entries[entry["chave"]] = entry
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def lookup(self, key, fingerprint):
+        """Resultado registrado para a chave (None se ainda não concluída); conflito se o conteúdo difere."""
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.get("impressao") != fingerprint:
+            raise IdempotencyConflict(key, entry)
+        return entry
+
+    def completed(self, key):
+        """Resultado registrado para a chave, sem conferir o conteúdo (None se não houver)."""
+        with self._lock:
+            self._refresh()
+            return self._entries.get(key)
+
+    def record(self, key, fingerprint, output_path, invoice_number):
+        """Registra a chave como concluída (uma linha, sincronizada em disco antes de retornar)."""
+        entry = {
+            "chave": key,
+            "impressao": fingerprint,
+            "arquivo": output_path,
+            "fatura": str(invoice_number),
+            "concluida_em": datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries[key] = entry
+        return entry
+
+    def _hold_path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        return f"{self.path}.{digest}.lock"
+
+    @contextmanager
+    def hold(self, key):
+        """
+        Serializa as requisições com a mesma chave, entre threads e entre processos:
+        quem chama faz lookup -> geração -> record dentro do bloco. A trava é um
+        arquivo <registro>.<hash da chave>.lock criado com O_EXCL.
+        """
+        with exclusive(self._hold_path(key), HOLD_STALE_SECONDS, HOLD_TIMEOUT_SECONDS):
+            yield
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Registro de idempotência do processo (criado no primeiro uso)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = IdempotencyStore()
+        return _store
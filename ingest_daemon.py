@@ -0,0 +1,261 @@
+"""
+Ingestão automática de lotes do ERP (pasta de entrada monitorada).
+
+O ERP grava arquivos CSV em <pasta>/entrada. O daemon reivindica cada arquivo
+renomeando-o para <pasta>/processando (operação atômica: dois processos não pegam
+o mesmo arquivo), valida o lote inteiro, reserva as faturas e gera as notas num
+pool de workers. Ao final, o CSV e o arquivo de resultado por linha vão para
+<pasta>/concluidos ou <pasta>/falhas.
+
+Reinícios não emitem faturas em duplicidade: as faturas reservadas ficam no
+journal de checkpoint <lote>.journal e as notas já concluídas não são refeitas.
+Os lotes deixados em <pasta>/processando são retomados só na partida do daemon,
+e cada lote é processado sob a trava <lote>.lock (criada com O_EXCL e renovada
+enquanto o lote roda): um lote em andamento em outro daemon nunca é retomado.
+Um lote com falhas de geração (disco cheio, modelo ilegível) não chega ao fim do
+journal: fica em <pasta>/processando e o mesmo daemon tenta de novo as linhas com
+falha após RETRY_SECONDS, com as faturas já reservadas. Só linhas recusadas
+(ver checkpoint) levam o lote para <pasta>/falhas.
+"""
+import concurrent.futures
+import contextlib
+import datetime
+import os
+import shutil
+import socket
+import threading
+import time
+
+from backend_data import load_estado, load_fornecedores, load_templates
+from batch import read_batch_csv, start_journal, execute_journal, write_results_csv
+from checkpoint import BatchJournal, JOURNAL_SUFFIX
+from client_registry import load_clientes_registry
+from validation import BatchValidator, format_errors
+
+INGESTAO_FOLDER = "Entrada_ERP"
+ENTRADA, PROCESSANDO, CONCLUIDOS, FALHAS = "entrada", "processando", "concluidos", "falhas"
+RESULTADO_SUFFIX = ".resultado.csv"
+LOCK_SUFFIX = ".lock"
+DEFAULT_POLL_SECONDS = 5.0
+LOCK_HEARTBEAT_SECONDS = 30.0
+# Trava sem renovação há mais tempo que isso é de um daemon que caiu
+LOCK_STALE_SECONDS = 120.0
+RETRY_SECONDS = 300.0 # nova tentativa de um lote com falhas de geração
+
+
+def _log(message):
+    print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] {message}", flush=True)
+
+
+def _acquire_lock(path):
+    """Cria a trava com O_EXCL. Retorna False se outro daemon a mantém (renovada recentemente)."""
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) < LOCK_STALE_SECONDS:
+                    return False
+                _log(f"Removendo trava abandonada: {path}")
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        os.write(fd, f"{socket.gethostname()} {os.getpid()}".encode())
+        os.close(fd)
+        return True
+    return False
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Trava de um lote: retorna se foi obtida e a renova (mtime) em segundo plano até o fim."""
+    if not _acquire_lock(path):
+        yield False
+        return
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(LOCK_HEARTBEAT_SECONDS):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    thread = threading.Thread(target=heartbeat, daemon=True)
+    thread.start()
+    try:
+        yield True
+    finally:
+        stop.set()
+        thread.join()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class IngestDaemon:
+    """Monitora a pasta de entrada e gera as notas dos lotes recebidos."""
+
+    def __init__(self, base_folder=INGESTAO_FOLDER, max_workers=None, poll_seconds=DEFAULT_POLL_SECONDS, use_processes=True):
+        self.base_folder = base_folder
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.poll_seconds = poll_seconds
+        self.use_processes = use_processes
+        self._seen = {}  # nome -> (mtime_ns, tamanho) do poll anterior
+        self._retry_at = {}  # nome -> quando tentar de novo um lote com falhas de geração
+        for sub in (ENTRADA, PROCESSANDO, CONCLUIDOS, FALHAS):
+            os.makedirs(self._dir(sub), exist_ok=True)
+
+    def _dir(self, sub):
+        return os.path.join(self.base_folder, sub)
+
+    def _make_executor(self):
+        if self.use_processes:
+            return concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+        return concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+
+    # --- Laço principal ---
+
+    def run_forever(self):
+        _log(f"Monitorando '{self._dir(ENTRADA)}' com {self.max_workers} worker(s).")
+        with self._make_executor() as executor:
+            self.resume_interrupted(executor)
+            while True:
+                self.process_pending(executor)
+                self.retry_deferred(executor)
+                time.sleep(self.poll_seconds)
+
+    def run_once(self):
+        """Retoma os lotes interrompidos, processa o que estiver pendente agora e retorna."""
+        with self._make_executor() as executor:
+            self.resume_interrupted(executor)
+            self.process_pending(executor, require_stable=False)
+
+    def resume_interrupted(self, executor):
+        """Na partida: retoma os lotes deixados em 'processando' que nenhum outro daemon está processando."""
+        for name in sorted(os.listdir(self._dir(PROCESSANDO))):
+            if name.lower().endswith('.csv') and not name.endswith(RESULTADO_SUFFIX):
+                self._process_file(name, executor, resuming=True)
+
+    def retry_deferred(self, executor):
+        """Tenta de novo, com as mesmas faturas, os lotes deste daemon que tiveram falhas de geração."""
+        now = time.monotonic()
+        for name in [n for n, due in self._retry_at.items() if due <= now]:
+            del self._retry_at[name]
+            self._process_file(name, executor, resuming=True)
+
+    def process_pending(self, executor, require_stable=True):
+        """Processa os novos lotes da entrada, um lote por vez."""
+        for name in self._ready_files(require_stable):
+            if self._claim(name):
+                self._process_file(name, executor)
+
+    def _ready_files(self, require_stable):
+        """
+        Arquivos CSV da entrada, do mais antigo para o mais novo. Com require_stable,
+        só entram os que não mudaram desde o poll anterior (o ERP pode estar gravando).
+        """
+        entries = []
+        current = {}
+        with os.scandir(self._dir(ENTRADA)) as it:
+            for entry in it:
+                if not entry.is_file() or not entry.name.lower().endswith('.csv'):
+                    continue
+                st = entry.stat()
+                current[entry.name] = (st.st_mtime_ns, st.st_size)
+                if not require_stable or self._seen.get(entry.name) == current[entry.name]:
+                    entries.append((st.st_mtime_ns, entry.name))
+        self._seen = current
+        return [name for _, name in sorted(entries)]
+
+    def _claim(self, name):
+        """Move o arquivo para 'processando'. Falha se outro processo já o reivindicou."""
+        try:
+            os.rename(os.path.join(self._dir(ENTRADA), name), os.path.join(self._dir(PROCESSANDO), name))
+            return True
+        except OSError:
+            return False
+
+    # --- Processamento de um lote ---
+
+    def _process_file(self, name, executor, resuming=False):
+        """
+        Processa um lote sob a sua trava. Um erro inesperado não derruba o daemon:
+        o lote vai para 'falhas' com o erro no arquivo de resultado.
+        """
+        path = os.path.join(self._dir(PROCESSANDO), name)
+        with _file_lock(path + LOCK_SUFFIX) as locked:
+            if not locked:
+                _log(f"{name}: em processamento por outro daemon; ignorado.")
+                return
+            if not os.path.exists(path): # concluído por outro daemon antes da trava
+                return
+            if resuming:
+                _log(f"Retomando lote interrompido: {name}")
+            try:
+                self._generate(name, executor)
+            except Exception as e:
+                _log(f"{name}: erro inesperado: {e}")
+                try:
+                    write_results_csv([(0, False, '', f"Erro inesperado: {e}")], path + RESULTADO_SUFFIX)
+                    self._finish(name, success=False)
+                except Exception as move_error:
+                    _log(f"{name}: não foi possível mover o lote para '{FALHAS}': {move_error}")
+
+    def _generate(self, name, executor):
+        path = os.path.join(self._dir(PROCESSANDO), name)
+        journal_path = path + JOURNAL_SUFFIX
+        results_path = path + RESULTADO_SUFFIX
+
+        if os.path.exists(journal_path):
+            # Reinício: as notas e faturas reservadas vêm do journal, sem revalidar
+            journal = BatchJournal.open(journal_path)
+        else:
+            try:
+                rows = read_batch_csv(path)
+            except Exception as e:
+                _log(f"{name}: erro de leitura: {e}")
+                write_results_csv([(0, False, '', f"Erro de leitura: {e}")], results_path)
+                self._finish(name, success=False)
+                return
+
+            estado = load_estado()
+            validator = BatchValidator(load_clientes_registry(), load_fornecedores(), load_templates())
+            notes, errors = validator.validate(rows, estado['ultima_fatura'])
+            if errors:
+                _log(f"{name}: {len(errors)} erro(s) de validação; nenhuma nota gerada.\n{format_errors(errors, limit=10)}")
+                write_results_csv([(line, False, '', msg) for line, msg in errors], results_path)
+                self._finish(name, success=False)
+                return
+
+            # O estado é avançado ANTES de criar o journal: uma queda entre os dois
+            # passos deixa no máximo um buraco na numeração, nunca uma fatura repetida.
+            journal = start_journal(notes, estado, journal_path, origem=name)
+
+        # O journal acompanha o lote para 'concluidos'/'falhas' (ver _finish), não é arquivado à parte
+        results = execute_journal(journal, lambda fn, items: executor.map(fn, items, chunksize=8), archive=False)
+        failures = sum(1 for r in results if not r[1])
+        write_results_csv(results, results_path)
+        if not journal.finished:
+            _log(f"{name}: {len(results) - failures} nota(s) gerada(s), {failures} falha(s) de geração; "
+                 f"nova tentativa em {RETRY_SECONDS:.0f} s com as mesmas faturas.")
+            self._retry_at[name] = time.monotonic() + RETRY_SECONDS
+            return
+        _log(f"{name}: {len(results) - failures} nota(s) gerada(s), {failures} falha(s).")
+        self._finish(name, success=failures == 0)
+
+    def _finish(self, name, success):
+        """Move o lote e o arquivo de resultado para 'concluidos' ou 'falhas'."""
+        target = self._dir(CONCLUIDOS if success else FALHAS)
+        src = os.path.join(self._dir(PROCESSANDO), name)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        root, ext = os.path.splitext(name)
+        dest_root = os.path.join(target, f"{root}_{stamp}")
+        if os.path.exists(src + RESULTADO_SUFFIX):
+            shutil.move(src + RESULTADO_SUFFIX, dest_root + RESULTADO_SUFFIX)
+        shutil.move(src, dest_root + ext)
+        # O journal acompanha o lote (registro das faturas consumidas)
+        if os.path.exists(src + JOURNAL_SUFFIX):
+            shutil.move(src + JOURNAL_SUFFIX, dest_root + JOURNAL_SUFFIX)
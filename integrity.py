@@ -0,0 +1,139 @@
+"""
+Verificação de integridade do arquivo de notas geradas.
+
+Cada nota tem o SHA-256 registrado na geração (campo "sha256" em
+NOTAS_EMITIDAS_FILE). A verificação recalcula os hashes dos arquivos da pasta de
+saída em paralelo (threads: a leitura em blocos grandes e o hashlib liberam o
+GIL, o que ajuda principalmente em compartilhamentos de rede) e informa notas
+ausentes, alteradas e arquivos inesperados. Notas que ainda estão no spool local
+(transferência pendente, ver transfer_queue.py) aparecem como pendentes, não ausentes.
+
+É incremental: o hash de cada arquivo fica em VERIFICACAO_CACHE_FILE junto com
+tamanho e data de modificação, e só é recalculado se um deles mudou. Para uma
+auditoria completa, ignore o cache (completo=True): tamanho e data podem ser
+preservados por quem alterar um arquivo de propósito.
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from backend_data import SAIDA_FOLDER, iter_note_records, _load_json_file, _save_json_file
+from transfer_queue import spool_path_for
+
+VERIFICACAO_CACHE_FILE = "verificacao_cache.json"
+READ_BUFFER_SIZE = 1024 * 1024
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 1) * 4) # I/O de rede: mais threads que núcleos
+NOTE_EXTENSIONS = ('.xlsx',)
+
+
+def hash_file(path, buffer_size=READ_BUFFER_SIZE):
+    """SHA-256 do arquivo, lido em blocos num buffer reaproveitado."""
+    digest = hashlib.sha256()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def _key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _expected_hashes():
+    """caminho normalizado -> (caminho, sha256 ou None) a partir do registro de notas (o último vence)."""
+    expected = {}
+    for record in iter_note_records():
+        path = record.get('arquivo')
+        if path:
+            expected[_key(path)] = (path, record.get('sha256'))
+    return expected
+
+
+def _scan_output_folder(folder):
+    """caminho normalizado -> (caminho, tamanho, mtime_ns) dos arquivos de nota na pasta (recursivo)."""
+    found = {}
+    if not os.path.isdir(folder):
+        return found
+    stack = [folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith(NOTE_EXTENSIONS):
+                    st = entry.stat()
+                    found[_key(entry.path)] = (entry.path, st.st_size, st.st_mtime_ns)
+    return found
+
+
+def verify_archive(folder=None, workers=DEFAULT_WORKERS, completo=False, cache_path=VERIFICACAO_CACHE_FILE):
+    """
+    Confere os arquivos da pasta de saída contra os hashes registrados.
+    Retorna (True, relatório) ou (False, mensagem_de_erro). Relatório:
+        ok, alteradas, ausentes, pendentes, inesperadas, sem_hash (listas de caminhos, exceto ok),
+        hasheadas (arquivos lidos nesta execução), reaproveitadas (vindas do cache).
+    """
+    folder = SAIDA_FOLDER if folder is None else folder
+    try:
+        expected = _expected_hashes()
+        found = _scan_output_folder(folder)
+    except OSError as e:
+        return False, f"Erro ao listar as notas: {e}"
+
+    cache = {} if completo else _load_json_file(cache_path)
+    if not isinstance(cache, dict):
+        cache = {}
+
+    report = {"ok": 0, "alteradas": [], "ausentes": [], "pendentes": [], "inesperadas": [], "sem_hash": [],
+              "erros": [], "hasheadas": 0, "reaproveitadas": 0}
+    current = {} # arquivo -> hash conhecido (do cache ou calculado agora)
+    to_hash = []
+    for key, (path, size, mtime_ns) in found.items():
+        cached = cache.get(key)
+        if cached and cached.get("tamanho") == size and cached.get("mtime_ns") == mtime_ns and cached.get("sha256"):
+            current[key] = cached["sha256"]
+            report["reaproveitadas"] += 1
+        else:
+            to_hash.append(key)
+
+    def _hash(key):
+        try:
+            return key, hash_file(found[key][0]), None
+        except OSError as e:
+            return key, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for key, digest, error in pool.map(_hash, to_hash):
+            if error:
+                report["erros"].append(f"{found[key][0]}: {error}")
+                continue
+            current[key] = digest
+            report["hasheadas"] += 1
+
+    for key, (path, expected_hash) in expected.items():
+        if key not in found:
+            pending = os.path.exists(spool_path_for(path, destination=folder))
+            report["pendentes" if pending else "ausentes"].append(path)
+        elif key not in current:
+            continue # erro de leitura, já informado
+        elif not expected_hash:
+            report["sem_hash"].append(path) # nota anterior ao registro do SHA-256
+        elif current[key] != expected_hash:
+            report["alteradas"].append(path)
+        else:
+            report["ok"] += 1
+    report["inesperadas"] = sorted(found[key][0] for key in found if key not in expected)
+
+    # O cache guarda o hash calculado (não o esperado): uma nota alterada continua
+    # aparecendo como alterada nas próximas execuções, sem precisar ser relida.
+    new_cache = {
+        key: {"tamanho": found[key][1], "mtime_ns": found[key][2], "sha256": digest}
+        for key, digest in current.items()
+    }
+    _save_json_file(new_cache, cache_path)
+    return True, report
@@ -0,0 +1,334 @@
+"""
+Pré-visualização da nota de crédito.
+
+Desenha o modelo XLSX do fornecedor como imagem (Pillow), usando o mesmo
+mapeamento de células de process_and_save_note. O fundo do modelo (textos fixos,
+bordas, preenchimentos e logotipo) é desenhado uma única vez por modelo e fica
+em cache; a cada alteração do formulário só os campos variáveis são redesenhados
+sobre uma cópia desse fundo, sem acesso a disco nem programas externos.
+"""
+import io
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+from backend_data import (
+    _build_data_map, _load_template_workbook, _resolve_model_path,
+    get_file_version, CURRENCY_NUMBER_FORMAT,
+)
+
+PREVIEW_WIDTH = 560 # Largura (px) da imagem gerada
+
+# Medidas padrão do Excel quando a coluna/linha não define tamanho próprio
+DEFAULT_COLUMN_WIDTH = 8.43 # caracteres
+DEFAULT_ROW_HEIGHT = 15.0   # pontos
+DEFAULT_FONT_SIZE = 11.0    # pontos
+EMU_PER_PIXEL = 9525
+
+# Formato numérico aplicado por _fill_note_sheet a células que não são texto
+NUMBER_FORMAT_OVERRIDES = {'K50': CURRENCY_NUMBER_FORMAT}
+
+_FONT_FILES = {
+    False: ("arial.ttf", "DejaVuSans.ttf"),
+    True: ("arialbd.ttf", "DejaVuSans-Bold.ttf"),
+}
+
+
+@lru_cache(maxsize=64)
+def _get_font(size_px, bold):
+    """Fonte TrueType do sistema (Arial no Windows); cai para a fonte embutida do Pillow."""
+    for filename in _FONT_FILES[bold]:
+        try:
+            return ImageFont.truetype(filename, size_px)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size_px)
+    except TypeError: # Pillow < 10.1 não aceita tamanho
+        return ImageFont.load_default()
+
+
+def _format_brl(value):
+    """1234.5 -> '1.234,50'."""
+    return f"{value:,.2f}".replace('.', '#').replace(',', '.').replace('#', ',')
+
+
+def _format_cell_value(value, number_format):
+    """Texto exibido pela célula (aproximação do formato numérico do Excel)."""
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if '0.00' in number_format:
+            return ("R$ " if 'R$' in number_format else "") + _format_brl(value)
+        return str(value)
+    return str(value)
+
+
+def _color(color, default=None):
+    """Converte a cor ARGB do openpyxl ('FF00B894') para '#00B894'."""
+    try:
+        if color is not None and color.type == 'rgb' and isinstance(color.rgb, str) and len(color.rgb) == 8:
+            return '#' + color.rgb[2:]
+    except Exception:
+        pass
+    return default
+
+
+class _SheetLayout:
+    """Posição (px) de cada célula da planilha, já na escala da pré-visualização."""
+
+    def __init__(self, ws, width):
+        from openpyxl.utils import get_column_letter
+
+        self.max_col = ws.max_column
+        self.max_row = ws.max_row
+
+        col_px = []
+        for col in range(1, self.max_col + 1):
+            dim = ws.column_dimensions.get(get_column_letter(col))
+            chars = dim.width if dim is not None and dim.width else DEFAULT_COLUMN_WIDTH
+            col_px.append(0 if dim is not None and dim.hidden else chars * 7 + 5)
+        row_px = []
+        for row in range(1, self.max_row + 1):
+            dim = ws.row_dimensions.get(row)
+            points = dim.height if dim is not None and dim.height else DEFAULT_ROW_HEIGHT
+            row_px.append(0 if dim is not None and dim.hidden else points * 4 / 3)
+
+        self.scale = width / sum(col_px)
+        self.x = [0.0]
+        for w in col_px:
+            self.x.append(self.x[-1] + w * self.scale)
+        self.y = [0.0]
+        for h in row_px:
+            self.y.append(self.y[-1] + h * self.scale)
+        self.size = (int(round(self.x[-1])), int(round(self.y[-1])))
+
+        # Células mescladas: a do canto superior esquerdo ocupa a área toda
+        self.merged = {}
+        self.merged_of = {} # (linha, coluna) de qualquer célula mesclada -> limites da mesclagem
+        for rng in ws.merged_cells.ranges:
+            bounds = (rng.min_row, rng.min_col, rng.max_row, rng.max_col)
+            self.merged[(rng.min_row, rng.min_col)] = bounds
+            for row in range(rng.min_row, rng.max_row + 1):
+                for col in range(rng.min_col, rng.max_col + 1):
+                    self.merged_of[(row, col)] = bounds
+
+    def cell_box(self, row, col):
+        """Retângulo da própria célula (ignora mesclagem)."""
+        return (self.x[col - 1], self.y[row - 1], self.x[col], self.y[row])
+
+    def value_box(self, row, col):
+        """Retângulo onde o valor da célula é exibido (a área mesclada, se houver)."""
+        min_row, min_col, max_row, max_col = self.merged.get((row, col), (row, col, row, col))
+        return (self.x[min_col - 1], self.y[min_row - 1], self.x[max_col], self.y[max_row])
+
+    def anchor_point(self, col, col_off, row, row_off):
+        """Ponto (px) de uma âncora de imagem (coluna/linha base 0 + deslocamento em EMU)."""
+        x = self.x[min(col, self.max_col)] + col_off / EMU_PER_PIXEL * self.scale
+        y = self.y[min(row, self.max_row)] + row_off / EMU_PER_PIXEL * self.scale
+        return int(x), int(y)
+
+
+class _CellStyle:
+    """O que é preciso para redesenhar o valor de uma célula variável."""
+    __slots__ = ('box', 'font_px', 'bold', 'color', 'horizontal', 'vertical', 'wrap', 'number_format')
+
+    def __init__(self, cell, box, scale, number_format):
+        self.box = box
+        self.font_px = max(6, int(round((cell.font.sz or DEFAULT_FONT_SIZE) * 4 / 3 * scale)))
+        self.bold = bool(cell.font.b)
+        self.color = _color(cell.font.color, '#000000')
+        self.horizontal = cell.alignment.horizontal
+        self.vertical = cell.alignment.vertical or 'bottom'
+        self.wrap = bool(cell.alignment.wrap_text)
+        self.number_format = number_format
+
+
+def _wrap_lines(draw, text, font, max_width):
+    """Quebra o texto em linhas que cabem na largura (como 'Quebrar texto' do Excel)."""
+    lines = []
+    for paragraph in text.split('\n'):
+        current = ""
+        for word in paragraph.split(' '):
+            candidate = f"{current} {word}" if current else word
+            if current and draw.textlength(candidate, font=font) > max_width:
+                lines.append(current)
+                current = word
+            else:
+                current = candidate
+        lines.append(current)
+    return lines
+
+
+def _fit_line(draw, text, font, max_width):
+    """Corta o texto que não cabe na célula (sem quebra de linha)."""
+    if draw.textlength(text, font=font) <= max_width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > max_width:
+        text = text[:-1]
+    return text + "…"
+
+
+def _draw_value(draw, style, value):
+    """Desenha o valor no retângulo da célula respeitando alinhamento e quebra."""
+    text = _format_cell_value(value, style.number_format)
+    if not text:
+        return
+    font = _get_font(style.font_px, style.bold)
+    x0, y0, x1, y1 = style.box
+    pad = 2
+    width = max(1, x1 - x0 - 2 * pad)
+    if style.wrap:
+        lines = _wrap_lines(draw, text, font, width)
+    else:
+        lines = [_fit_line(draw, text, font, width)]
+
+    line_height = style.font_px * 1.2
+    # Como no Excel, linhas além da altura da célula não aparecem
+    max_lines = max(1, int((y1 - y0) // line_height))
+    lines = lines[:max_lines]
+    block = line_height * len(lines)
+    if style.vertical == 'top':
+        y = y0 + pad
+    elif style.vertical == 'center':
+        y = y0 + (y1 - y0 - block) / 2
+    else:
+        y = y1 - block - pad
+
+    horizontal = style.horizontal
+    if horizontal in (None, 'general'):
+        horizontal = 'right' if isinstance(value, (int, float)) else 'left'
+    for line in lines:
+        line_width = draw.textlength(line, font=font)
+        if horizontal in ('center', 'centerContinuous'):
+            x = x0 + (x1 - x0 - line_width) / 2
+        elif horizontal == 'right':
+            x = x1 - line_width - pad
+        else:
+            x = x0 + pad
+        draw.text((x, y), line, font=font, fill=style.color)
+        y += line_height
+
+
+def _variable_cells(model_filename):
+    """Células preenchidas por process_and_save_note para o modelo (mesmo mapeamento)."""
+    return set(_build_data_map('', '', '', '', '', 0, model_filename, '').keys())
+
+
+def _render_background(ws, model_filename, width):
+    """Desenha o fundo fixo do modelo e coleta o estilo das células variáveis."""
+    from openpyxl.cell.cell import MergedCell
+    from openpyxl.utils import coordinate_to_tuple
+
+    layout = _SheetLayout(ws, width)
+    image = Image.new('RGB', layout.size, '#FFFFFF')
+    draw = ImageDraw.Draw(image)
+    variable = _variable_cells(model_filename)
+    border_width = max(1, int(round(layout.scale * 1.5)))
+
+    # 1. Preenchimentos
+    for row in ws.iter_rows(max_row=layout.max_row, max_col=layout.max_col):
+        for cell in row:
+            if isinstance(cell, MergedCell) or cell.fill is None or cell.fill.fill_type != 'solid':
+                continue
+            fill = _color(cell.fill.fgColor)
+            if fill:
+                draw.rectangle(layout.value_box(cell.row, cell.column), fill=fill)
+
+    # 2. Bordas (só no contorno das mesclagens, como o Excel exibe)
+    for row in ws.iter_rows(max_row=layout.max_row, max_col=layout.max_col):
+        for cell in row:
+            border = cell.border
+            if border is None:
+                continue
+            r, c = cell.row, cell.column
+            min_row, min_col, max_row, max_col = layout.merged_of.get((r, c), (r, c, r, c))
+            x0, y0, x1, y1 = layout.cell_box(r, c)
+            sides = (
+                (border.left, c == min_col, (x0, y0, x0, y1)),
+                (border.right, c == max_col, (x1, y0, x1, y1)),
+                (border.top, r == min_row, (x0, y0, x1, y0)),
+                (border.bottom, r == max_row, (x0, y1, x1, y1)),
+            )
+            for side, on_edge, line in sides:
+                if on_edge and side is not None and side.style:
+                    draw.line(line, fill=_color(side.color, '#000000'), width=border_width)
+
+    # 3. Textos fixos
+    for row in ws.iter_rows(max_row=layout.max_row, max_col=layout.max_col):
+        for cell in row:
+            if isinstance(cell, MergedCell) or cell.value is None or cell.coordinate in variable:
+                continue
+            style = _CellStyle(cell, layout.value_box(cell.row, cell.column), layout.scale, cell.number_format)
+            _draw_value(draw, style, cell.value)
+
+    # 4. Imagens (logotipo)
+    for img in getattr(ws, '_images', []):
+        try:
+            logo = Image.open(io.BytesIO(img._data())).convert('RGBA')
+            anchor = img.anchor._from
+            x, y = layout.anchor_point(anchor.col, anchor.colOff, anchor.row, anchor.rowOff)
+            size = (max(1, int(img.width * layout.scale)), max(1, int(img.height * layout.scale)))
+            logo = logo.resize(size, Image.Resampling.LANCZOS)
+            image.paste(logo, (x, y), logo)
+        except Exception as e:
+            print(f"Aviso: imagem do modelo '{model_filename}' não pôde ser desenhada na pré-visualização: {e}")
+
+    styles = {}
+    for coordinate in variable:
+        row, col = coordinate_to_tuple(coordinate)
+        if row > layout.max_row or col > layout.max_col:
+            continue
+        cell = ws.cell(row=row, column=col)
+        if isinstance(cell, MergedCell):
+            continue # Meio de mesclagem: process_and_save_note também ignora
+        number_format = NUMBER_FORMAT_OVERRIDES.get(coordinate, cell.number_format)
+        styles[coordinate] = _CellStyle(cell, layout.value_box(row, col), layout.scale, number_format)
+    return image, styles
+
+
+class NotePreviewRenderer:
+    """
+    Gera a imagem de pré-visualização da nota.
+    O fundo de cada modelo fica em cache; a versão do arquivo do modelo só é
+    conferida de novo depois de invalidate() (ex.: troca de fornecedor).
+    """
+
+    def __init__(self, width=PREVIEW_WIDTH):
+        self.width = width
+        self._backgrounds = {} # modelo -> (versão do arquivo, imagem de fundo, estilos das células variáveis)
+        self._verified = set() # modelos cuja versão já foi conferida desde o último invalidate()
+
+    def invalidate(self):
+        """Faz a próxima renderização de cada modelo conferir se o arquivo mudou."""
+        self._verified.clear()
+
+    def _get_background(self, model_filename):
+        cached = self._backgrounds.get(model_filename)
+        if cached is not None and model_filename in self._verified:
+            return cached
+
+        model_path = _resolve_model_path(model_filename)
+        if model_path is None:
+            raise FileNotFoundError(f"Modelo '{model_filename}' não encontrado.")
+        version = get_file_version(model_path)
+        if cached is None or cached[0] != version:
+            wb = _load_template_workbook(model_path)
+            image, styles = _render_background(wb.active, model_filename, self.width)
+            cached = (version, image, styles)
+            self._backgrounds[model_filename] = cached
+        self._verified.add(model_filename)
+        return cached
+
+    def render(self, data_input, invoice_number, client_code, client_name, description_text, value_float, model_filename, supplier_name):
+        """Retorna a imagem (PIL) da nota com os dados informados."""
+        _, background, styles = self._get_background(model_filename)
+        data_map = _build_data_map(data_input, invoice_number, client_code, client_name, description_text, value_float, model_filename, supplier_name)
+
+        image = background.copy()
+        draw = ImageDraw.Draw(image)
+        for coordinate, value in data_map.items():
+            style = styles.get(coordinate)
+            if style is not None:
+                _draw_value(draw, style, value)
+        return image
@@ -0,0 +1,158 @@
+"""
+Persistência agrupada (coalescida) dos dados do aplicativo.
+
+As edições marcam o conjunto de dados como "sujo"; uma thread em segundo plano
+grava cada conjunto uma única vez após um curto intervalo, não importa quantas
+edições ocorreram nesse tempo. Tudo que estiver pendente é gravado no
+fechamento da janela (WM_DELETE_WINDOW) e na saída do processo (atexit).
+
+Durabilidade do número da fatura (ESTADO_DURABILITY):
+    "imediata" (padrão): o estado é gravado e sincronizado em disco antes de a
+                         geração da nota retornar. Uma queda nunca reutiliza fatura.
+    "agrupada":          o estado entra na gravação agrupada como os demais dados.
+                         Uma queda logo após emitir notas pode fazer o próximo
+                         número sugerido retroceder (as notas já geradas continuam
+                         registradas em notas_emitidas.jsonl).
+
+A escolha é da instalação: opção --durabilidade-estado=agrupada na linha de
+comando do aplicativo ou variável de ambiente NOTAS_DURABILIDADE_ESTADO (ver
+configured_estado_durability).
+
+Alterações externas: antes de cada gravação, o arquivo do conjunto é conferido
+(backend_data.is_externally_modified). Se mudou por fora desde a última leitura
+ou gravação deste processo, o snapshot não é gravado e continua pendente; quem
+recarrega o arquivo mescla os dados e agenda de novo a gravação (mark_dirty) a
+partir dos dados mesclados.
+"""
+import atexit
+import os
+import threading
+
+from backend_data import is_externally_modified
+
+DURABILITY_IMMEDIATE = "imediata"
+DURABILITY_COALESCED = "agrupada"
+ESTADO_DURABILITY = DURABILITY_IMMEDIATE # padrão, sem configuração
+ESTADO_DURABILITY_ENV = "NOTAS_DURABILIDADE_ESTADO"
+ESTADO_DURABILITY_OPTION = "--durabilidade-estado="
+DEFAULT_FLUSH_DELAY = 0.5  # segundos
+
+
+def configured_estado_durability(argv=(), environ=None):
+    """
+    Durabilidade do estado configurada: a opção --durabilidade-estado=<valor> em
+    argv ou, sem ela, a variável de ambiente NOTAS_DURABILIDADE_ESTADO. Sem
+    nenhuma das duas, ou com valor inválido (avisado), ESTADO_DURABILITY.
+    """
+    environ = os.environ if environ is None else environ
+    value = environ.get(ESTADO_DURABILITY_ENV, "")
+    for arg in argv:
+        if arg.startswith(ESTADO_DURABILITY_OPTION):
+            value = arg[len(ESTADO_DURABILITY_OPTION):]
+    value = value.strip().lower()
+    if not value:
+        return ESTADO_DURABILITY
+    if value not in (DURABILITY_IMMEDIATE, DURABILITY_COALESCED):
+        print(f"Durabilidade do estado inválida '{value}' (use '{DURABILITY_IMMEDIATE}' ou "
+              f"'{DURABILITY_COALESCED}'); usando '{ESTADO_DURABILITY}'.")
+        return ESTADO_DURABILITY
+    return value
+
+
+class PersistenceManager:
+    """Agrupa gravações repetidas de cada conjunto de dados numa só."""
+
+    def __init__(self, savers, flush_delay=DEFAULT_FLUSH_DELAY, estado_durability=ESTADO_DURABILITY, filenames=None):
+        """
+        savers: dict nome -> função que grava os dados (ex.: {'clientes': save_clientes}).
+        filenames: dict nome -> arquivo conferido contra alterações externas antes de gravar.
+        """
+        self._savers = dict(savers)
+        self._filenames = dict(filenames or {})
+        self._flush_delay = flush_delay
+        self.estado_durability = estado_durability
+        self._pending = {}  # nome -> snapshot mais recente ainda não gravado
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # serializa as gravações em disco
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="persistencia", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    @property
+    def estado_is_immediate(self):
+        return self.estado_durability == DURABILITY_IMMEDIATE
+
+    def mark_dirty(self, name, snapshot):
+        """
+        Agenda a gravação de `name`. O snapshot deve ser uma cópia independente dos
+        dados (a thread de gravação não pode ver a estrutura mudando durante o dump).
+        Um snapshot mais novo substitui o anterior ainda pendente.
+        """
+        if name not in self._savers:
+            raise KeyError(name)
+        with self._cond:
+            self._pending[name] = snapshot
+            self._cond.notify()
+        if self._stopped:
+            self.flush()
+
+    def is_dirty(self, name=None):
+        with self._cond:
+            return bool(self._pending) if name is None else name in self._pending
+
+    def conflicts(self):
+        """Arquivos dos conjuntos pendentes alterados por fora (aguardando recarga e mescla)."""
+        with self._cond:
+            names = list(self._pending)
+        return [self._filenames[n] for n in names if n in self._filenames and is_externally_modified(self._filenames[n])]
+
+    def flush(self, names=None):
+        """
+        Grava agora (na thread de quem chama) os conjuntos pendentes. Um conjunto
+        cujo arquivo foi alterado por fora não é gravado: continua pendente até a
+        recarga agendar um snapshot mesclado. Retorna os nomes nessa situação.
+        """
+        held = []
+        with self._write_lock:
+            with self._cond:
+                if names is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    batch = {n: self._pending.pop(n) for n in names if n in self._pending}
+            for name, snapshot in batch.items():
+                filename = self._filenames.get(name)
+                if filename and is_externally_modified(filename):
+                    with self._cond:
+                        self._pending.setdefault(name, snapshot) # um snapshot mais novo prevalece
+                    held.append(name)
+                    continue
+                self._savers[name](snapshot)
+        return held
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+            # Espera o intervalo para juntar as edições seguintes na mesma gravação
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped, timeout=self._flush_delay)
+                if self._stopped:
+                    return
+            self.flush()
+
+    def shutdown(self):
+        """
+        Encerra a thread de gravação e grava tudo que estiver pendente (menos os
+        conjuntos alterados por fora: recarregar antes, ver conflicts).
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        for name in self.flush():
+            print(f"Alterações em '{name}' não gravadas: {self._filenames[name]} foi alterado por fora.")
@@ -0,0 +1,63 @@
+"""
+Pré-aquecimento em segundo plano.
+
+Logo após a primeira pintura da janela, uma thread de baixa prioridade importa o
+openpyxl, carrega/valida os modelos dos fornecedores e testa a pasta de saída,
+para que a primeira nota da sessão não pague esse custo.
+"""
+import os
+import sys
+import threading
+
+from backend_data import prewarm
+
+
+def _lower_current_thread_priority():
+    """Reduz a prioridade da thread atual (melhor esforço; ignora se não suportado)."""
+    try:
+        if os.name == 'nt':
+            import ctypes
+            THREAD_PRIORITY_BELOW_NORMAL = -1
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_BELOW_NORMAL)
+        elif sys.platform.startswith('linux'):
+            # No Linux o "nice" vale por thread quando aplicado ao TID nativo
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except Exception:
+        pass
+
+
+class Prewarmer:
+    """Executa o pré-aquecimento uma única vez; quem precisar do resultado espera por ele."""
+
+    def __init__(self, fornecedores):
+        self._fornecedores = list(fornecedores)
+        self._done = threading.Event()
+        self._thread = None
+        self.problems = []
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prewarm", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        _lower_current_thread_priority()
+        try:
+            self.problems = prewarm(self._fornecedores)
+            for problem in self.problems:
+                print(f"AVISO (pré-aquecimento): {problem}")
+        except Exception as e:
+            print(f"Erro no pré-aquecimento: {e}")
+        finally:
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """
+        Aguarda o fim do pré-aquecimento, se ele já tiver começado. A geração usa
+        isto para não carregar o openpyxl e o modelo em duplicidade.
+        Retorna False se o timeout (segundos) esgotou com o pré-aquecimento ainda rodando.
+        """
+        if self._thread is None:
+            return True
+        return self._done.wait(timeout)
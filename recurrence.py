@@ -0,0 +1,281 @@
+"""
+Notas recorrentes (ex.: bonificação mensal por volume), geradas com antecedência.
+
+Cada definição em RECORRENCIAS_FILE descreve uma nota que se repete todo mês:
+
+    {"nome": "Bonificação Volume - Cliente X", "codigo_cliente": "6001",
+     "fornecedor": "FORNECEDOR A", "template": "Bonificação por Volume",
+     "valor": "1.500,00", "dia": 28, "ativa": true}
+
+"descricao" pode substituir o template (ambos aceitam campos como {periodo}, ver
+description_templates.py); sem "dia", a nota é datada do último dia útil do mês.
+
+A partir de DIAS_ANTECEDENCIA dias antes da data de emissão, o período entra na
+pré-geração: as definições viram linhas de lote, validadas juntas, e as faturas
+são reservadas de uma vez (batch.start_journal) antes de qualquer planilha ser
+aberta. A geração roda fora do horário de pico (`cli.py recorrencias --gerar`
+agendado, ou o aplicativo quando ocioso) e o fechamento do mês vira conferência
+e impressão.
+
+Cada nota tem a chave de idempotência "recorrencia:<nome>:<MM/AAAA>": rodar a
+pré-geração de novo não duplica notas nem consome faturas, e notas reservadas
+num journal ainda não concluído (queda no meio) são retomadas, não reservadas
+outra vez. Isso inclui as falhas de geração (disco cheio, modelo ilegível): o
+journal fica aberto e a retomada usa a fatura reservada. Notas recusadas (journal
+concluído com a linha RECUSADA, ex.: arquivo já existente) não são repetidas
+automaticamente, só quando pedido (geração interativa ou --repetir-falhas), e
+recebem nova fatura. Um arquivo de trava (RECORRENCIAS_LOCK) impede que o
+aplicativo e a tarefa agendada pré-gerem ao mesmo tempo.
+"""
+import calendar
+import datetime
+import os
+import time
+
+from backend_data import _load_json_file, _save_json_file
+from batch import start_journal, execute_journal, resume_batch
+from checkpoint import BatchJournal, list_incomplete_journals, list_archived_journals, new_journal_path
+from idempotency import get_store
+from validation import BatchValidator
+
+RECORRENCIAS_FILE = "recorrencias.json"
+DIAS_ANTECEDENCIA = 7
+FORA_DE_PICO = (19, 7) # das 19h às 7h (e fins de semana)
+ORIGEM_PREFIX = "recorrencias "
+KEY_PREFIX = "recorrencia:"
+RECORRENCIAS_LOCK = "recorrencias.lock"
+LOCK_STALE_SECONDS = 3600 # trava mais antiga que isso é de um processo que caiu
+
+
+def load_recorrencias():
+    return _load_json_file(RECORRENCIAS_FILE)
+
+def save_recorrencias(recorrencias):
+    _save_json_file(recorrencias, RECORRENCIAS_FILE)
+
+
+# --- Períodos e datas ---
+
+def format_period(year, month):
+    return f"{month:02d}/{year}"
+
+def parse_period(text):
+    """'MM/AAAA' -> (ano, mês). Levanta ValueError se inválido."""
+    month, year = text.strip().split("/")
+    year, month = int(year), int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f"Mês inválido em '{text}'.")
+    return year, month
+
+def _shift_month(year, month, delta):
+    index = year * 12 + month - 1 + delta
+    return index // 12, index % 12 + 1
+
+def last_business_day(year, month):
+    day = datetime.date(year, month, calendar.monthrange(year, month)[1])
+    while day.weekday() >= 5:
+        day -= datetime.timedelta(days=1)
+    return day
+
+def emission_date(definition, year, month):
+    """Data da nota no período: o "dia" da definição (limitado ao fim do mês) ou o último dia útil."""
+    day = definition.get('dia')
+    if day:
+        return datetime.date(year, month, min(int(day), calendar.monthrange(year, month)[1]))
+    return last_business_day(year, month)
+
+def due_periods(definitions, today=None, antecedencia=DIAS_ANTECEDENCIA):
+    """Períodos (mês atual e seguinte) com alguma nota cuja emissão está a até `antecedencia` dias."""
+    today = today or datetime.date.today()
+    periods = []
+    for year, month in (_shift_month(today.year, today.month, 0), _shift_month(today.year, today.month, 1)):
+        if any(emission_date(d, year, month) - datetime.timedelta(days=antecedencia) <= today
+               for d in definitions if d.get('ativa', True)):
+            periods.append(format_period(year, month))
+    return periods
+
+def is_off_peak(now=None, window=FORA_DE_PICO):
+    """Fora do horário de pico: noite (window = (início, fim) em horas) ou fim de semana."""
+    now = now or datetime.datetime.now()
+    start, end = window
+    return now.weekday() >= 5 or now.hour >= start or now.hour < end
+
+
+def acquire_lock(path=RECORRENCIAS_LOCK):
+    """Tenta obter a trava da pré-geração. Retorna False se outro processo estiver pré-gerando."""
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) < LOCK_STALE_SECONDS:
+                    return False
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        return True
+    return False
+
+def release_lock(path=RECORRENCIAS_LOCK):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# --- Pré-geração ---
+
+def recurrence_key(definition, period):
+    return f"{KEY_PREFIX}{definition['nome']}:{period}"
+
+def _format_value(value):
+    if isinstance(value, (int, float)):
+        return f"{value:.2f}".replace(".", ",")
+    return str(value or "")
+
+def reserved_keys():
+    """Chaves de notas recorrentes com fatura reservada em journals ainda não concluídos."""
+    keys = {}
+    for path in list_incomplete_journals():
+        try:
+            journal = BatchJournal.open(path)
+        except (OSError, ValueError):
+            continue
+        if not str(journal.header.get('origem', '')).startswith(ORIGEM_PREFIX):
+            continue
+        for note in journal.notes:
+            if str(note.get('chave', '')).startswith(KEY_PREFIX):
+                keys[note['chave']] = (path, note)
+    return keys
+
+def _journal_label(period):
+    return "recorrencias_" + period.replace("/", "_")
+
+def failed_keys(period):
+    """Chaves de notas recorrentes do período recusadas em journals concluídos: chave -> (nota, mensagem)."""
+    keys = {}
+    for path in list_archived_journals(label=_journal_label(period)):
+        try:
+            journal = BatchJournal.open(path)
+        except (OSError, ValueError):
+            continue
+        if not journal.failures:
+            continue
+        for note in journal.notes:
+            result = journal.completed.get(note['linha'])
+            if result is not None and not result[0] and note.get('chave'):
+                keys[note['chave']] = (note, result[2])
+    return keys
+
+def pending_definitions(definitions, period, reserved=None, retry_failed=False):
+    """
+    Definições ativas do período ainda sem nota gerada nem fatura reservada. As
+    recusadas só entram com retry_failed (a nova tentativa recebe outra fatura).
+    """
+    store = get_store()
+    reserved = reserved_keys() if reserved is None else reserved
+    failed = {} if retry_failed else failed_keys(period)
+    return [d for d in definitions
+            if d.get('ativa', True)
+            and recurrence_key(d, period) not in reserved
+            and recurrence_key(d, period) not in failed
+            and store.completed(recurrence_key(d, period)) is None]
+
+def build_rows(definitions, period):
+    """Linhas de lote (formato do CSV) das definições para o período."""
+    year, month = parse_period(period)
+    return [{
+        "data": emission_date(d, year, month).strftime("%d/%m/%Y"),
+        "codigo_cliente": str(d.get('codigo_cliente', '')),
+        "fornecedor": d.get('fornecedor', ''),
+        "valor": _format_value(d.get('valor')),
+        "descricao": d.get('descricao', ''),
+        "template": d.get('template', ''),
+        "chave": recurrence_key(d, period),
+    } for d in definitions]
+
+def prepare_period(period, definitions, estado, clientes, fornecedores, templates, retry_failed=False):
+    """
+    Valida as notas pendentes do período e reserva as faturas (grava o estado e o
+    journal). Rápido: nenhuma planilha é aberta.
+    Definições com erro (cliente removido, template inexistente...) ficam de fora
+    e são informadas; as demais seguem.
+    Retorna (journal ou None se nada a gerar, erros [(nome, mensagem)]).
+    """
+    pending = pending_definitions(definitions, period, retry_failed=retry_failed)
+    validator = BatchValidator(clientes, fornecedores, templates)
+    notes, errors = validator.validate(build_rows(pending, period), estado['ultima_fatura'], first_line=1)
+    named_errors = [(pending[line - 1].get('nome', f"linha {line}"), msg) for line, msg in errors]
+    if errors:
+        invalid = {line for line, _ in errors}
+        pending = [d for line, d in enumerate(pending, 1) if line not in invalid]
+        notes, _ = validator.validate(build_rows(pending, period), estado['ultima_fatura'], first_line=1)
+    if not notes:
+        return None, named_errors
+    journal_path = new_journal_path(_journal_label(period))
+    return start_journal(notes, estado, journal_path, origem=ORIGEM_PREFIX + period), named_errors
+
+def resume_reserved(estado, map_func=map):
+    """Gera as notas recorrentes reservadas em journals interrompidos. Retorna os resultados."""
+    results = []
+    for path in sorted({path for path, _ in reserved_keys().values()}):
+        results.extend(resume_batch(path, estado, map_func))
+    return results
+
+def pregenerate(estado, clientes, fornecedores, templates, definitions=None, periods=None, today=None, map_func=map,
+                retry_failed=False):
+    """
+    Pré-gera as notas recorrentes dos períodos indicados (padrão: due_periods);
+    com retry_failed, tenta de novo as recusadas.
+    Retorna {período: (resultados, erros)}, com resultados no formato dos lotes,
+    ou None se outro processo já estiver pré-gerando.
+    """
+    definitions = load_recorrencias() if definitions is None else definitions
+    if not acquire_lock():
+        return None
+    try:
+        summary = {}
+        resumed = resume_reserved(estado, map_func)
+        if resumed:
+            summary["retomadas"] = (resumed, [])
+        for period in periods or due_periods(definitions, today):
+            journal, errors = prepare_period(period, definitions, estado, clientes, fornecedores, templates,
+                                             retry_failed)
+            results = execute_journal(journal, map_func) if journal is not None else []
+            summary[period] = (results, errors)
+        return summary
+    finally:
+        release_lock()
+
+
+# --- Conferência do período ---
+
+def period_report(period, definitions=None):
+    """
+    Situação de cada definição ativa no período, para conferência e impressão:
+    lista de dicts com nome, codigo_cliente, fornecedor, situacao
+    ('gerada', 'reservada', 'falha' ou 'pendente'), fatura e arquivo.
+    """
+    definitions = load_recorrencias() if definitions is None else definitions
+    store = get_store()
+    reserved = reserved_keys()
+    failed = failed_keys(period)
+    report = []
+    for d in definitions:
+        if not d.get('ativa', True):
+            continue
+        key = recurrence_key(d, period)
+        item = {"nome": d['nome'], "codigo_cliente": str(d.get('codigo_cliente', '')),
+                "fornecedor": d.get('fornecedor', ''), "situacao": "pendente", "fatura": "", "arquivo": ""}
+        done = store.completed(key)
+        if done is not None:
+            item.update(situacao="gerada", fatura=done.get('fatura', ''), arquivo=done.get('arquivo', ''))
+        elif key in reserved:
+            item.update(situacao="reservada", fatura=reserved[key][1]['fatura'])
+        elif key in failed:
+            item.update(situacao="falha", fatura=failed[key][0]['fatura'])
+        report.append(item)
+    return report
@@ -0,0 +1,162 @@
+"""
+Profiler por amostragem, embutido (sem ferramentas externas).
+
+Uma thread em segundo plano lê periodicamente a pilha de todas as threads do
+processo (sys._current_frames) — thread principal do Tk, gravação agrupada,
+transferências, pré-aquecimento — e conta quantas vezes cada pilha apareceu.
+O custo fica na thread de amostragem e é proporcional à profundidade das pilhas,
+não ao trabalho do programa; o programa perfilado não é instrumentado.
+
+Ao parar, grava em PERFIS_FOLDER:
+    <nome>.folded            pilhas colapsadas ("thread;f1;f2 contagem"), para
+                             flamegraph.pl, speedscope, inferno etc.
+    <nome>.speedscope.json   abre direto em https://www.speedscope.app (uma
+                             aba por thread; visão "Left Heavy" = flame graph)
+
+As contagens são agregadas por pilha (memória limitada em sessões longas), então
+o perfil mostra onde o tempo foi, não a linha do tempo. Workers em processos
+separados (pool do daemon) não são amostrados.
+"""
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+PERFIS_FOLDER = "perfis"
+DEFAULT_INTERVAL = 0.005 # segundos entre amostras (200 Hz)
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class SamplingProfiler:
+    """Amostra as pilhas de todas as threads enquanto estiver ligado."""
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self._frames = [] # índice -> (função, arquivo, linha)
+        self._frame_ids = {} # objeto de código -> índice em _frames
+        self._counts = {} # (nome_da_thread, pilha em índices, raiz primeiro) -> amostras
+        self._weights = {} # mesma chave -> segundos (intervalo real entre amostras)
+        self._thread = None
+        self._stop = threading.Event()
+        self.samples = 0
+        self.started_at = None
+        self.elapsed = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self.started_at = datetime.datetime.now()
+        self._start_clock = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def _frame_id(self, code):
+        index = self._frame_ids.get(code)
+        if index is None:
+            index = self._frame_ids[code] = len(self._frames)
+            self._frames.append((code.co_name, code.co_filename, code.co_firstlineno))
+        return index
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            dt, last = now - last, now
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_id(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                key = (names.get(ident, f"thread-{ident}"), tuple(stack))
+                self._counts[key] = self._counts.get(key, 0) + 1
+                self._weights[key] = self._weights.get(key, 0.0) + dt
+            self.samples += 1
+
+    def stop(self):
+        """Para a amostragem (os dados ficam disponíveis para gravação)."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.elapsed = time.perf_counter() - self._start_clock
+
+    # --- Saída ---
+
+    def _label(self, index):
+        name, filename, line = self._frames[index]
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    def write_folded(self, path):
+        """Pilhas colapsadas: uma linha "thread;raiz;...;folha contagem" por pilha."""
+        with open(path, 'w', encoding='utf-8') as f:
+            for (thread_name, stack), count in sorted(self._counts.items(), key=lambda item: -item[1]):
+                frames = ";".join(self._label(i).replace(";", ":") for i in stack)
+                f.write(f"{thread_name};{frames} {count}\n" if frames else f"{thread_name} {count}\n")
+
+    def to_speedscope(self, name="perfil"):
+        """Perfil no formato do speedscope (um perfil "sampled" por thread, pesos em ms)."""
+        profiles = {}
+        for (thread_name, stack), seconds in self._weights.items():
+            profile = profiles.setdefault(thread_name, {
+                "type": "sampled", "name": thread_name, "unit": "milliseconds",
+                "startValue": 0, "endValue": 0, "samples": [], "weights": [],
+            })
+            profile["samples"].append(list(stack))
+            profile["weights"].append(seconds * 1000)
+            profile["endValue"] += seconds * 1000
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "nota_credito sampling_profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": n, "file": f, "line": l} for n, f, l in self._frames]},
+            "profiles": sorted(profiles.values(), key=lambda p: p["name"] != "MainThread"),
+        }
+
+    def save(self, folder=PERFIS_FOLDER, name=None):
+        """Grava .folded e .speedscope.json. Retorna (caminho_folded, caminho_speedscope)."""
+        os.makedirs(folder, exist_ok=True)
+        name = name or f"perfil_{(self.started_at or datetime.datetime.now()):%Y%m%d_%H%M%S}"
+        base = os.path.join(folder, name)
+        self.write_folded(base + ".folded")
+        with open(base + ".speedscope.json", 'w', encoding='utf-8') as f:
+            json.dump(self.to_speedscope(name), f, ensure_ascii=False)
+        return base + ".folded", base + ".speedscope.json"
+
+
+# --- Liga/desliga (atalho da interface) ---
+
+_active = None
+_active_lock = threading.Lock()
+
+def is_profiling():
+    return _active is not None
+
+def toggle_profiling(interval=DEFAULT_INTERVAL, folder=PERFIS_FOLDER):
+    """
+    Liga o profiler ou, se já estiver ligado, desliga e grava o perfil.
+    Retorna None ao ligar, ou (caminho_folded, caminho_speedscope, amostras, segundos) ao desligar.
+    """
+    global _active
+    with _active_lock:
+        if _active is None:
+            _active = SamplingProfiler(interval)
+            _active.start()
+            return None
+        profiler, _active = _active, None
+    profiler.stop()
+    folded, speedscope = profiler.save(folder)
+    return folded, speedscope, profiler.samples, profiler.elapsed
@@ -0,0 +1,163 @@
+"""
+Snapshot binário dos dados já carregados, para abrir sem refazer o parse.
+
+Com uma base grande de clientes, ler o clientes.json indentado e montar o índice
+de busca é boa parte da abertura. O snapshot guarda o resultado pronto (pickle,
+protocolo 5) numa pasta local, com a chave do arquivo de origem no cabeçalho:
+tamanho, mtime e SHA-256. Na abertura seguinte, se a origem ainda bate com a
+chave, o snapshot é carregado direto; se mudou (edição, outra máquina,
+exportação do ERP) ou o snapshot estiver corrompido, quem chama volta ao JSON.
+
+O tamanho e o mtime descartam a maioria das origens alteradas sem ler o arquivo;
+o SHA-256 pega a alteração que não muda nenhum dos dois (sistemas de arquivos
+com mtime grosseiro, cópia que preserva a data).
+
+O conteúdo é gravado em seções, carregadas uma a uma: o que a janela precisa
+para abrir vem na primeira e o resto (ex.: o índice de busca) pode ser carregado
+depois. Objetos compartilhados da primeira seção (os clientes) são referenciados
+nas seguintes pela posição, então continuam sendo as mesmas instâncias.
+
+O snapshot é só cache: pode ser apagado a qualquer momento. Como é pickle, fica
+na pasta do aplicativo, com a mesma confiança dos próprios arquivos .py.
+"""
+import contextlib
+import gc
+import hashlib
+import io
+import os
+import pickle
+
+SNAPSHOT_FOLDER = "snapshots"
+# Mudar ao alterar as classes guardadas (Client, ClientRegistry, ClientSearchIndex):
+# snapshots de outro formato são ignorados e regravados
+SNAPSHOT_FORMAT = 2
+
+
+def snapshot_path(source):
+    return os.path.join(SNAPSHOT_FOLDER, os.path.basename(source) + ".pickle")
+
+
+def source_key(st, data):
+    """
+    Chave da origem: `st` é o os.stat do arquivo feito ANTES da leitura e `data`,
+    os bytes lidos. Se o arquivo mudar no meio, a chave fica com o mtime antigo e o
+    snapshot nunca casa com a versão nova.
+    """
+    return {"tamanho": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": hashlib.sha256(data).hexdigest()}
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """
+    Uma seção cria centenas de milhares de objetos de uma vez; as coletas do gc
+    disparadas no meio só custam tempo (nada ali é lixo) e triplicam a carga.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _matches(header, source):
+    """A origem em disco ainda é a do snapshot? (tamanho/mtime primeiro; o hash só se ambos baterem)."""
+    if not isinstance(header, dict) or header.get("formato") != SNAPSHOT_FORMAT:
+        return False
+    try:
+        st = os.stat(source)
+    except OSError:
+        return False
+    if st.st_size != header["tamanho"] or st.st_mtime_ns != header["mtime_ns"]:
+        return False
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest() == header["sha256"]
+
+
+class SnapshotReader:
+    """Seções de um snapshot já validado, em memória, carregadas em ordem com load()."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def load(self, shared=None):
+        """
+        Carrega a próxima seção. `shared` é a lista dos objetos compartilhados (a
+        mesma, na mesma ordem, passada em save_snapshot), já carregada numa seção anterior.
+        """
+        unpickler = pickle.Unpickler(self._stream)
+        if shared is not None:
+            unpickler.persistent_load = shared.__getitem__
+        with _gc_paused():
+            return unpickler.load()
+
+
+def load_snapshot(source):
+    """
+    Retorna o SnapshotReader da versão atual de `source`, ou None (sem snapshot,
+    desatualizado ou ilegível). O arquivo é lido de uma vez: as seções seguintes
+    podem ser carregadas depois, mesmo que o snapshot seja regravado no meio.
+    """
+    path = snapshot_path(source)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            stream = io.BytesIO(f.read())
+        if not _matches(pickle.load(stream), source):
+            return None
+    except Exception as e:
+        print(f"Snapshot {path} ignorado (ilegível): {e}")
+        return None
+    return SnapshotReader(stream)
+
+
+def is_current(source):
+    """Indica se o snapshot de `source` existe e corresponde ao arquivo em disco."""
+    try:
+        with open(snapshot_path(source), 'rb') as f:
+            return _matches(pickle.load(f), source)
+    except Exception:
+        return False
+
+
+class _SharedPickler(pickle.Pickler):
+    """Grava os objetos compartilhados como referência à posição (ver SnapshotReader.load)."""
+
+    def __init__(self, f, positions):
+        super().__init__(f, protocol=5)
+        self._positions = positions
+
+    def persistent_id(self, obj):
+        return self._positions.get(id(obj))
+
+
+def save_snapshot(source, key, sections, shared=None):
+    """
+    Grava o snapshot: cabeçalho com a chave da origem (ver source_key) e os objetos
+    de `sections`, em sequência. Os objetos da lista `shared` vão inteiros na
+    primeira seção e, nas seguintes, só como referência à posição na lista.
+    Grava num temporário e renomeia, para que uma leitura concorrente nunca veja
+    metade do arquivo. Retorna True se gravou.
+    """
+    path = snapshot_path(source)
+    tmp_path = path + ".tmp"
+    positions = {id(obj): pos for pos, obj in enumerate(shared or ())}
+    try:
+        os.makedirs(SNAPSHOT_FOLDER, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(dict(key, formato=SNAPSHOT_FORMAT, origem=os.path.basename(source)), f, protocol=5)
+            for index, section in enumerate(sections):
+                if index == 0 or not positions:
+                    pickle.dump(section, f, protocol=5)
+                else:
+                    _SharedPickler(f, positions).dump(section)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"Erro ao gravar o snapshot {path}: {e}")
+        return False
@@ -0,0 +1,165 @@
+"""
+Teste de resistência (soak) para sessões longas: detecta crescimento de memória.
+
+Executa milhares de vezes a geração de notas (process_and_save_note) e os
+caminhos de cadastro de clientes, templates e fornecedores, tirando snapshots do
+tracemalloc e medindo a memória residente (RSS) em intervalos. Falha (código de
+saída 1) se o crescimento por iteração passar do limite, listando os principais
+pontos de alocação.
+
+O crescimento por iteração é medido entre a primeira e a última medição, para
+que caches que enchem no início (openpyxl, alocador) não contem como vazamento.
+
+Tudo roda numa pasta temporária (os arquivos de dados usam caminhos relativos),
+sem tocar nos dados reais.
+
+Uso:
+    python soak_test.py [--iteracoes 2000] [--intervalo 200] [--limite-bytes 1024]
+"""
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from backend_data import (
+    process_and_save_note, load_estado, save_clientes, save_templates, save_fornecedores,
+    _load_json_file, CLIENTES_FILE, TEMPLATES_FILE, INITIAL_FORNECEDORES,
+)
+from benchmarks import _rss_bytes
+from client_registry import load_clientes_registry
+from file_watcher import merge_records
+from persistence import PersistenceManager
+
+WARMUP_ITERATIONS = 50
+TOP_SITES = 10
+
+
+def _note_step(i, estado, fornecedores):
+    """Uma nota por iteração; as faturas giram para reaproveitar os mesmos arquivos."""
+    supplier = fornecedores[i % len(fornecedores)]
+    ok, msg, _ = process_and_save_note(
+        "30/09/2026", str(1 + i % 20), "6000", "WR SOAK COMERCIO DE INSUMOS AGRICOLAS LTDA",
+        "DESCONTO COMERCIAL REFERENTE A ACERTO COMERCIAL DE PRODUTOS.", 100.0 + i,
+        estado, supplier['modelo'], supplier['nome'],
+    )
+    if not ok:
+        raise RuntimeError(msg)
+
+
+def _crud_step(i, clientes, templates, fornecedores, persistence):
+    """Cadastro, edição e exclusão como nos modais da GUI, com gravação agrupada e recarga."""
+    code = f"SOAK{i % 50}"
+    if clientes.add(code, f"CLIENTE SOAK {i}") is None:
+        clientes.update(code, code, f"CLIENTE SOAK EDITADO {i}")
+    if i % 3 == 0:
+        clientes.remove(code)
+    persistence.mark_dirty('clientes', clientes.to_records())
+
+    name = f"Template soak {i % 10}"
+    existing = next((t for t in templates if t['nome'] == name), None)
+    if existing:
+        existing['descricao'] = f"DESCRIÇÃO {i}"
+    else:
+        templates.append({"nome": name, "descricao": f"DESCRIÇÃO {i}"})
+    persistence.mark_dirty('templates', [dict(t) for t in templates])
+
+    supplier = fornecedores[i % len(fornecedores)]
+    supplier['nome'] = supplier['nome'].split(' #')[0] + f" #{i % 5}"
+    persistence.mark_dirty('fornecedores', [dict(f) for f in fornecedores])
+
+    if i % 25 == 0:
+        # Recarga como a do monitor de arquivos
+        persistence.flush()
+        clientes.merge(_load_json_file(CLIENTES_FILE, strict=True) or [])
+        templates[:] = merge_records(templates, _load_json_file(TEMPLATES_FILE, strict=True) or [], 'nome')
+        clientes.sorted_by_code()
+
+
+def run_soak(iterations, interval, limit_bytes, rss_limit_bytes, frames=1):
+    workdir = tempfile.mkdtemp(prefix="soak_notas_")
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        save_clientes([{"codigo": "6000", "nome": "WR SOAK COMERCIO DE INSUMOS AGRICOLAS LTDA"}])
+        save_templates([])
+        save_fornecedores(INITIAL_FORNECEDORES)
+        clientes = load_clientes_registry()
+        templates = []
+        fornecedores = [dict(f) for f in INITIAL_FORNECEDORES]
+        estado = load_estado()
+        persistence = PersistenceManager({
+            'clientes': save_clientes, 'templates': save_templates, 'fornecedores': save_fornecedores,
+        }, flush_delay=0.05)
+
+        def step(i):
+            _note_step(i, estado, INITIAL_FORNECEDORES)
+            _crud_step(i, clientes, templates, fornecedores, persistence)
+
+        # Aquecimento: caches (modelos, imports) estabilizam antes da medição
+        for i in range(WARMUP_ITERATIONS):
+            step(i)
+
+        gc.collect()
+        tracemalloc.start(frames)
+        baseline = tracemalloc.take_snapshot()
+        base_traced = tracemalloc.get_traced_memory()[0]
+        print(f"{'iteração':>9} | {'heap Python (KB)':>16} | {'RSS (MB)':>9}")
+        samples = []  # (iterações, heap rastreado, RSS)
+
+        for i in range(WARMUP_ITERATIONS, WARMUP_ITERATIONS + iterations):
+            step(i)
+            done = i - WARMUP_ITERATIONS + 1
+            if done % interval == 0 or done == iterations:
+                gc.collect()
+                traced = tracemalloc.get_traced_memory()[0]
+                rss = _rss_bytes()
+                samples.append((done, traced, rss))
+                rss_text = "n/d" if rss is None else f"{rss / 1e6:9.1f}"
+                print(f"{done:>9} | {(traced - base_traced) / 1024:16.1f} | {rss_text:>9}", flush=True)
+
+        persistence.shutdown()
+        gc.collect()
+        final = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if len(samples) < 2:
+        print("São necessárias ao menos duas medições (aumente --iteracoes ou reduza --intervalo).")
+        return 2
+    (first_i, first_heap, first_rss), (last_i, last_heap, last_rss) = samples[0], samples[-1]
+    measured = last_i - first_i
+    per_iteration = (last_heap - first_heap) / measured
+    rss_per_iteration = None if first_rss is None else (last_rss - first_rss) / measured
+    print(f"\nCrescimento do heap Python: {per_iteration:.1f} bytes/iteração (limite {limit_bytes:.0f})")
+    if rss_per_iteration is not None:
+        print(f"Crescimento do RSS: {rss_per_iteration:.1f} bytes/iteração (limite {rss_limit_bytes:.0f})")
+
+    print("\nPrincipais pontos de alocação (crescimento desde o início da medição):")
+    for stat in final.compare_to(baseline, 'traceback')[:TOP_SITES]:
+        print(f"  {stat.size_diff / 1024:+9.1f} KB  {stat.count_diff:+7d} blocos")
+        for line in stat.traceback.format()[-2 * frames:]:
+            print(f"      {line.strip()}")
+
+    failed = per_iteration > limit_bytes or (rss_per_iteration is not None and rss_per_iteration > rss_limit_bytes)
+    print("\nRESULTADO:", "FALHOU (possível vazamento de memória)" if failed else "OK")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de resistência de memória do gestor de notas.")
+    parser.add_argument("--iteracoes", type=int, default=2000)
+    parser.add_argument("--intervalo", type=int, default=200, help="Iterações entre medições.")
+    parser.add_argument("--limite-bytes", type=float, default=1024, help="Crescimento máximo do heap Python por iteração.")
+    parser.add_argument("--limite-rss-bytes", type=float, default=16 * 1024, help="Crescimento máximo do RSS por iteração.")
+    parser.add_argument("--quadros", type=int, default=1, help="Quadros de pilha por alocação (mais quadros = mais lento).")
+    args = parser.parse_args(argv)
+    return run_soak(args.iteracoes, args.intervalo, args.limite_bytes, args.limite_rss_bytes, args.quadros)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
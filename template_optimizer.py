@@ -0,0 +1,336 @@
+"""
+Otimização dos modelos XLSX dos fornecedores.
+
+Toda nota gerada herda o conteúdo do modelo: estilos sem uso, células vazias sem
+formatação, nomes definidos quebrados, propriedades personalizadas e o texto de
+exemplo das células preenchidas pela nota. Tudo isso é regravado e recomprimido
+a cada nota. Este módulo gera, uma única vez por versão do modelo, uma cópia
+enxuta em MODELOS_OTIMIZADOS_FOLDER, que _load_template_workbook passa a usar
+enquanto o modelo original não mudar (o manifesto guarda o SHA-256 do original).
+
+Antes de instalar a cópia, uma nota de exemplo é preenchida com o original e com
+a cópia e as duas são comparadas célula a célula (valor, fonte, preenchimento,
+bordas, alinhamento, formato numérico), junto com mesclagens, dimensões, imagens
+e configuração de impressão. Se houver qualquer diferença a cópia não é
+instalada (a menos que forcar=True) e as diferenças são informadas.
+
+Miniaturas (docProps/thumbnail) e a cadeia de cálculo (calcChain) não são
+preservadas pelo openpyxl, então já somem ao regravar o modelo.
+"""
+import datetime
+import hashlib
+import io
+import os
+import statistics
+import time
+from copy import copy
+
+from backend_data import (
+    MODELOS_OTIMIZADOS_FOLDER, MODELOS_OTIMIZADOS_MANIFEST,
+    _build_data_map, _fill_note_sheet, _load_json_file, _resolve_model_path, _save_json_file,
+    load_fornecedores,
+)
+
+BUILTIN_FORMATS_MAX_SIZE = 164 # numFmtId a partir do qual os formatos são personalizados
+SAVE_TIMING_RUNS = 15
+MAX_REPORTED_DIFFERENCES = 50
+
+# Nota de exemplo usada na comparação (textos longos para exercitar quebra de linha)
+_SAMPLE_NOTE = ('15/07/2025', '123456', 'C00123', 'CLIENTE DE EXEMPLO COMÉRCIO DE INSUMOS AGRÍCOLAS LTDA',
+                'DESCONTO COMERCIAL EM PRODUTOS CONFORME ACERTO COMERCIAL ' * 3, 12345.67)
+
+
+def _sample_data_map(model_filename):
+    data_input, invoice, code, name, desc, value = _SAMPLE_NOTE
+    return _build_data_map(data_input, invoice, code, name, desc, value, model_filename, 'FORNECEDOR DE EXEMPLO')
+
+
+# --- Passos de otimização ---
+
+def _clear_placeholders(ws, model_filename):
+    """Apaga o texto de exemplo das células que toda nota sobrescreve (mantém o estilo)."""
+    from openpyxl.cell.cell import MergedCell
+
+    cleared = 0
+    for coord in _sample_data_map(model_filename):
+        cell = ws[coord]
+        if not isinstance(cell, MergedCell) and cell.value is not None:
+            cell.value = None
+            cleared += 1
+    return cleared
+
+
+def _styled_columns(ws):
+    columns = set()
+    for dim in ws.column_dimensions.values():
+        if dim.has_style and dim.min and dim.max:
+            columns.update(range(dim.min, dim.max + 1))
+    return columns
+
+
+def _prune_empty_cells(ws):
+    """
+    Remove células sem valor e sem formatação. Não mexe em linhas/colunas com
+    estilo próprio: ali a célula explícita "sem estilo" é o que anula o estilo da linha.
+    """
+    from openpyxl.cell.cell import MergedCell
+
+    styled_rows = {r for r, dim in ws.row_dimensions.items() if dim.has_style}
+    styled_columns = _styled_columns(ws)
+    removable = [
+        coord for coord, cell in ws._cells.items()
+        if cell.value is None and not cell.has_style and not isinstance(cell, MergedCell)
+        and cell.hyperlink is None and cell.comment is None
+        and coord[0] not in styled_rows and coord[1] not in styled_columns
+    ]
+    for coord in removable:
+        del ws._cells[coord]
+    return len(removable)
+
+
+def _remove_broken_names(wb):
+    """Remove nomes definidos que apontam para referências inexistentes (#REF!)."""
+    removed = 0
+    for names in [wb.defined_names] + [ws.defined_names for ws in wb.worksheets]:
+        for name in [n for n, dn in names.items() if '#REF!' in (dn.value or '')]:
+            del names[name]
+            removed += 1
+    return removed
+
+
+def _styled_objects(wb):
+    for ws in wb.worksheets:
+        yield from ws._cells.values()
+        yield from ws.row_dimensions.values()
+        yield from ws.column_dimensions.values()
+
+
+def _compact_styles(wb):
+    """
+    Reconstrói as tabelas de estilo só com o que as células e dimensões usam.
+    Os primeiros itens de cada tabela (padrões exigidos pelo Excel) são mantidos.
+    Retorna {tabela: (antes, depois)}.
+    """
+    from openpyxl.styles.cell_style import StyleArray
+    from openpyxl.utils.indexed_list import IndexedList
+
+    fonts = IndexedList([wb._fonts[0]])
+    fills = IndexedList(list(wb._fills[:2])) # "none" e "gray125" são obrigatórios
+    borders = IndexedList([wb._borders[0]])
+    alignments = IndexedList([wb._alignments[0]])
+    protections = IndexedList([wb._protections[0]])
+    number_formats = IndexedList()
+    remapped = {}
+
+    def remap(style):
+        key = tuple(style)
+        new = remapped.get(key)
+        if new is None:
+            new = StyleArray()
+            new.fontId = fonts.add(wb._fonts[style.fontId])
+            new.fillId = fills.add(wb._fills[style.fillId])
+            new.borderId = borders.add(wb._borders[style.borderId])
+            new.alignmentId = alignments.add(wb._alignments[style.alignmentId])
+            new.protectionId = protections.add(wb._protections[style.protectionId])
+            if style.numFmtId < BUILTIN_FORMATS_MAX_SIZE:
+                new.numFmtId = style.numFmtId
+            else:
+                code = wb._number_formats[style.numFmtId - BUILTIN_FORMATS_MAX_SIZE]
+                new.numFmtId = number_formats.add(code) + BUILTIN_FORMATS_MAX_SIZE
+            new.xfId, new.pivotButton, new.quotePrefix = style.xfId, style.pivotButton, style.quotePrefix
+            remapped[key] = new
+        return new
+
+    cell_styles = IndexedList([remap(wb._cell_styles[0])])
+    for obj in _styled_objects(wb):
+        if obj.has_style:
+            obj.style_id # Registra o estilo como o openpyxl faz ao salvar (contagem "antes")
+            obj._style = StyleArray(remap(obj._style)) # cópia: o original pode ser compartilhado
+            cell_styles.add(obj._style)
+
+    before = {
+        "estilos": len(wb._cell_styles), "fontes": len(wb._fonts), "preenchimentos": len(wb._fills),
+        "bordas": len(wb._borders), "alinhamentos": len(wb._alignments),
+        "protecoes": len(wb._protections), "formatos": len(wb._number_formats),
+    }
+    wb._cell_styles, wb._fonts, wb._fills, wb._borders = cell_styles, fonts, fills, borders
+    wb._alignments, wb._protections, wb._number_formats = alignments, protections, number_formats
+    for named_style in wb._named_styles:
+        named_style.bind(wb) # Recoloca nas tabelas as fontes/bordas dos estilos nomeados
+    after = {
+        "estilos": len(wb._cell_styles), "fontes": len(wb._fonts), "preenchimentos": len(wb._fills),
+        "bordas": len(wb._borders), "alinhamentos": len(wb._alignments),
+        "protecoes": len(wb._protections), "formatos": len(wb._number_formats),
+    }
+    return {name: (before[name], after[name]) for name in before}
+
+
+def build_optimized_template(source_bytes, model_filename):
+    """Aplica todos os passos ao conteúdo do modelo. Retorna (bytes_otimizados, resumo)."""
+    from openpyxl import load_workbook
+    from openpyxl.packaging.custom import CustomPropertyList
+
+    wb = load_workbook(io.BytesIO(source_bytes))
+    summary = {
+        "textos_de_exemplo": _clear_placeholders(wb.active, model_filename),
+        "celulas_vazias": sum(_prune_empty_cells(ws) for ws in wb.worksheets),
+        "nomes_quebrados": _remove_broken_names(wb),
+        "propriedades": len(wb.custom_doc_props),
+    }
+    wb.custom_doc_props = CustomPropertyList()
+    summary["tabelas"] = _compact_styles(wb)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue(), summary
+
+
+# --- Comparação (original x otimizado) ---
+
+def _fill_sample(template_bytes, model_filename):
+    """Preenche a nota de exemplo. Retorna (bytes_da_nota, segundos para preencher e salvar)."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(template_bytes))
+    start = time.perf_counter()
+    _fill_note_sheet(wb.active, _sample_data_map(model_filename))
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue(), time.perf_counter() - start
+
+
+def _cell_signature(cell):
+    # copy() desembrulha os StyleProxy, que não se comparam entre si
+    return (cell.value, copy(cell.font), copy(cell.fill), copy(cell.border), copy(cell.alignment),
+            cell.number_format, copy(cell.protection))
+
+
+def _sheet_differences(ws_a, ws_b):
+    differences = []
+    coords = set(ws_a._cells) | set(ws_b._cells)
+    for row, column in sorted(coords):
+        a = ws_a.cell(row=row, column=column)
+        b = ws_b.cell(row=row, column=column)
+        if _cell_signature(a) != _cell_signature(b):
+            differences.append(f"{ws_a.title}!{a.coordinate}: célula diferente")
+
+    if sorted(map(str, ws_a.merged_cells.ranges)) != sorted(map(str, ws_b.merged_cells.ranges)):
+        differences.append(f"{ws_a.title}: mesclagens diferentes")
+    for key in set(ws_a.column_dimensions) | set(ws_b.column_dimensions):
+        a, b = ws_a.column_dimensions[key], ws_b.column_dimensions[key]
+        if (a.width, a.hidden) != (b.width, b.hidden):
+            differences.append(f"{ws_a.title}: largura da coluna {key} diferente")
+    for key in set(ws_a.row_dimensions) | set(ws_b.row_dimensions):
+        a, b = ws_a.row_dimensions[key], ws_b.row_dimensions[key]
+        if (a.height, a.hidden) != (b.height, b.hidden):
+            differences.append(f"{ws_a.title}: altura da linha {key} diferente")
+
+    def images(ws):
+        return sorted((img.anchor._from.row, img.anchor._from.col, img.width, img.height,
+                       hashlib.sha256(img._data()).hexdigest()) for img in ws._images)
+    if images(ws_a) != images(ws_b):
+        differences.append(f"{ws_a.title}: imagens diferentes")
+    for attr in ("page_setup", "page_margins", "print_options", "print_area", "print_title_rows", "print_title_cols"):
+        if getattr(ws_a, attr) != getattr(ws_b, attr):
+            differences.append(f"{ws_a.title}: configuração de impressão diferente ({attr})")
+    return differences
+
+
+def compare_filled_outputs(original_note, optimized_note):
+    """Lista as diferenças visíveis entre duas notas preenchidas (vazia se equivalentes)."""
+    from openpyxl import load_workbook
+
+    wb_a = load_workbook(io.BytesIO(original_note))
+    wb_b = load_workbook(io.BytesIO(optimized_note))
+    if wb_a.sheetnames != wb_b.sheetnames:
+        return ["abas diferentes"]
+    differences = []
+    for ws_a, ws_b in zip(wb_a.worksheets, wb_b.worksheets):
+        differences.extend(_sheet_differences(ws_a, ws_b))
+    return differences
+
+
+# --- Instalação ---
+
+def _load_manifest():
+    manifest = _load_json_file(MODELOS_OTIMIZADOS_MANIFEST)
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def _median_save_ms(template_bytes, model_filename):
+    return statistics.median(_fill_sample(template_bytes, model_filename)[1] for _ in range(SAVE_TIMING_RUNS)) * 1000
+
+
+def optimize_template(model_filename, instalar=True, forcar=False):
+    """
+    Gera a cópia otimizada do modelo, compara uma nota preenchida com o original e
+    com a cópia e, se forem equivalentes (ou forcar=True), instala a cópia.
+    Retorna (True, relatório) ou (False, mensagem_de_erro).
+    """
+    model_path = _resolve_model_path(model_filename)
+    if model_path is None:
+        return False, f"O arquivo modelo '{model_filename}' não foi encontrado."
+    try:
+        with open(model_path, 'rb') as f:
+            source = f.read()
+        optimized, summary = build_optimized_template(source, model_filename)
+        original_note, _ = _fill_sample(source, model_filename)
+        optimized_note, _ = _fill_sample(optimized, model_filename)
+        differences = compare_filled_outputs(original_note, optimized_note)
+        report = {
+            "modelo": model_filename,
+            "tamanho_original": len(source),
+            "tamanho": len(optimized),
+            "nota_original": len(original_note),
+            "nota": len(optimized_note),
+            "salvar_ms_original": _median_save_ms(source, model_filename),
+            "salvar_ms": _median_save_ms(optimized, model_filename),
+            "removidos": summary,
+            "diferencas": differences[:MAX_REPORTED_DIFFERENCES],
+            "total_diferencas": len(differences),
+            "instalado": False,
+        }
+    except Exception as e:
+        return False, f"Erro ao otimizar o modelo '{model_filename}': {e}"
+
+    if instalar and (not differences or forcar):
+        try:
+            os.makedirs(MODELOS_OTIMIZADOS_FOLDER, exist_ok=True)
+            target = os.path.join(MODELOS_OTIMIZADOS_FOLDER, model_filename)
+            with open(target + ".tmp", 'wb') as f:
+                f.write(optimized)
+            os.replace(target + ".tmp", target)
+        except OSError as e:
+            return False, f"Erro ao gravar o modelo otimizado '{model_filename}': {e}"
+        # O arquivo é gravado antes do manifesto: até o manifesto apontar para ele,
+        # a geração continua usando o original.
+        manifest = _load_manifest()
+        manifest[model_filename] = {
+            "arquivo": model_filename,
+            "origem_sha256": hashlib.sha256(source).hexdigest(),
+            "sha256": hashlib.sha256(optimized).hexdigest(),
+            "tamanho_original": len(source),
+            "tamanho": len(optimized),
+            "otimizado_em": datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        _save_json_file(manifest, MODELOS_OTIMIZADOS_MANIFEST, durable=True)
+        report["instalado"] = True
+    return True, report
+
+
+def remove_optimized_template(model_filename):
+    """Volta a usar o modelo original. Retorna True se havia uma cópia instalada."""
+    manifest = _load_manifest()
+    entry = manifest.pop(model_filename, None)
+    if entry is None:
+        return False
+    _save_json_file(manifest, MODELOS_OTIMIZADOS_MANIFEST, durable=True)
+    try:
+        os.remove(os.path.join(MODELOS_OTIMIZADOS_FOLDER, entry.get("arquivo", model_filename)))
+    except OSError:
+        pass
+    return True
+
+
+def supplier_models():
+    """Modelos usados pelos fornecedores cadastrados."""
+    return sorted({f.get('modelo') for f in load_fornecedores() if f.get('modelo')})
@@ -0,0 +1,79 @@
+import json
+import multiprocessing
+
+import pytest
+
+import batch
+from backend_data import load_estado, save_estado
+
+BATCHES_PER_PROCESS = 15
+NOTES_PER_BATCH = 5
+
+
+def _validated_notes(count, first_invoice):
+    """Notas como saem da validação, numeradas automaticamente a partir de first_invoice."""
+    return [{"linha": 2 + i, "fatura": str(first_invoice + i), "fatura_automatica": True,
+             "data": "01/03/2026", "codigo_cliente": "1", "nome_cliente": "CLIENTE", "fornecedor": "F",
+             "modelo": "modelo.xlsx", "saida": "individual", "valor": 1.0, "descricao": "x"}
+            for i in range(count)]
+
+
+def _reserve_repeatedly(worker, queue):
+    """Reserva vários lotes validados contra um estado já defasado (como um processo concorrente)."""
+    reserved = []
+    for i in range(BATCHES_PER_PROCESS):
+        estado = {"ultima_fatura": 1, "ultima_descricao": ""}
+        notes = _validated_notes(NOTES_PER_BATCH, 1)
+        batch.start_journal(notes, estado, f"lote_{worker}_{i}.journal")
+        reserved.extend(int(n['fatura']) for n in notes)
+    queue.put(reserved)
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_concurrent_processes_reserve_disjoint_ranges():
+    save_estado({"ultima_fatura": 1, "ultima_descricao": ""})
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    workers = [ctx.Process(target=_reserve_repeatedly, args=(n, queue)) for n in range(2)]
+    for process in workers:
+        process.start()
+    reserved = [queue.get(timeout=60) for _ in workers]
+    for process in workers:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    first, second = (set(r) for r in reserved)
+    assert len(first) == len(second) == BATCHES_PER_PROCESS * NOTES_PER_BATCH
+    assert not first & second
+    assert load_estado()['ultima_fatura'] == max(first | second) + 1
+
+
+def test_reservation_renumbers_only_automatic_invoices():
+    save_estado({"ultima_fatura": 100, "ultima_descricao": ""})
+    notes = _validated_notes(3, 10)
+    notes[1].update(fatura="101")
+    del notes[1]['fatura_automatica']
+    estado = {"ultima_fatura": 10, "ultima_descricao": ""}
+
+    journal = batch.start_journal(notes, estado, "lote.journal")
+
+    assert [n['fatura'] for n in notes] == ["100", "101", "102"]
+    assert estado['ultima_fatura'] == 103 and load_estado()['ultima_fatura'] == 103
+    with open(journal.path, encoding='utf-8') as f:
+        assert all('fatura_automatica' not in n for n in json.loads(f.readline())['notas'])
+
+
+def test_reopened_journal_keeps_its_invoices():
+    journal = batch.start_journal(_validated_notes(2, 5), {"ultima_fatura": 5, "ultima_descricao": ""}, "lote.journal")
+    journal.close()
+    save_estado({"ultima_fatura": 50, "ultima_descricao": ""})
+
+    estado = {"ultima_fatura": 1, "ultima_descricao": ""}
+    reopened = batch.reopen_journal("lote.journal", estado)
+    assert [n['fatura'] for n in reopened.notes] == ["5", "6"]
+    assert estado['ultima_fatura'] == 50
@@ -0,0 +1,182 @@
+import os
+import zipfile
+
+import pytest
+
+import batch
+import checkpoint
+import idempotency
+from checkpoint import BatchJournal, list_archived_journals, list_incomplete_journals
+
+
+def _notes(count, first_invoice=10):
+    return [{"linha": 2 + i, "fatura": str(first_invoice + i), "nome_cliente": f"CLIENTE {i}",
+             "data": "01/03/2026", "codigo_cliente": str(i), "fornecedor": "F", "modelo": "modelo.xlsx",
+             "valor": 1.0, "descricao": "x"} for i in range(count)]
+
+
+def _fake_output(note):
+    """Cria um .xlsx mínimo (zip íntegro) no caminho da nota, como a geração faria."""
+    path = batch.note_output_path(note)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr("x", "x")
+    return path
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_open_ignores_truncated_last_line():
+    path = checkpoint.new_journal_path()
+    journal = BatchJournal.create(path, _notes(3))
+    journal.record(2, True, "10", "a.xlsx")
+    journal.record(3, False, "11", "erro")
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("OK\t4\t12\tb.xl") # queda no meio da escrita
+
+    reopened = BatchJournal.open(path)
+    assert reopened.completed == {2: (True, "10", "a.xlsx"), 3: (False, "11", "erro")}
+    assert not reopened.finished
+    assert reopened.reopened
+
+
+def test_entries_are_synced_in_groups(monkeypatch):
+    synced = []
+    monkeypatch.setattr(checkpoint.os, "fsync", lambda fd: synced.append(fd))
+    journal = BatchJournal.create(checkpoint.new_journal_path(), _notes(5), group_size=3, group_seconds=3600)
+    synced.clear() # fsync do cabeçalho
+
+    journal.record(2, True, "10", "a.xlsx")
+    journal.record(3, True, "11", "b.xlsx")
+    assert synced == []
+    journal.record(4, True, "12", "c.xlsx")
+    assert len(synced) == 1
+    journal.record(5, True, "13", "d.xlsx")
+    journal.close()
+    assert len(synced) == 2
+
+
+def test_finished_with_failures_is_archived():
+    path = checkpoint.new_journal_path()
+    journal = BatchJournal.create(path, _notes(2))
+    journal.record(2, True, "10", "a.xlsx")
+    journal.record(3, False, "11", "erro")
+    journal.close(finished=True)
+    journal.archive()
+
+    assert list_incomplete_journals() == []
+    archived = list_archived_journals()
+    assert archived == [journal.path] and not os.path.exists(path)
+    reopened = BatchJournal.open(archived[0])
+    assert reopened.finished and reopened.failures == 1
+
+
+def test_legacy_end_mark_counts_failures():
+    path = checkpoint.new_journal_path()
+    journal = BatchJournal.create(path, _notes(2))
+    journal.record(2, False, "10", "erro")
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("FIM\n")
+    assert BatchJournal.open(path).failures == 1
+
+
+def test_resume_skips_completed_rows_and_finishes(monkeypatch):
+    notes = _notes(3)
+    path = checkpoint.new_journal_path()
+    journal = BatchJournal.create(path, notes)
+    done_path = batch.note_output_path(notes[0])
+    os.makedirs(os.path.dirname(done_path), exist_ok=True)
+    with zipfile.ZipFile(done_path, 'w') as z:
+        z.writestr("x", "x")
+    journal.record(2, True, "10", done_path)
+    journal.record(3, False, "11", "disco cheio")
+    journal.close()
+
+    generated = []
+
+    def fake_generate(note):
+        generated.append(note['linha'])
+        return note['linha'], True, note['fatura'], batch.note_output_path(note), False
+
+    monkeypatch.setattr(batch, "generate_note", fake_generate)
+    results = batch.resume_batch(path, {"ultima_fatura": 1, "ultima_descricao": ""})
+
+    # A linha concluída não é refeita; a que falhou e a sem entrada são geradas com as mesmas faturas
+    assert generated == [3, 4]
+    assert [(r[0], r[1], r[2]) for r in results] == [(2, True, "10"), (3, True, "11"), (4, True, "12")]
+    assert list_incomplete_journals() == []
+    reopened = BatchJournal.open(list_archived_journals()[0])
+    assert reopened.finished and reopened.failures == 0
+
+
+def test_generation_failure_keeps_journal_open_for_resume(monkeypatch):
+    notes = _notes(2)
+    path = checkpoint.new_journal_path()
+    attempts = []
+
+    def flaky_generate(note):
+        attempts.append((note['linha'], note['fatura']))
+        if note['linha'] == 3 and len(attempts) < 3:
+            return note['linha'], False, note['fatura'], "disco cheio", False
+        return note['linha'], True, note['fatura'], _fake_output(note), False
+
+    monkeypatch.setattr(batch, "generate_note", flaky_generate)
+    results = batch.execute_journal(BatchJournal.create(path, notes))
+    assert [r[1] for r in results] == [True, False]
+    assert list_incomplete_journals() == [path]
+
+    results = batch.resume_batch(path, {"ultima_fatura": 1, "ultima_descricao": ""})
+    # Só a linha com falha é refeita, com a fatura reservada no cabeçalho
+    assert attempts == [(2, "10"), (3, "11"), (3, "11")]
+    assert [r[1] for r in results] == [True, True]
+    assert list_incomplete_journals() == []
+
+
+def test_refused_rows_are_final(monkeypatch):
+    notes = _notes(2)
+    path = checkpoint.new_journal_path()
+
+    def generate(note):
+        if note['linha'] == 3:
+            return note['linha'], False, note['fatura'], "chave usada com outro conteúdo", True
+        return note['linha'], True, note['fatura'], _fake_output(note), False
+
+    monkeypatch.setattr(batch, "generate_note", generate)
+    results = batch.execute_journal(BatchJournal.create(path, notes), archive=False)
+    assert [r[1] for r in results] == [True, False]
+
+    reopened = BatchJournal.open(path)
+    assert reopened.finished and reopened.failures == 1 and reopened.refused == {3}
+    monkeypatch.setattr(batch, "generate_note", lambda note: pytest.fail("não deveria gerar"))
+    assert batch.execute_journal(reopened, archive=False)[1] == (3, False, "11", "chave usada com outro conteúdo")
+
+
+def test_fresh_row_with_existing_output_fails(monkeypatch):
+    notes = _notes(1)
+    stale = batch.note_output_path(notes[0])
+    os.makedirs(os.path.dirname(stale), exist_ok=True)
+    with zipfile.ZipFile(stale, 'w') as z:
+        z.writestr("x", "x")
+    monkeypatch.setattr(batch, "generate_note", lambda note: pytest.fail("não deveria gerar"))
+
+    journal = BatchJournal.create(checkpoint.new_journal_path(), notes)
+    results = batch.execute_journal(journal)
+    assert results[0][1] is False and "já existe" in results[0][3]
+
+
+def test_row_with_completed_key_counts_as_generated(monkeypatch):
+    notes = _notes(1)
+    notes[0]['chave'] = "ERP-1"
+    path = _fake_output(notes[0])
+    monkeypatch.setattr(idempotency, "_store", None)
+    idempotency.get_store().record("ERP-1", "impressao", path, notes[0]['fatura'])
+    monkeypatch.setattr(batch, "generate_note", lambda note: pytest.fail("não deveria gerar"))
+
+    results = batch.execute_journal(BatchJournal.create(checkpoint.new_journal_path(), notes))
+    assert results == [(2, True, "10", path)]
@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import backend_data
+import idempotency
+from idempotency import IdempotencyConflict, IdempotencyStore, request_fingerprint
+
+NOTE = ("01/03/2026", "100", "CLIENTE UM", "Desconto", 10.0, "modelo.xlsx", "FORNECEDOR A")
+
+
+def _fake_generate(data_input, invoice_number, client_code, client_name, description_text, value_float,
+                   estado, model_filename, supplier_name, persist_estado):
+    """Substitui a geração: anota quem gerou e demora o bastante para as requisições se sobreporem."""
+    with open("geradas.log", 'a', encoding='utf-8') as f:
+        f.write(f"{os.getpid()} {invoice_number}\n")
+    time.sleep(0.3)
+    return True, f"nota_{invoice_number}.xlsx"
+
+
+def _generate_with_key(invoice, queue):
+    data_input, client_code, client_name, description, value, model, supplier = NOTE
+    queue.put(backend_data.process_and_save_note(data_input, invoice, client_code, client_name, description, value,
+                                                 {}, model, supplier, persist_estado=False, idempotency_key="ERP-1"))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(idempotency, "_store", None)
+    monkeypatch.setattr(backend_data, "_process_and_save_note", _fake_generate)
+    return tmp_path
+
+
+def _generated():
+    if not os.path.exists("geradas.log"):
+        return []
+    with open("geradas.log", encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_lookup_returns_recorded_result_across_instances():
+    fingerprint = request_fingerprint(*NOTE)
+    IdempotencyStore().record("ERP-1", fingerprint, "nota_7.xlsx", 7)
+
+    entry = IdempotencyStore().lookup("ERP-1", fingerprint) # outro processo: relê do disco
+    assert entry["fatura"] == "7" and entry["arquivo"] == "nota_7.xlsx"
+    assert IdempotencyStore().lookup("ERP-2", fingerprint) is None
+
+
+def test_same_key_with_other_content_is_a_conflict():
+    store = IdempotencyStore()
+    store.record("ERP-1", request_fingerprint(*NOTE), "nota_7.xlsx", 7)
+    changed = NOTE[:4] + (11.0,) + NOTE[5:]
+    with pytest.raises(IdempotencyConflict) as info:
+        store.lookup("ERP-1", request_fingerprint(*changed))
+    assert info.value.stored["fatura"] == "7"
+
+
+def test_repeated_request_returns_stored_invoice_without_generating():
+    data_input, client_code, client_name, description, value, model, supplier = NOTE
+    first = backend_data.process_and_save_note(data_input, "7", client_code, client_name, description, value,
+                                               {}, model, supplier, persist_estado=False, idempotency_key="ERP-1")
+    # Repetição após timeout: chega com o próximo número sugerido
+    again = backend_data.process_and_save_note(data_input, "8", client_code, client_name, description, value,
+                                               {}, model, supplier, persist_estado=False, idempotency_key="ERP-1")
+    assert first == again == (True, "nota_7.xlsx", "7")
+    assert len(_generated()) == 1
+
+
+def test_concurrent_processes_with_same_key_generate_once():
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    workers = [ctx.Process(target=_generate_with_key, args=(invoice, queue)) for invoice in ("7", "8")]
+    for process in workers:
+        process.start()
+    results = [queue.get(timeout=30) for _ in workers]
+    for process in workers:
+        process.join(timeout=30)
+
+    assert len(_generated()) == 1
+    assert results[0] == results[1]
+    assert not [name for name in os.listdir() if name.endswith(".lock")]
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from backend_data import _load_json_file, _save_json_file
+from persistence import PersistenceManager
+
+FILENAME = "templates.json"
+
+
+def _save(data):
+    _save_json_file(data, FILENAME)
+
+
+def _read():
+    with open(FILENAME, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def manager():
+    # Intervalo longo: as gravações acontecem só nos flush() do teste
+    manager = PersistenceManager({'templates': _save}, flush_delay=60, filenames={'templates': FILENAME})
+    yield manager
+    manager.shutdown()
+
+
+def test_flush_writes_pending_snapshot(manager):
+    _save([{"nome": "A"}])
+    manager.mark_dirty('templates', [{"nome": "A"}, {"nome": "B"}])
+    assert manager.flush() == []
+    assert _read() == [{"nome": "A"}, {"nome": "B"}]
+    assert not manager.is_dirty('templates')
+
+
+def test_external_change_is_not_overwritten(manager):
+    _save([{"nome": "A"}])
+    manager.mark_dirty('templates', [{"nome": "A"}, {"nome": "LOCAL"}])
+    with open(FILENAME, 'w', encoding='utf-8') as f:
+        json.dump([{"nome": "A"}, {"nome": "EXTERNO", "descricao": "outra máquina"}], f)
+
+    assert manager.flush() == ['templates']
+    assert manager.conflicts() == [FILENAME]
+    assert _read()[1]["nome"] == "EXTERNO"
+    assert manager.is_dirty('templates')
+
+    # A recarga mescla e agenda de novo a gravação a partir dos dados mesclados
+    merged = _load_json_file(FILENAME) + [{"nome": "LOCAL"}]
+    manager.mark_dirty('templates', merged)
+    assert manager.flush() == []
+    assert [t["nome"] for t in _read()] == ["A", "EXTERNO", "LOCAL"]
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from validation import BatchValidator, format_errors, parse_brl_value
+
+CLIENTES = [{"codigo": "100", "nome": "CLIENTE UM"}, {"codigo": "200", "nome": "CLIENTE DOIS"}]
+FORNECEDORES = [{"nome": "Fornecedor A", "modelo": "modelo.xlsx"}]
+
+
+def _row(**fields):
+    row = {"data": "01/03/2026", "codigo_cliente": "100", "fornecedor": "FORNECEDOR A",
+           "valor": "10,00", "descricao": "Desconto"}
+    row.update(fields)
+    return row
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1.234,56", 1234.56),
+    ("1234,56", 1234.56),
+    ("R$ 1.234,56", 1234.56),
+    ("R$1,00", 1.0),
+    ("  R$\xa05,00 ", 5.0),
+])
+def test_parse_brl_value_accepts_brazilian_format(text, expected):
+    assert parse_brl_value(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "1.2R34,56", "12$3,45", "1,00 R$", "R$ R$ 1,00", "1 234,56", "10", "1.23,45",
+    "nan", "1e3", "-5,00", "0,00", "",
+])
+def test_parse_brl_value_rejects_other_formats(text):
+    with pytest.raises(ValueError):
+        parse_brl_value(text)
+
+
+def test_validate_collects_every_error_with_its_line():
+    rows = [
+        _row(),
+        _row(data="31/02/2026", valor="1.2R34,56"),
+        _row(codigo_cliente="999"),
+        _row(fornecedor="Outro", descricao=""),
+    ]
+    notes, errors = BatchValidator(CLIENTES, FORNECEDORES).validate(rows, next_invoice=1)
+
+    assert notes == []
+    assert [line for line, _ in errors] == [3, 3, 4, 5, 5]
+    assert "Data inválida '31/02/2026'" in errors[0][1]
+    assert "Valor inválido '1.2R34,56'" in errors[1][1]
+    assert "Cliente '999'" in errors[2][1]
+    assert "Fornecedor 'Outro'" in errors[3][1]
+    assert "Descrição" in errors[4][1]
+
+
+def test_validate_numbers_lines_from_first_line():
+    rows = [_row(), _row(valor="abc")]
+    _, errors = BatchValidator(CLIENTES, FORNECEDORES).validate(rows, next_invoice=1, first_line=10)
+    assert [line for line, _ in errors] == [11]
+    assert format_errors(errors).startswith("Linha 11: Valor inválido")
+
+
+def test_validate_reports_repeated_invoice_with_first_line():
+    rows = [_row(fatura="50"), _row(fatura="50")]
+    _, errors = BatchValidator(CLIENTES, FORNECEDORES).validate(rows, next_invoice=1)
+    assert errors == [(3, "Fatura 50 repetida (já usada na linha 2).")]
+
+
+def test_validate_numbers_rows_without_invoice_skipping_explicit_ones():
+    rows = [_row(), _row(fatura="11"), _row(), _row(codigo_cliente="200")]
+    notes, errors = BatchValidator(CLIENTES, FORNECEDORES).validate(rows, next_invoice=10)
+    assert errors == []
+    assert [(n["linha"], n["fatura"]) for n in notes] == [(2, "10"), (3, "11"), (4, "12"), (5, "13")]
+    assert notes[3]["nome_cliente"] == "CLIENTE DOIS"
+    assert notes[0]["valor"] == 10.0
+
+
+def test_validate_rejects_invoice_already_issued(workdir):
+    (workdir / "notas_emitidas.jsonl").write_text(json.dumps({"fatura": "7", "arquivo": "x.xlsx"}) + "\n")
+    rows = [_row(fatura="7"), _row(fatura="8")]
+    notes, errors = BatchValidator(CLIENTES, FORNECEDORES).validate(rows, next_invoice=1)
+    assert notes == []
+    assert errors == [(2, "Fatura 7 já emitida (consta em notas emitidas).")]
+
+
+def test_format_errors_limits_output():
+    errors = [(line, "erro") for line in range(2, 7)]
+    text = format_errors(errors, limit=2)
+    assert text.splitlines() == ["Linha 2: erro", "Linha 3: erro", "... e mais 3 erro(s)."]
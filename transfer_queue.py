@@ -0,0 +1,248 @@
+"""
+Gravação local com transferência assíncrona para a pasta de saída.
+
+A pasta de saída costuma ficar num compartilhamento de rede lento: salvar a nota
+direto nela bloqueia a geração pela ida e volta inteira da rede, e uma queda de
+conexão deixa .xlsx truncados. Com o spool ativo, a nota é salva numa pasta
+local (SPOOL_FOLDER, com a mesma estrutura de subpastas do destino) e a geração
+retorna na hora; threads em segundo plano copiam cada arquivo para o destino com
+nome temporário + rename (o destino nunca vê um arquivo pela metade), com novas
+tentativas e número limitado de cópias simultâneas.
+
+O que estiver no spool é a própria fila: arquivos não transferidos (programa
+fechado, rede fora) são retomados no próximo start() ou pelo `cli.py transferir`.
+"""
+import heapq
+import os
+import shutil
+import threading
+import time
+
+from backend_data import SAIDA_FOLDER
+
+SPOOL_FOLDER = "spool_notas"
+DEFAULT_TRANSFER_WORKERS = 2
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 1.0 # segundos; dobra a cada falha
+MAX_RETRY_DELAY = 30.0
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def spool_path_for(final_path, spool_folder=SPOOL_FOLDER, destination=SAIDA_FOLDER):
+    """Caminho no spool do arquivo que deve chegar em final_path."""
+    relative = os.path.relpath(final_path, destination)
+    if relative.startswith(os.pardir):
+        relative = os.path.basename(final_path) # fora da pasta de saída: vai para a raiz do spool
+    return os.path.join(spool_folder, relative)
+
+
+class TransferQueue:
+    """Fila de transferência spool -> destino, com threads, novas tentativas e status."""
+
+    def __init__(self, spool_folder=SPOOL_FOLDER, destination=SAIDA_FOLDER, max_workers=DEFAULT_TRANSFER_WORKERS,
+                 max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY, max_retry_delay=MAX_RETRY_DELAY):
+        self.spool_folder = spool_folder
+        self.destination = destination
+        self.max_workers = max(1, max_workers)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._cond = threading.Condition()
+        self._ready = [] # heap (instante_liberado, seq, caminho_local)
+        self._seq = 0
+        self._queued = set() # caminhos na fila (prontos ou aguardando nova tentativa)
+        self._in_progress = set()
+        self._attempts = {} # caminho_local -> falhas consecutivas
+        self.failed = {} # caminho_local -> último erro (tentativas esgotadas)
+        self.transferred = 0
+        self.last_error = None
+        self._threads = []
+        self._stopping = False
+
+    # --- Caminhos ---
+
+    def local_path(self, final_path):
+        return spool_path_for(final_path, self.spool_folder, self.destination)
+
+    def final_path(self, local_path):
+        return os.path.join(self.destination, os.path.relpath(local_path, self.spool_folder))
+
+    def resolve(self, final_path):
+        """Onde o arquivo está agora: a cópia do spool enquanto não for transferido, senão o destino."""
+        local = self.local_path(final_path)
+        return local if os.path.exists(local) else final_path
+
+    # --- Fila ---
+
+    def start(self):
+        """Retoma o que ficou no spool e inicia as threads de transferência."""
+        self.recover()
+        with self._cond:
+            self._stopping = False
+            while len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._run, name=f"transferencia-{len(self._threads) + 1}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def recover(self):
+        """Enfileira os arquivos do spool que ainda não foram transferidos. Retorna quantos."""
+        count = 0
+        if not os.path.isdir(self.spool_folder):
+            return count
+        for root, _, files in os.walk(self.spool_folder):
+            for name in files:
+                if not name.endswith(".tmp"):
+                    count += self.submit(os.path.join(root, name))
+        return count
+
+    def submit(self, local_path):
+        """Agenda a transferência (ignora se já estiver na fila). Retorna True se agendou."""
+        with self._cond:
+            self.failed.pop(local_path, None)
+            if local_path in self._queued:
+                return False
+            self._push(local_path, 0.0)
+            return True
+
+    def _push(self, local_path, ready_at):
+        self._seq += 1
+        heapq.heappush(self._ready, (ready_at, self._seq, local_path))
+        self._queued.add(local_path)
+        self._cond.notify()
+
+    def retry_failed(self):
+        """Recoloca na fila os arquivos cujas tentativas se esgotaram."""
+        with self._cond:
+            failed, self.failed = list(self.failed), {}
+            for local_path in failed:
+                self._attempts.pop(local_path, None)
+                if local_path not in self._queued:
+                    self._push(local_path, 0.0)
+        return len(failed)
+
+    def _next(self):
+        """Próximo arquivo liberado para transferência (None ao parar)."""
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                if self._ready:
+                    ready_at, _, local_path = self._ready[0]
+                    wait = ready_at - time.monotonic()
+                    if wait <= 0:
+                        heapq.heappop(self._ready)
+                        # Um arquivo em cópia não começa outra cópia em paralelo: volta depois
+                        if local_path in self._in_progress:
+                            self._push(local_path, time.monotonic() + self.retry_delay)
+                            continue
+                        self._queued.discard(local_path)
+                        self._in_progress.add(local_path)
+                        return local_path
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        while True:
+            local_path = self._next()
+            if local_path is None:
+                return
+            try:
+                self._transfer(local_path)
+            except Exception as e:
+                self._on_failure(local_path, e)
+            else:
+                with self._cond:
+                    self._attempts.pop(local_path, None)
+                    self.transferred += 1
+            finally:
+                with self._cond:
+                    self._in_progress.discard(local_path)
+                    self._cond.notify_all()
+
+    def _on_failure(self, local_path, error):
+        with self._cond:
+            attempts = self._attempts.get(local_path, 0) + 1
+            self._attempts[local_path] = attempts
+            self.last_error = f"{os.path.basename(local_path)}: {error}"
+            if attempts >= self.max_attempts:
+                self.failed[local_path] = str(error)
+                print(f"Erro ao transferir {local_path} após {attempts} tentativas: {error}")
+            elif local_path not in self._queued:
+                delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+                self._push(local_path, time.monotonic() + delay)
+
+    # --- Cópia ---
+
+    def _transfer(self, local_path):
+        """Copia para o destino (temporário + rename) e remove a cópia local."""
+        if not os.path.exists(local_path):
+            return # já transferido por outra execução (ex.: `cli.py transferir`)
+        st = os.stat(local_path)
+        final = self.final_path(local_path)
+        os.makedirs(os.path.dirname(final) or '.', exist_ok=True)
+        # Temporário exclusivo: o `cli.py transferir` pode rodar junto com o aplicativo
+        tmp_path = f"{final}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            self._copy(local_path, tmp_path)
+            if os.path.getsize(tmp_path) != st.st_size:
+                raise OSError("cópia incompleta no destino")
+            os.replace(tmp_path, final)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        # Se a nota foi regravada durante a cópia, a versão nova fica para a próxima volta
+        current = os.stat(local_path)
+        if (current.st_mtime_ns, current.st_size) == (st.st_mtime_ns, st.st_size):
+            try:
+                os.remove(local_path)
+            except OSError:
+                pass # Aberta por outro programa (ex.: impressão): a cópia, idêntica, sai na próxima retomada
+        else:
+            self.submit(local_path)
+
+    def _copy(self, src, dst):
+        """Cópia em blocos grandes, sincronizada em disco antes do rename."""
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, COPY_BUFFER_SIZE)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+
+    # --- Status e encerramento ---
+
+    def status(self):
+        """Resumo para a interface: pendentes, em_andamento, transferidas, falhas, ultimo_erro."""
+        with self._cond:
+            return {
+                "pendentes": len(self._queued),
+                "em_andamento": len(self._in_progress),
+                "transferidas": self.transferred,
+                "falhas": len(self.failed),
+                "ultimo_erro": self.last_error,
+            }
+
+    def wait_idle(self, timeout=None):
+        """Aguarda a fila esvaziar (arquivos com falha definitiva não contam). Retorna True se esvaziou."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queued or self._in_progress:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self, timeout=None):
+        """
+        Para as threads depois das cópias em andamento. O que ainda estiver na fila
+        continua no spool e é retomado no próximo start().
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
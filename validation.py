@@ -0,0 +1,271 @@
+"""
+Validação de notas de crédito, individual (GUI) ou em lote (milhares de linhas).
+
+O lote inteiro é validado numa única passada, antes de qualquer planilha ser
+aberta: fornecedores e clientes são consultados em mapas pré-montados, e datas e
+valores repetidos são convertidos uma única vez (cache por texto).
+Todos os erros são devolvidos juntos, com o número da linha.
+
+A coluna opcional "chave" é a chave de idempotência da linha (ver idempotency.py):
+linhas cuja chave já foi concluída recebem a fatura já emitida (sem consumir
+numeração nova), e chaves já usadas com outro conteúdo são erro de validação.
+Fora desse caso, uma fatura informada que já consta das notas emitidas é erro.
+
+A descrição pode ter campos por nota ({cliente}, {valor_extenso}...; ver
+description_templates.py), e a coluna opcional "template" usa a descrição de um
+template cadastrado quando a coluna descricao está vazia. Cada texto distinto é
+compilado uma vez por lote e aplicado a cada linha antes da impressão digital.
+"""
+import datetime
+import math
+import re
+
+from backend_data import iter_note_records
+from idempotency import IdempotencyConflict, get_store, request_fingerprint
+from description_templates import compile_template
+
+DATE_PATTERN = re.compile(r'\d{2}/\d{2}/\d{4}')
+# "1.234,56" ou "1234,56" (um prefixo "R$" e os espaços das pontas são descartados antes)
+BRL_PATTERN = re.compile(r'(\d{1,3}(\.\d{3})*|\d+),\d{2}')
+_BRL_PREFIX = re.compile(r'^\s*R\$\s*')
+
+
+def parse_brl_value(text):
+    """
+    Converte valor no formato brasileiro (1.234,56) para float. Levanta ValueError
+    se o formato for outro (ex.: "nan", "1e3", "-5,00") ou se o valor não for positivo.
+    """
+    cleaned = _BRL_PREFIX.sub('', str(text)).strip()
+    if not BRL_PATTERN.fullmatch(cleaned):
+        raise ValueError(f"valor fora do formato 1.234,56: '{text}'")
+    value = float(cleaned.replace('.', '').replace(',', '.'))
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError(f"o valor deve ser positivo: '{text}'")
+    return value
+
+
+def is_valid_date(text):
+    """Indica se o texto está no formato DD/MM/AAAA e é uma data de calendário válida."""
+    if not DATE_PATTERN.fullmatch(text):
+        return False
+    try:
+        datetime.date(int(text[6:10]), int(text[3:5]), int(text[0:2]))
+    except ValueError:
+        return False
+    return True
+
+
+def _normalize_key(text):
+    return " ".join(str(text).split()).upper()
+
+
+class BatchValidator:
+    """
+    Valida lotes contra os cadastros atuais. Os mapas de clientes e fornecedores
+    são montados uma vez no construtor e reaproveitados por todas as linhas.
+    """
+
+    def __init__(self, clientes, fornecedores, templates=()):
+        self._clients = {c['codigo']: c for c in clientes}
+        self._suppliers = {_normalize_key(f['nome']): f for f in fornecedores}
+        self._templates = {_normalize_key(t['nome']): t['descricao'] for t in templates}
+        self._date_cache = {}
+        self._value_cache = {}
+        self._description_cache = {}
+        self._issued = None
+
+    def _is_issued(self, invoice):
+        """Indica se a fatura já consta das notas emitidas (lidas uma vez, só se o lote informar faturas)."""
+        if self._issued is None:
+            self._issued = {str(record.get('fatura')) for record in iter_note_records()}
+        return str(int(invoice)) in self._issued
+
+    def _check_date(self, text):
+        ok = self._date_cache.get(text)
+        if ok is None:
+            ok = self._date_cache[text] = is_valid_date(text)
+        return ok
+
+    def _parse_value(self, text):
+        """Retorna o float do valor, ou None se inválido (com cache por texto)."""
+        if text not in self._value_cache:
+            try:
+                self._value_cache[text] = parse_brl_value(text)
+            except ValueError:
+                self._value_cache[text] = None
+        return self._value_cache[text]
+
+    def _compile_description(self, text):
+        """Retorna (template compilado, erro) com cache por texto."""
+        compiled = self._description_cache.get(text)
+        if compiled is None:
+            try:
+                compiled = self._description_cache[text] = (compile_template(text), None)
+            except ValueError as e:
+                compiled = self._description_cache[text] = (None, f"Descrição inválida: {e}")
+        return compiled
+
+    def _apply_idempotency(self, key, line, invoice, data_input, client, supplier, value_float, description,
+                           keys_seen, explicit_invoices, row_errors):
+        """
+        Confere a chave da linha. Retorna (fatura, concluída): se a chave já foi
+        concluída, a fatura emitida para ela.
+        """
+        if key in keys_seen:
+            row_errors.append(f"Chave '{key}' repetida (já usada na linha {keys_seen[key]}).")
+            return invoice, False
+        keys_seen[key] = line
+        fingerprint = request_fingerprint(data_input, client['codigo'], client['nome'], description, value_float,
+                                          supplier['modelo'], supplier['nome'])
+        try:
+            done = get_store().lookup(key, fingerprint)
+        except IdempotencyConflict as e:
+            row_errors.append(str(e))
+            return invoice, False
+        if done is None or not str(done.get('fatura', '')).isdigit():
+            return invoice, False
+        stored = int(done['fatura'])
+        if invoice and explicit_invoices.get(int(invoice)) == line:
+            del explicit_invoices[int(invoice)] # a fatura já emitida prevalece sobre a informada
+        other = explicit_invoices.get(stored)
+        if other is not None:
+            row_errors.append(f"Fatura {stored}, já emitida para a chave '{key}', repetida na linha {other}.")
+            return invoice, False
+        explicit_invoices[stored] = line
+        return str(stored), True
+
+    def validate(self, rows, next_invoice, first_line=2):
+        """
+        Valida todas as linhas de uma vez.
+
+        rows: lista de dicts com as colunas data, fatura (opcional), codigo_cliente,
+        fornecedor, valor, descricao, template (opcional) e chave (opcional). Linhas sem fatura recebem
+        números sequenciais a partir de next_invoice (e fatura_automatica=True),
+        pulando os números informados no próprio lote e os já emitidos para chaves
+        concluídas. Uma fatura informada
+        que já foi emitida (fora de uma chave concluída) é erro.
+        first_line: número da linha do arquivo correspondente a rows[0].
+
+        Retorna (notas, erros): notas prontas para geração (apenas se não houver
+        erros) e a lista de (linha, mensagem) com todos os problemas encontrados.
+        """
+        errors = []
+        notes = []
+        explicit_invoices = {}
+        keys_seen = {}
+
+        for offset, row in enumerate(rows):
+            line = first_line + offset
+            data_input = (row.get('data') or '').strip()
+            invoice = (row.get('fatura') or '').strip()
+            client_code = (row.get('codigo_cliente') or '').strip()
+            supplier_name = (row.get('fornecedor') or '').strip()
+            value_text = (row.get('valor') or '').strip()
+            description = (row.get('descricao') or '').strip()
+            template_name = (row.get('template') or '').strip()
+            key = (row.get('chave') or '').strip()
+
+            row_errors = []
+            if not self._check_date(data_input):
+                row_errors.append(f"Data inválida '{data_input}'. Use DD/MM/AAAA.")
+
+            if invoice:
+                if not invoice.isdigit() or int(invoice) <= 0:
+                    row_errors.append(f"Número da Fatura '{invoice}' deve ser um inteiro positivo.")
+                elif int(invoice) in explicit_invoices:
+                    row_errors.append(f"Fatura {invoice} repetida (já usada na linha {explicit_invoices[int(invoice)]}).")
+                else:
+                    explicit_invoices[int(invoice)] = line
+
+            client = self._clients.get(client_code)
+            if client is None:
+                row_errors.append(f"Cliente '{client_code}' não cadastrado.")
+
+            supplier = self._suppliers.get(_normalize_key(supplier_name))
+            if supplier is None:
+                row_errors.append(f"Fornecedor '{supplier_name}' não cadastrado.")
+
+            value_float = self._parse_value(value_text)
+            if value_float is None:
+                row_errors.append(f"Valor inválido '{value_text}'. Use um valor positivo no formato 1.234,56.")
+
+            if not description and template_name:
+                description = self._templates.get(_normalize_key(template_name), '')
+                if not description:
+                    row_errors.append(f"Template '{template_name}' não cadastrado.")
+            elif not description:
+                row_errors.append("A Descrição/Histórico é obrigatória.")
+
+            if description:
+                template, template_error = self._compile_description(description)
+                if template_error:
+                    row_errors.append(template_error)
+                elif not row_errors and not template.is_static:
+                    description = template.render({
+                        "nome_cliente": client['nome'], "codigo_cliente": client['codigo'],
+                        "fornecedor": supplier['nome'], "data": data_input, "valor": value_float,
+                    })
+
+            completed = False
+            if key and not row_errors:
+                invoice, completed = self._apply_idempotency(key, line, invoice, data_input, client, supplier,
+                                                             value_float, description, keys_seen,
+                                                             explicit_invoices, row_errors)
+            if invoice and not completed and not row_errors and self._is_issued(invoice):
+                row_errors.append(f"Fatura {invoice} já emitida (consta em notas emitidas).")
+
+            if row_errors:
+                errors.extend((line, msg) for msg in row_errors)
+                continue
+
+            notes.append({
+                "linha": line,
+                "data": data_input,
+                "fatura": invoice,
+                "codigo_cliente": client['codigo'],
+                "nome_cliente": client['nome'],
+                "fornecedor": supplier['nome'],
+                "modelo": supplier['modelo'],
+                "saida": supplier.get('saida', 'individual'),
+                "valor": value_float,
+                "descricao": description,
+            })
+            if key:
+                notes[-1]["chave"] = key
+
+        if errors:
+            return [], errors
+
+        # Numeração automática para as linhas sem fatura
+        for note in notes:
+            if not note['fatura']:
+                note['fatura_automatica'] = True
+        number_invoices(notes, next_invoice)
+        return notes, errors
+
+
+def number_invoices(notes, next_invoice):
+    """
+    Numera as notas marcadas com fatura_automatica em sequência a partir de
+    next_invoice, pulando as faturas informadas no próprio lote. batch.start_journal
+    chama de novo, sob a trava do estado, se outro processo avançou a numeração
+    depois da validação.
+    """
+    explicit = {int(n['fatura']) for n in notes if not n.get('fatura_automatica')}
+    candidate = int(next_invoice)
+    for note in notes:
+        if not note.get('fatura_automatica'):
+            continue
+        while candidate in explicit:
+            candidate += 1
+        note['fatura'] = str(candidate)
+        candidate += 1
+
+
+def format_errors(errors, limit=None):
+    """Formata a lista de (linha, mensagem) para exibição."""
+    shown = errors if limit is None else errors[:limit]
+    text = "\n".join(f"Linha {line}: {msg}" for line, msg in shown)
+    if limit is not None and len(errors) > limit:
+        text += f"\n... e mais {len(errors) - limit} erro(s)."
+    return text